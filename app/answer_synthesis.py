@@ -0,0 +1,156 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain_community.chains.graph_qa.prompts import CYPHER_QA_PROMPT
+from langchain_core.output_parsers import StrOutputParser
+
+from app.context_encoder import encode_context
+from app.tracing import span, metrics
+
+# Single-column results with at most this many distinct values are listed directly
+MAX_LIST_ITEMS = 50
+# Tables with at most this many rows / columns are rendered directly
+MAX_TABLE_ROWS = 20
+MAX_TABLE_COLUMNS = 4
+# Strings longer than this are not "simple" (they usually need to be read and summarized)
+MAX_CELL_CHARS = 200
+# Questions that ask for reasoning over the result always go to the LLM
+LLM_ONLY_KEYWORDS = ("why", "explain", "describe", "summarize", "summarise", "compare", "difference", "average",
+                     "mean", "trend")
+
+SHAPE_SCALAR = "scalar"
+SHAPE_LIST = "list"
+SHAPE_TABLE = "table"
+SHAPE_COMPLEX = "complex"
+
+
+class SynthesizedAnswer:
+    """The answer text, which path produced it ("template" or "llm") and the detected result shape."""
+
+    def __init__(self, text: str, path: str, shape: str, context_encoding: Optional[Dict[str, Any]] = None):
+        self.text = text
+        self.path = path
+        self.shape = shape
+        self.context_encoding = context_encoding
+
+
+def classify_result_shape(rows: List[Dict[str, Any]]) -> str:
+    """
+    Classifies Cypher result rows as:
+        - "scalar": one row with one simple value (e.g. a count, a name, true/false)
+        - "list": one column of simple values (e.g. dataset names, ORCIDs)
+        - "table": a few rows and columns of simple values (e.g. contributor name + ORCID)
+        - "complex": anything else (nested maps, long arrays, long text, large tables)
+    """
+    if not rows:
+        return SHAPE_COMPLEX
+    columns = {key for row in rows for key in row}
+    values = [row.get(column) for row in rows for column in columns]
+    if not all(_is_simple(value) for value in values) or all(value in (None, "") for value in values):
+        return SHAPE_COMPLEX
+    if len(columns) == 1:
+        if len(rows) == 1:
+            return SHAPE_SCALAR
+        if len(_unique([row.get(next(iter(columns))) for row in rows])) <= MAX_LIST_ITEMS:
+            return SHAPE_LIST
+        return SHAPE_COMPLEX
+    if len(rows) <= MAX_TABLE_ROWS and len(columns) <= MAX_TABLE_COLUMNS:
+        return SHAPE_TABLE
+    return SHAPE_COMPLEX
+
+
+def render_template_answer(question: str, rows: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Renders the answer directly from the rows when their shape is simple and the question does not ask for
+    reasoning over them. Returns None when the LLM should write the answer instead.
+    """
+    if set(re.findall(r"[a-z]+", question.lower())) & set(LLM_ONLY_KEYWORDS):
+        return None
+    shape = classify_result_shape(rows)
+    if shape == SHAPE_SCALAR:
+        column, value = next(iter(rows[0].items()))
+        if isinstance(value, bool):
+            return f"{'Yes' if value else 'No'} ({_pretty_column(column)}: {str(value).lower()})."
+        return f"The {_pretty_column(column)} is **{_format_value(value)}**."
+    if shape == SHAPE_LIST:
+        column = next(iter(rows[0]))
+        items = [value for value in _unique([row.get(column) for row in rows]) if value not in (None, "")]
+        lines = [f"Found {len(items)} {_pretty_column(column)} value{'s' if len(items) != 1 else ''}:"]
+        lines.extend(f"- {_format_value(item)}" for item in items)
+        return "\n".join(lines)
+    if shape == SHAPE_TABLE:
+        columns: List[str] = []
+        for row in rows:
+            columns.extend(key for key in row if key not in columns)
+        unique_rows = _unique([tuple(_format_value(row.get(column)) for column in columns) for row in rows])
+        lines = [f"Found {len(unique_rows)} result{'s' if len(unique_rows) != 1 else ''}:", "",
+                 "| " + " | ".join(_pretty_column(column) for column in columns) + " |",
+                 "|" + "---|" * len(columns)]
+        lines.extend("| " + " | ".join(cell.replace("|", "\\|") for cell in row) + " |" for row in unique_rows)
+        return "\n".join(lines)
+    return None
+
+
+async def synthesize_answer(llm, question: str, rows: List[Dict[str, Any]], callbacks: List[Any]) -> SynthesizedAnswer:
+    """
+    Produces the final answer for a non-empty Cypher result. Simple result shapes are rendered with templates
+    (no LLM call); complex or ambiguous ones are encoded (see `app/context_encoder.py`) and answered by the QA LLM.
+
+    Args:
+        llm: Chat model used for the QA step.
+        question (str): The user's question.
+        rows (List[Dict[str, Any]]): The (guarded) Cypher result rows.
+        callbacks (List[Any]): LangChain callbacks for the QA LLM call.
+
+    Returns:
+        SynthesizedAnswer: The answer and which path produced it.
+    """
+    shape = classify_result_shape(rows)
+    with span("qa.answer", shape=shape) as s:
+        template_answer = render_template_answer(question, rows)
+        if template_answer is not None:
+            s.set_attribute("path", "template")
+            metrics.increment("pipeline_answer_path_total", path="template", shape=shape)
+            return SynthesizedAnswer(template_answer, "template", shape)
+
+        encoded = encode_context(rows)
+        s.set_attributes(path="llm", **encoded.to_dict())
+        metrics.increment("pipeline_answer_path_total", path="llm", shape=shape)
+        metrics.increment("pipeline_context_tokens_saved_total", max(encoded.tokens_saved, 0))
+        qa_chain = CYPHER_QA_PROMPT | llm | StrOutputParser()
+        answer = await qa_chain.ainvoke(
+            {"question": question, "context": encoded.text},
+            config={"callbacks": callbacks},
+        )
+        return SynthesizedAnswer(answer, "llm", shape, encoded.to_dict())
+
+
+def _is_simple(value: Any) -> bool:
+    if value is None or isinstance(value, (bool, int, float)):
+        return True
+    if isinstance(value, str):
+        return len(value) <= MAX_CELL_CHARS
+    return False
+
+
+def _unique(values: List[Any]) -> List[Any]:
+    seen = set()
+    result = []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+
+def _pretty_column(column: str) -> str:
+    # `d.name` -> `name`, `contributor_orcid` -> `contributor orcid`
+    return column.split(".")[-1].replace("_", " ")
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
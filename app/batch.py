@@ -0,0 +1,208 @@
+"""
+Batch question API for evaluation and reporting jobs: `process_queries(questions)` answers many questions with the
+setup shared by all of them and streams each response back as soon as its question completes.
+
+Usage (from the repository root):
+    python -m app.batch questions.txt --out answers.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from app.circuit_breaker import CircuitOpenError, get_breaker
+from app.config import Config
+from app.qa_chain import (PreparedSetup, _check_dataguide_version, _fetch_dataguide_paths, _prepare_few_shot_store,
+                          _refresh_schema, arun_query)
+from app.resources import SharedResources
+from app.tracing import metrics, span, write_prometheus_textfile
+
+
+class BatchResult:
+    """
+    One answered question of a batch.
+
+    Attributes:
+        index (int): Position of the question in the submitted list.
+        question (str): The question.
+        response (dict, optional): The response of run_query(), None if the question failed.
+        error (str, optional): Why the question failed.
+        duration (float): Seconds from the start of the question (after waiting for a free slot) to its response.
+    """
+
+    def __init__(self, index: int, question: str, response: Optional[dict] = None, error: Optional[str] = None,
+                 duration: float = 0.0):
+        self.index = index
+        self.question = question
+        self.response = response
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        response = self.response or {}
+        return {
+            "index": self.index,
+            "question": self.question,
+            "result": response.get("result"),
+            "answer_path": response.get("answer_path", "llm" if response else None),
+            "error": self.error,
+            "duration": round(self.duration, 3),
+        }
+
+
+async def _retrieve_batch_examples(resources: SharedResources, questions: List[str]) -> Dict[str, List[str]]:
+    if resources.batch_few_shot_retriever is None:
+        return {}
+    with span("few_shot.retrieve_batch", queries=len(questions)) as s:
+        try:
+            await _prepare_few_shot_store(resources)
+            examples = await get_breaker("vector").acall(
+                resources.batch_few_shot_retriever, graph=resources.graph, user_queries=questions, top_k=5)
+        except Exception as e:
+            # every question falls back to its own retrieval (and from there to the local examples)
+            print(f"Batch few-shot retrieval failed, retrieving per question: {e}")
+            metrics.increment("pipeline_degraded_total", backend="vector",
+                              reason="circuit_open" if isinstance(e, CircuitOpenError) else "error")
+            s.set_attributes(degraded=True, error=str(e))
+            return {}
+    return dict(zip(questions, examples))
+
+
+async def aprepare_batch(questions: List[str], resources: SharedResources) -> PreparedSetup:
+    """
+    Runs the setup shared by a batch once: DataGuide (into the resources' cache), schema refresh and the few-shot
+    retrieval of every distinct question (one batched embedding call and one multi-vector search).
+    """
+    distinct = list(dict.fromkeys(questions))
+    with span("batch.setup", questions=len(distinct)):
+        await _check_dataguide_version(resources)
+        _, _, few_shot_examples = await asyncio.gather(
+            _fetch_dataguide_paths(resources),
+            _refresh_schema(resources),
+            _retrieve_batch_examples(resources, distinct),
+        )
+    return PreparedSetup(few_shot_examples)
+
+
+async def aprocess_queries(questions: List[str], resources: Optional[SharedResources] = None,
+                           concurrency: Optional[int] = None, deadline_seconds: Optional[float] = None,
+                           max_retries: int = 3) -> AsyncIterator[BatchResult]:
+    """
+    Answers a list of questions, yielding each BatchResult as soon as its question completes (not in input order).
+
+    The graph, model clients and caches are set up once for the batch (a fresh SharedResources unless `resources`
+    is given), the setup stages run once (see aprepare_batch()), and at most `concurrency` questions go through
+    Cypher generation at a time. A failing question yields a BatchResult with `error` set; the others go on.
+
+    Args:
+        questions (List[str]): The questions.
+        resources (SharedResources, optional): Shared clients and caches (see `app/resources.py`).
+        concurrency (int, optional): Questions answered at a time. Defaults to Config.BATCH_CONCURRENCY.
+        deadline_seconds (float, optional): Deadline of each question, counted from its start.
+                                            Defaults to Config.QUERY_DEADLINE_SECONDS.
+        max_retries (int, optional): Cypher attempts per question after the first. Defaults to 3.
+
+    Yields:
+        BatchResult: One per question.
+    """
+    resources = resources or SharedResources()
+    semaphore = asyncio.Semaphore(concurrency or Config.BATCH_CONCURRENCY)
+    with span("batch", questions=len(questions)):
+        prepared = await aprepare_batch(questions, resources)
+
+    async def answer(index: int, question: str) -> BatchResult:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await arun_query(question, max_retries, resources, deadline_seconds, prepared)
+            except Exception as e:
+                metrics.increment("pipeline_batch_questions_total", outcome="error")
+                return BatchResult(index, question, error=str(e) or type(e).__name__,
+                                   duration=time.perf_counter() - start)
+            metrics.increment("pipeline_batch_questions_total", outcome="answered")
+            return BatchResult(index, question, response, duration=time.perf_counter() - start)
+
+    tasks = [asyncio.create_task(answer(index, question)) for index, question in enumerate(questions)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # the consumer stopped early: do not leave questions running
+        for task in tasks:
+            task.cancel()
+
+
+def process_queries(questions: List[str], resources: Optional[SharedResources] = None,
+                    concurrency: Optional[int] = None, deadline_seconds: Optional[float] = None,
+                    max_retries: int = 3) -> Iterator[BatchResult]:
+    """
+    Synchronous version of aprocess_queries(): the batch runs on an event loop in a worker thread and results are
+    yielded to the caller as they complete.
+    """
+    results: "queue.Queue[Any]" = queue.Queue()
+    finished = object()
+
+    async def drain() -> None:
+        async for result in aprocess_queries(questions, resources, concurrency, deadline_seconds, max_retries):
+            results.put(result)
+
+    def run() -> None:
+        try:
+            asyncio.run(drain())
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(finished)
+
+    threading.Thread(target=run, name="process-queries", daemon=True).start()
+    while True:
+        item = results.get()
+        if item is finished:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _read_questions(path: str) -> List[str]:
+    """A JSON list of questions, or one question per line."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return [str(question) for question in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Answer a file of questions as one batch.")
+    parser.add_argument("questions", help="JSON list of questions or a text file with one question per line")
+    parser.add_argument("--out", required=True, help="JSON lines file, one line per question as it completes")
+    parser.add_argument("--concurrency", type=int, default=Config.BATCH_CONCURRENCY)
+    parser.add_argument("--deadline", type=float, help="seconds per question (default QUERY_DEADLINE_SECONDS)")
+    args = parser.parse_args(argv)
+
+    questions = _read_questions(args.questions)
+    failed = 0
+    start = time.perf_counter()
+    try:
+        with open(args.out, "w", encoding="utf-8") as out:
+            for result in process_queries(questions, concurrency=args.concurrency, deadline_seconds=args.deadline):
+                failed += not result.ok
+                out.write(json.dumps(result.to_dict()) + "\n")
+                out.flush()
+    finally:
+        write_prometheus_textfile()
+    print(f"{len(questions)} questions in {time.perf_counter() - start:.1f}s, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
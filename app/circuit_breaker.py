@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.config import Config
+from app.tracing import metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Value of the circuit_breaker_state gauge per state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend that keeps failing or has become slow, so requests fail (or degrade) immediately
+    instead of each waiting for their own timeout.
+
+    The breaker looks at the last `window` calls. A call counts as bad if it failed or took longer than
+    `slow_call_seconds`. Once at least `min_calls` were seen and the share of bad calls reaches `failure_rate`,
+    the breaker opens: allow() returns False for `open_seconds`. After that one trial call is let through
+    (half-open); it closes the breaker if it is good and re-opens it otherwise.
+
+    The state is exported as the `circuit_breaker_state{backend}` gauge (0 closed, 1 half-open, 2 open) and every
+    transition is counted in `circuit_breaker_transitions_total{backend, state}`. Thread-safe.
+
+    Args:
+        name (str): Backend name used in metrics and errors ("vector", "neo4j", "llm.<model>").
+        slow_call_seconds (float): Calls slower than this count as bad.
+        window (int, optional): Defaults to Config.BREAKER_WINDOW.
+        min_calls (int, optional): Defaults to Config.BREAKER_MIN_CALLS.
+        failure_rate (float, optional): Defaults to Config.BREAKER_FAILURE_RATE.
+        open_seconds (float, optional): Defaults to Config.BREAKER_OPEN_SECONDS.
+    """
+
+    def __init__(self, name: str, slow_call_seconds: float, window: Optional[int] = None,
+                 min_calls: Optional[int] = None, failure_rate: Optional[float] = None,
+                 open_seconds: Optional[float] = None):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls or Config.BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or Config.BREAKER_FAILURE_RATE
+        self.open_seconds = open_seconds or Config.BREAKER_OPEN_SECONDS
+        self._outcomes: Deque[bool] = deque(maxlen=window or Config.BREAKER_WINDOW)  # True = bad call
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_started = 0.0
+        metrics.set_gauge("circuit_breaker_state", STATE_VALUES[CLOSED], backend=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may be made now. In half-open state only one trial call is allowed at a time."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            # a trial whose outcome was never recorded (e.g. a cancelled call) expires after open_seconds
+            if self._trial_started and time.monotonic() - self._trial_started < self.open_seconds:
+                return False
+            self._trial_started = time.monotonic()
+            return True
+
+    def check(self) -> None:
+        """Raises CircuitOpenError if no call may be made now."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def record(self, duration: Optional[float], ok: bool) -> None:
+        """
+        Records the outcome of a call made after allow()/check(). A None `duration` is not checked against
+        `slow_call_seconds` (e.g. a query stopped by its own timeout says nothing about the backend's speed).
+        """
+        bad = not ok or (duration is not None and duration > self.slow_call_seconds)
+        if bad:
+            metrics.increment("circuit_breaker_bad_calls_total", backend=self.name,
+                              reason="error" if not ok else "slow")
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_started = 0.0
+                self._outcomes.clear()
+                if bad:
+                    self._open()
+                else:
+                    self._transition(CLOSED)
+                return
+            self._outcomes.append(bad)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def call(self, fn: Callable[..., Any], *args: Any, is_failure: Callable[[BaseException], bool] = None,
+             **kwargs: Any) -> Any:
+        """
+        Calls `fn` through the breaker. Exceptions for which `is_failure` returns False are the caller's errors: they
+        count as good calls whatever their duration.
+        """
+        self.check()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            if is_failure is not None and not is_failure(e):
+                self.record(None, ok=True)
+            else:
+                self.record(time.perf_counter() - start, ok=False)
+            raise
+        self.record(time.perf_counter() - start, ok=True)
+        return result
+
+    async def acall(self, fn: Callable[..., Any], *args: Any,
+                    measured: Callable[[Any], Optional[bool]] = None, **kwargs: Any) -> Any:
+        """
+        Async version of call() for coroutine functions. A cancelled call (e.g. by the request deadline) is not
+        recorded: the caller gave up, the backend did not fail.
+
+        `measured(result)` tells how a successful call is recorded: True (the default) checks its duration, False
+        counts it as good whatever its duration (e.g. a first-use collection fill), None does not record it (it never
+        reached the backend) and lets the next call be the half-open trial.
+        """
+        self.check()
+        start = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            self.record(time.perf_counter() - start, ok=False)
+            raise
+        timed = True if measured is None else measured(result)
+        if timed is None:
+            self.release()
+        else:
+            self.record(time.perf_counter() - start if timed else None, ok=True)
+        return result
+
+    def release(self) -> None:
+        """Gives back a call allowed by allow()/check() without recording an outcome."""
+        with self._lock:
+            self._trial_started = 0.0
+
+    def _open(self) -> None:
+        # caller holds the lock
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+        print(f"Circuit breaker '{self.name}' opened for {self.open_seconds:.0f}s")
+
+    def _transition(self, state: str) -> None:
+        # caller holds the lock
+        self._state = state
+        metrics.set_gauge("circuit_breaker_state", STATE_VALUES[state], backend=self.name)
+        metrics.increment("circuit_breaker_transitions_total", backend=self.name, state=state)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    The process-wide breaker of a backend, created on first use. Slow-call thresholds come from
+    Config.BREAKER_SLOW_VECTOR_SECONDS, BREAKER_SLOW_NEO4J_SECONDS and BREAKER_SLOW_LLM_SECONDS ("llm.*" names).
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            if name == "vector":
+                slow = Config.BREAKER_SLOW_VECTOR_SECONDS
+            elif name == "neo4j":
+                slow = Config.BREAKER_SLOW_NEO4J_SECONDS
+            else:
+                slow = Config.BREAKER_SLOW_LLM_SECONDS
+            breaker = _breakers[name] = CircuitBreaker(name, slow)
+        return breaker
+
+
+def breaker_states() -> Dict[str, str]:
+    """Current state of every breaker created so far, e.g. {"vector": "open", "neo4j": "closed"}."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
@@ -8,3 +8,104 @@ class Config:
     NEO4J_URI = os.getenv('NEO4J_URI')
     NEO4J_USERNAME = os.getenv('NEO4J_USERNAME')
     NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD')
+
+    # Tracing / metrics (see app/tracing.py). JSON span logs are off by default: every span is appended synchronously,
+    # so set TRACE_LOG_PATH (e.g. pipeline_traces.jsonl) only while investigating.
+    TRACE_LOG_PATH = os.getenv('TRACE_LOG_PATH', '')
+    METRICS_TEXTFILE_PATH = os.getenv('METRICS_TEXTFILE_PATH', '')
+    # Prefix generated Cypher with PROFILE to record DB hits on each execution span (adds some server overhead).
+    TRACE_PROFILE_CYPHER = os.getenv('TRACE_PROFILE_CYPHER', 'false').lower() == 'true'
+
+    # Query execution (see app/query_executor.py)
+    QUERY_MAX_CONCURRENCY = int(os.getenv('QUERY_MAX_CONCURRENCY', '4'))
+    QUERY_MAX_QUEUE = int(os.getenv('QUERY_MAX_QUEUE', '64'))
+    # Questions of a process_queries() batch answered concurrently (see app/batch.py)
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+    DATAGUIDE_CACHE_TTL_SECONDS = float(os.getenv('DATAGUIDE_CACHE_TTL_SECONDS', '300'))
+    SCHEMA_CACHE_TTL_SECONDS = float(os.getenv('SCHEMA_CACHE_TTL_SECONDS', '300'))
+    # Seconds between checks of the DataGuide version (see app/dataguide_builder.py); a new version drops the
+    # DataGuide, schema and dataset-name caches before their TTL. 0 checks before every question.
+    DATAGUIDE_VERSION_CHECK_SECONDS = float(os.getenv('DATAGUIDE_VERSION_CHECK_SECONDS', '30'))
+    # Per-request deadline (see app/deadline.py); 0 disables it. Another Cypher attempt is started only if at least
+    # QUERY_MIN_ATTEMPT_SECONDS (or the average duration of the previous attempts) is left.
+    QUERY_DEADLINE_SECONDS = float(os.getenv('QUERY_DEADLINE_SECONDS', '90'))
+    QUERY_MIN_ATTEMPT_SECONDS = float(os.getenv('QUERY_MIN_ATTEMPT_SECONDS', '10'))
+    # Client-side timeout of a single chat model request
+    LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv('LLM_REQUEST_TIMEOUT_SECONDS', '60'))
+
+    # Circuit breakers (see app/circuit_breaker.py): a backend is skipped for BREAKER_OPEN_SECONDS once at least
+    # BREAKER_FAILURE_RATE of its last BREAKER_WINDOW calls (and BREAKER_MIN_CALLS or more) failed or were slow.
+    BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '10'))
+    BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+    BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+    BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+    BREAKER_SLOW_VECTOR_SECONDS = float(os.getenv('BREAKER_SLOW_VECTOR_SECONDS', '5'))
+    BREAKER_SLOW_NEO4J_SECONDS = float(os.getenv('BREAKER_SLOW_NEO4J_SECONDS', '20'))
+    BREAKER_SLOW_LLM_SECONDS = float(os.getenv('BREAKER_SLOW_LLM_SECONDS', '60'))
+    # Hybrid few-shot retrieval (see paths_vectorDB/keyword_index.py): the best HYBRID_CANDIDATES vector and BM25
+    # hits are merged by reciprocal rank fusion. The keyword index of a collection is rebuilt after inserts or
+    # every KEYWORD_INDEX_TTL_SECONDS.
+    HYBRID_SEARCH_ENABLED = os.getenv('HYBRID_SEARCH_ENABLED', 'true').lower() == 'true'
+    HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+    HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+    KEYWORD_INDEX_TTL_SECONDS = float(os.getenv('KEYWORD_INDEX_TTL_SECONDS', '300'))
+
+    # ANN index of the few-shot collections (see paths_vectorDB/vector_index.py): FLAT, IVF_FLAT, IVF_SQ8, HNSW or
+    # AUTO (FLAT up to VECTOR_INDEX_AUTO_FLAT_MAX vectors, HNSW above). Build/search parameters are JSON objects
+    # (e.g. {"nlist": 64}, {"nprobe": 8, "ef": 128}); VECTOR_INDEX_OVERRIDES sets them per collection, e.g.
+    # {"default": {"index_type": "IVF_FLAT", "params": {"nlist": 16}, "search_params": {"nprobe": 4}}}
+    VECTOR_INDEX_TYPE = os.getenv('VECTOR_INDEX_TYPE', 'AUTO')
+    VECTOR_INDEX_PARAMS = os.getenv('VECTOR_INDEX_PARAMS', '')
+    VECTOR_SEARCH_PARAMS = os.getenv('VECTOR_SEARCH_PARAMS', '')
+    VECTOR_INDEX_OVERRIDES = os.getenv('VECTOR_INDEX_OVERRIDES', '')
+    VECTOR_INDEX_AUTO_FLAT_MAX = int(os.getenv('VECTOR_INDEX_AUTO_FLAT_MAX', '20000'))
+    # First-pass search on quantized codes (see paths_vectorDB/quantization.py): none, int8 (IVF_SQ8 index) or binary
+    # (sign bits, set when a collection is created); VECTOR_RERANK_FACTOR times the needed candidates are re-ranked
+    # with the full-precision vectors.
+    VECTOR_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION', 'none')
+    VECTOR_RERANK_FACTOR = int(os.getenv('VECTOR_RERANK_FACTOR', '4'))
+    # New collections are tagged with the dataset (partition key, spread over VECTOR_DATASET_PARTITIONS partitions) and
+    # file type of each path; a question naming a dataset is searched within it (see paths_vectorDB/partitions.py)
+    VECTOR_PARTITION_BY_DATASET = os.getenv('VECTOR_PARTITION_BY_DATASET', 'true').lower() == 'true'
+    VECTOR_DATASET_PARTITIONS = int(os.getenv('VECTOR_DATASET_PARTITIONS', '64'))
+    # Embedder of the few-shot examples and questions (see paths_vectorDB/embedders.py): openai (the embeddings API) or
+    # local (CPU-only hashed n-grams, offline). A collection is only searched with the embedder that filled it.
+    EMBEDDER = os.getenv('EMBEDDER', 'openai')
+    # Query embeddings kept per process (repeated and warmed-up questions skip the embeddings API); 0 disables
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+    # Seconds a collection found running, filled and indexed is searched without checking it again
+    VECTOR_COLLECTION_CHECK_SECONDS = float(os.getenv('VECTOR_COLLECTION_CHECK_SECONDS', '300'))
+
+    # Paths/descriptions used as few-shot examples while the vector store is unavailable
+    FEW_SHOT_FALLBACK_FILE = os.getenv('FEW_SHOT_FALLBACK_FILE', 'app/vectordb_paths_descriptions.txt')
+    # Stale few-shot examples (see paths_vectorDB/stale_paths.py): the service and the Streamlit app check the stored
+    # paths against the graph every FEW_SHOT_VERIFY_INTERVAL_SECONDS (0 disables it), FEW_SHOT_VERIFY_BATCH_SIZE paths
+    # per query, and flag, delete or refresh (replace) the ones that no longer exist.
+    FEW_SHOT_VERIFY_INTERVAL_SECONDS = float(os.getenv('FEW_SHOT_VERIFY_INTERVAL_SECONDS', '0'))
+    FEW_SHOT_VERIFY_BATCH_SIZE = int(os.getenv('FEW_SHOT_VERIFY_BATCH_SIZE', '50'))
+    FEW_SHOT_STALE_ACTION = os.getenv('FEW_SHOT_STALE_ACTION', 'flag')
+
+    # Query service (see app/service.py). With QUERY_SERVICE_URL set, the Streamlit app sends questions to a running
+    # service instead of answering them in its own process.
+    QUERY_SERVICE_HOST = os.getenv('QUERY_SERVICE_HOST', '0.0.0.0')
+    QUERY_SERVICE_PORT = int(os.getenv('QUERY_SERVICE_PORT', '8080'))
+    QUERY_SERVICE_URL = os.getenv('QUERY_SERVICE_URL', '')
+
+    # Cypher result size guard (see app/result_guard.py)
+    RESULT_MAX_ROWS = int(os.getenv('RESULT_MAX_ROWS', '1000'))
+    RESULT_MAX_BYTES = int(os.getenv('RESULT_MAX_BYTES', str(2 * 1024 * 1024)))
+    RESULT_COUNT_LIMIT = int(os.getenv('RESULT_COUNT_LIMIT', '100000'))
+    # Token budget of the encoded context handed to the answer LLM (see app/context_encoder.py)
+    QA_CONTEXT_TOKEN_BUDGET = int(os.getenv('QA_CONTEXT_TOKEN_BUDGET', '2000'))
+
+    # Chat model ladders, fastest first (see app/model_tiers.py). Later models are used only after a failed attempt.
+    CYPHER_MODEL_LADDER = os.getenv('CYPHER_MODEL_LADDER', 'gpt-4o-mini,o1-mini-2024-09-12')
+    DESCRIPTION_MODEL_LADDER = os.getenv('DESCRIPTION_MODEL_LADDER', 'gpt-4o-mini,o1-mini-2024-09-12')
+
+    # Intent router answering common question classes with pre-written Cypher (see app/intent_router.py)
+    ROUTER_ENABLED = os.getenv('ROUTER_ENABLED', 'true').lower() == 'true'
+    ROUTER_MIN_CONFIDENCE = float(os.getenv('ROUTER_MIN_CONFIDENCE', '0.7'))
+
+    # EDF signal arrays materialized as memory-mapped NumPy files (see app/signal_store.py)
+    SIGNAL_STORE_DIR = os.getenv('SIGNAL_STORE_DIR', 'signal_store')
+    SIGNAL_STORE_ENABLED = os.getenv('SIGNAL_STORE_ENABLED', 'true').lower() == 'true'
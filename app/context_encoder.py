@@ -0,0 +1,195 @@
+import json
+import math
+from typing import Any, Dict, List, Optional
+
+from app.config import Config
+
+# Numeric lists longer than this are summarized inside their cell
+MAX_INLINE_NUMBERS = 8
+# Numeric array columns with more rows than this are summarized once instead of being repeated on every row, when
+# the full table does not fit the token budget
+NUMERIC_COLUMN_SUMMARY_THRESHOLD = 20
+# Number of values shown in the `sample` of a numeric summary
+SUMMARY_SAMPLE_SIZE = 5
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with tiktoken's o200k_base encoding (used by the o1 models). Falls back to the usual ~4 characters
+    per token estimate when tiktoken or its encoding files are not available (e.g. offline).
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+class EncodedContext:
+    """Compact text handed to the answer LLM, plus how it was produced."""
+
+    def __init__(self, text: str, raw_tokens: int, tokens: int, rows_in: int, unique_rows: int, rows_included: int,
+                 summarized_columns: List[str]):
+        self.text = text
+        self.raw_tokens = raw_tokens  # tokens of str(rows), i.e. what the QA prompt used to receive
+        self.tokens = tokens
+        self.rows_in = rows_in
+        self.unique_rows = unique_rows
+        self.rows_included = rows_included
+        self.summarized_columns = summarized_columns
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "raw_tokens": self.raw_tokens,
+            "tokens": self.tokens,
+            "tokens_saved": self.tokens_saved,
+            "rows_in": self.rows_in,
+            "unique_rows": self.unique_rows,
+            "rows_included": self.rows_included,
+            "summarized_columns": self.summarized_columns,
+        }
+
+
+def encode_context(rows: List[Dict[str, Any]], token_budget: Optional[int] = None) -> EncodedContext:
+    """
+    Encodes Cypher result rows for the answer LLM in a compact table form instead of a list of dicts:
+
+    - the column names are written once as a header, followed by one `|`-separated line per row;
+    - identical rows are written once, with a `count` column when duplicates exist;
+    - numeric lists longer than MAX_INLINE_NUMBERS are replaced by `count/min/max/mean/sample` in their cell;
+    - when the full table would exceed `token_budget`, columns of such lists with more than
+      NUMERIC_COLUMN_SUMMARY_THRESHOLD rows are summarized once below the table (scalar columns always stay inline,
+      so e.g. "which dataset has the most files" can still be answered);
+    - rows are added until `token_budget` is reached, and the number of omitted rows is stated.
+
+    Args:
+        rows (List[Dict[str, Any]]): Rows as returned by Neo4jGraph.query().
+        token_budget (int, optional): Maximum tokens of the encoded text. Defaults to Config.QA_CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        EncodedContext: The encoded text and token accounting.
+    """
+    token_budget = token_budget or Config.QA_CONTEXT_TOKEN_BUDGET
+    raw_tokens = count_tokens(str(rows))
+
+    columns: List[str] = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    # deduplicate, keeping first-seen order
+    unique: Dict[str, List[Any]] = {}
+    for row in rows:
+        key = json.dumps(row, sort_keys=True, default=str)
+        if key in unique:
+            unique[key][1] += 1
+        else:
+            unique[key] = [row, 1]
+    unique_rows = list(unique.values())
+    has_duplicates = len(unique_rows) < len(rows)
+
+    summarized_columns: List[str] = []
+    if len(unique_rows) > NUMERIC_COLUMN_SUMMARY_THRESHOLD:
+        full_table = "\n".join(_row_line(row, count, columns, has_duplicates) for row, count in unique_rows)
+        if count_tokens(full_table) > token_budget:
+            summarized_columns = [column for column in columns
+                                  if _is_long_array_column([row.get(column) for row, _ in unique_rows])]
+    table_columns = [column for column in columns if column not in summarized_columns]
+
+    lines: List[str] = []
+    summary_lines = [f"{column}: {_summarize_numbers(_flatten_numbers([row.get(column) for row, _ in unique_rows]))}"
+                     for column in summarized_columns]
+    footer = ""
+    if summary_lines:
+        footer = "column summaries:\n" + "\n".join(summary_lines)
+
+    rows_included = 0
+    if table_columns:
+        header = " | ".join(table_columns + (["count"] if has_duplicates else []))
+        lines.append(f"rows: {len(rows)} ({len(unique_rows)} unique)")
+        lines.append(header)
+        used_tokens = count_tokens("\n".join(lines) + "\n" + footer)
+        for row, count in unique_rows:
+            line = _row_line(row, count, table_columns, has_duplicates)
+            line_tokens = count_tokens(line) + 1
+            if used_tokens + line_tokens > token_budget:
+                break
+            lines.append(line)
+            used_tokens += line_tokens
+            rows_included += 1
+        if rows_included < len(unique_rows):
+            lines.append(f"... {len(unique_rows) - rows_included} more unique rows omitted")
+    else:
+        lines.append(f"rows: {len(rows)} ({len(unique_rows)} unique)")
+    if footer:
+        lines.append(footer)
+
+    text = "\n".join(lines)
+    return EncodedContext(text=text, raw_tokens=raw_tokens, tokens=count_tokens(text), rows_in=len(rows),
+                          unique_rows=len(unique_rows), rows_included=rows_included,
+                          summarized_columns=summarized_columns)
+
+
+def _row_line(row: Dict[str, Any], count: int, columns: List[str], has_duplicates: bool) -> str:
+    cells = [_format_cell(row.get(column)) for column in columns]
+    if has_duplicates:
+        cells.append(str(count))
+    return " | ".join(cells)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_long_array_column(values: List[Any]) -> bool:
+    """A column of numeric lists, at least one of them too long to be written inline."""
+    present = [v for v in values if v is not None]
+    return (bool(present) and all(isinstance(v, list) and all(_is_number(x) for x in v) for v in present)
+            and any(len(v) > MAX_INLINE_NUMBERS for v in present))
+
+
+def _flatten_numbers(values: List[Any]) -> List[float]:
+    numbers: List[float] = []
+    for value in values:
+        if isinstance(value, list):
+            numbers.extend(value)
+        elif value is not None:
+            numbers.append(value)
+    return numbers
+
+
+def _format_number(value: float) -> str:
+    return format(value, ".6g") if isinstance(value, float) else str(value)
+
+
+def _summarize_numbers(numbers: List[float]) -> str:
+    step = max(1, len(numbers) // SUMMARY_SAMPLE_SIZE)
+    sample = ", ".join(_format_number(v) for v in numbers[::step][:SUMMARY_SAMPLE_SIZE])
+    return (f"count={len(numbers)}, min={_format_number(min(numbers))}, max={_format_number(max(numbers))}, "
+            f"mean={_format_number(sum(numbers) / len(numbers))}, sample=[{sample}]")
+
+
+def _format_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list) and len(value) > MAX_INLINE_NUMBERS and all(_is_number(v) for v in value):
+        return f"[{_summarize_numbers(value)}]"
+    if _is_number(value):
+        return _format_number(value)
+    if isinstance(value, str):
+        text = value
+    else:
+        text = json.dumps(value, default=str, separators=(",", ":"))
+    return text.replace("\n", " ").replace("|", "\\|")
@@ -1,10 +1,115 @@
+from typing import Any, Dict, List, Optional, Tuple
+
 from langchain_community.graphs import Neo4jGraph
+from langchain_community.graphs.neo4j_graph import value_sanitize
+
+from app.circuit_breaker import get_breaker
 from app.config import Config
+from app.deadline import current_deadline, remaining_seconds
+from app.result_guard import ResultGuard, active_result_guard
+from app.tracing import span
+
+
+class TracedNeo4jGraph(Neo4jGraph):
+    """
+    Neo4jGraph that records every query as a `neo4j.query` span with its row count. When
+    Config.TRACE_PROFILE_CYPHER is enabled, queries are run with PROFILE and the total DB hits are recorded too.
+    Inside a `result_guard()` block (see `app/result_guard.py`), rows are streamed from the driver and collection
+    stops at the guard's row/byte cap instead of materializing the whole result.
+    Under a request deadline (see `app/deadline.py`), a query is not started once the deadline has passed and
+    otherwise runs with the remaining time as its transaction timeout, so the server stops it when time is up.
+    Queries go through the `neo4j` circuit breaker (see `app/circuit_breaker.py`): once the database is down or
+    consistently slow, queries fail immediately with CircuitOpenError. Cypher errors do not count against it.
+    """
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check("neo4j.query")
+        return get_breaker("neo4j").call(self._traced_query, query, params, is_failure=_is_neo4j_outage)
+
+    def _traced_query(self, query: str, params: dict) -> List[Dict[str, Any]]:
+        timeout = remaining_seconds(self.timeout)
+        with span("neo4j.query", query=query[:500]) as s:
+            profile = Config.TRACE_PROFILE_CYPHER and not query.lstrip().upper().startswith(("PROFILE", "EXPLAIN"))
+            guard = active_result_guard()
+            db_hits = None
+            if timeout is not None:
+                s.set_attribute("timeout", round(timeout, 3))
+            if guard is not None:
+                rows, db_hits = self._guarded_query(query, params, guard, profile, timeout)
+                s.set_attributes(total_rows=guard.stats.total_rows, truncated=guard.stats.truncated)
+            elif profile or timeout != self.timeout:
+                rows, db_hits = self._executed_query(query, params, profile, timeout)
+            else:
+                rows = super().query(query, params)
+            if db_hits is not None:
+                s.set_attribute("db_hits", db_hits)
+            s.set_attribute("rows", len(rows))
+            return rows
+
+    def _guarded_query(self, query: str, params: dict, guard: ResultGuard, profile: bool,
+                       timeout: Optional[float]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        from neo4j import Query
+
+        text = f"PROFILE {query}" if profile else query
+        with self._driver.session(database=self._database) as session:
+            result = session.run(Query(text=text, timeout=timeout), params)
+            rows = guard.consume(result, sanitize=value_sanitize if self.sanitize else None)
+            # discard whatever was not read so the server stops producing rows
+            summary = result.consume()
+        return rows, _sum_db_hits(summary.profile or {}) if profile else None
+
+    def _executed_query(self, query: str, params: dict, profile: bool,
+                        timeout: Optional[float]) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        from neo4j import Query
+
+        records, summary, _ = self._driver.execute_query(
+            Query(text=f"PROFILE {query}" if profile else query, timeout=timeout),
+            database_=self._database,
+            parameters_=params,
+        )
+        json_data = [r.data() for r in records]
+        if self.sanitize:
+            json_data = [value_sanitize(el) for el in json_data]
+        return json_data, _sum_db_hits(summary.profile or {}) if profile else None
+
+
+def _is_neo4j_outage(error: BaseException) -> bool:
+    """
+    Whether a query error says the database is unavailable or overloaded (as opposed to a bad query, which is the
+    LLM's fault and must not open the breaker).
+    """
+    from neo4j.exceptions import DriverError, ServiceUnavailable, SessionExpired, TransientError
+
+    code = getattr(error, "code", None) or ""
+    # queries run with the request's remaining time as their transaction timeout (see _executed_query()): one stopped
+    # by it ran too long for its own deadline, like a bad query, and says nothing about the database
+    if "TransactionTimedOut" in code or "Transaction.Terminated" in code:
+        return False
+    return isinstance(error, (ServiceUnavailable, SessionExpired, TransientError, DriverError, OSError))
+
+
+def _sum_db_hits(profile: Dict[str, Any]) -> int:
+    """Sums dbHits over a PROFILE plan tree."""
+    return profile.get("dbHits", 0) + sum(_sum_db_hits(child) for child in profile.get("children", []))
+
+
+def setup_neo4j_graph(refresh_schema: bool = True):
+    with span("graph.connect"):
+        return TracedNeo4jGraph(
+            url=Config.NEO4J_URI,
+            username=Config.NEO4J_USERNAME,
+            password=Config.NEO4J_PASSWORD,
+            refresh_schema=refresh_schema
+        )
+
 
+def setup_async_neo4j_driver():
+    """
+    Creates an async Neo4j driver for read queries that are awaited directly (e.g. DataGuide extraction).
+    The caller is responsible for closing it with `await driver.close()`.
+    """
+    from neo4j import AsyncGraphDatabase
 
-def setup_neo4j_graph():
-    return Neo4jGraph(
-        url=Config.NEO4J_URI,
-        username=Config.NEO4J_USERNAME,
-        password=Config.NEO4J_PASSWORD
-    )
+    return AsyncGraphDatabase.driver(Config.NEO4J_URI, auth=(Config.NEO4J_USERNAME, Config.NEO4J_PASSWORD))
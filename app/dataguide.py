@@ -1,17 +1,39 @@
-from typing import List, Dict, Any
-from langchain_community.graphs import Neo4jGraph
+import threading
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 
+if TYPE_CHECKING:
+    from langchain_community.graphs import Neo4jGraph
+    from neo4j import AsyncDriver
 
-def extract_dataguide_paths(graph: Neo4jGraph) -> List[Dict[str, Any]]:
-    query = """
+
+DATAGUIDE_PATHS_QUERY = """
     MATCH path = (root:DataGuide:Root)-[*]->(leaf:DataGuide)
     WHERE NOT (leaf)-->()
     RETURN path
     """
-    results = graph.query(query)
+# Incremented by app/dataguide_builder.py whenever the DataGuide changes
+DATAGUIDE_VERSION_QUERY = "MATCH (root:DataGuide:Root) RETURN root.version AS version LIMIT 1"
+
+
+def extract_dataguide_paths(graph: "Neo4jGraph") -> List[Dict[str, Any]]:
+    results = graph.query(DATAGUIDE_PATHS_QUERY)
     return results
 
 
+async def aextract_dataguide_paths(driver: "AsyncDriver") -> List[Dict[str, Any]]:
+    """Same as extract_dataguide_paths() but awaits the query on an async Neo4j driver."""
+    records, _, _ = await driver.execute_query(DATAGUIDE_PATHS_QUERY)
+    # record.data() gives the same [node dict, rel type, node dict, ...] path shape as Neo4jGraph.query()
+    return [record.data() for record in records]
+
+
+def dataguide_version(graph: "Neo4jGraph") -> Optional[int]:
+    """The DataGuide version, or None if the DataGuide was not built by app/dataguide_builder.py."""
+    results = graph.query(DATAGUIDE_VERSION_QUERY)
+    return results[0].get("version") if results else None
+
+
 def format_paths_for_llm(results: List[Dict[str, Any]]) -> List[str]:
     formatted_paths = []
     for record in results:
@@ -25,3 +47,35 @@ def format_paths_for_llm(results: List[Dict[str, Any]]) -> List[str]:
                     path_elements.append(f"-[:{rel}]->()")
         formatted_paths.append("".join(path_elements))
     return formatted_paths
+
+
+class DataGuideCache:
+    """
+    Process-wide cache of the formatted DataGuide paths (the output of format_paths_for_llm joined by newlines).
+    The DataGuide changes only when data is ingested, so queries can share one copy for `ttl_seconds`. Thread-safe.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._value: Optional[str] = None
+        self._stored_at = 0.0
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self._ttl_seconds
+
+    def get(self) -> Optional[str]:
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._stored_at < self._ttl_seconds:
+                return self._value
+            return None
+
+    def set(self, formatted_paths: str) -> None:
+        with self._lock:
+            self._value = formatted_paths
+            self._stored_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
@@ -0,0 +1,276 @@
+"""
+Builds and maintains the :DataGuide summary read by extract_dataguide_paths() (see `app/dataguide.py`).
+
+The DataGuide is a trie of :DataGuide nodes: the :DataGuide:Root node stands for :Pennsieve, and every distinct
+sequence of relationship types leaving :Pennsieve has one :DataGuide node, reached from its parent's node by a
+relationship of the sequence's last type. Each node stores its sequence as a JSON list in `path` (indexed), so writes
+are idempotent MERGEs and an update can tell which branches already exist. The root carries a `version` counter,
+incremented by every change so that running apps drop their DataGuide, schema and dataset-name caches (see
+Config.DATAGUIDE_VERSION_CHECK_SECONDS).
+
+- build_dataguide() summarizes the whole graph, writes the new branches and deletes the branches that no longer
+  exist. The DataGuide stays readable throughout.
+- update_dataguide() summarizes only the subtrees of newly ingested datasets, directories or files. It writes the
+  branches that are missing and leaves the rest of the DataGuide untouched.
+
+Usage (from the repository root):
+    python -m app.dataguide_builder build
+    python -m app.dataguide_builder update --dataset "Test Dataset CNT"
+    python -m app.dataguide_builder update --node-id 4:0b6c...:123
+    python -m app.dataguide_builder show
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.dataguide import DATAGUIDE_VERSION_QUERY, dataguide_version
+from app.tracing import span
+
+# A distinct sequence of relationship types from :Pennsieve, e.g. ("DATASET", "FILES", "DATA", "_header")
+TypePath = Tuple[str, ...]
+
+# Rows per UNWIND write
+WRITE_BATCH_SIZE = 5000
+# Frontier nodes expanded per read query
+READ_BATCH_SIZE = 5000
+# Deepest path summarized; guards against cycles in the data graph
+MAX_DEPTH = 32
+
+ROOT_PATH_KEY = "[]"
+INDEX_QUERY = "CREATE INDEX dataguide_path IF NOT EXISTS FOR (g:DataGuide) ON (g.path)"
+PENNSIEVE_ANCHOR = "MATCH (a:Pennsieve)"
+NODE_ANCHOR = "MATCH (a) WHERE elementId(a) = $anchor_id"
+TYPE_PATH_TO_NODE_QUERY = """
+    MATCH path = (:Pennsieve)-[*]->(n) WHERE elementId(n) = $node_id
+    RETURN [r IN relationships(path) | type(r)] AS types
+    LIMIT 1
+    """
+DATASET_IDS_QUERY = "MATCH (:Pennsieve)-[:DATASET]->(d:Dataset) WHERE d.name IN $names RETURN d.name AS name, " \
+                    "elementId(d) AS id"
+
+
+def path_key(type_path: Sequence[str]) -> str:
+    """The `path` property of the :DataGuide node of a type path."""
+    return json.dumps(list(type_path))
+
+
+def _escape(rel_type: str) -> str:
+    return "`" + rel_type.replace("`", "``") + "`"
+
+
+def _pattern(type_path: TypePath) -> str:
+    return "".join(f"-[:{_escape(rel_type)}]->()" for rel_type in type_path)
+
+
+def summarize_paths(graph: Any, anchor: str = PENNSIEVE_ANCHOR,
+                    params: Optional[Dict[str, Any]] = None) -> Set[TypePath]:
+    """
+    Every distinct sequence of relationship types leaving the anchor node(s), expanded one level at a time from the
+    frontier of the previous level: the element ids of the nodes each sequence reaches. Each read query expands up to
+    READ_BATCH_SIZE frontier nodes by one relationship, so every level reads only the relationships leaving it instead
+    of walking again from the anchor.
+
+    Args:
+        graph: Neo4jGraph (or anything with `query(text, params)`).
+        anchor (str, optional): MATCH clause binding the start node(s) to `a`. Defaults to every :Pennsieve node.
+        params (dict, optional): Parameters of the anchor clause.
+
+    Returns:
+        Set[TypePath]: The sequences, relative to the anchor (the empty sequence is not included).
+    """
+    found: Set[TypePath] = set()
+    frontier: Dict[TypePath, Set[str]] = defaultdict(set)
+    rows = graph.query(f"{anchor} MATCH (a)-[r]->(m) RETURN type(r) AS type, collect(DISTINCT elementId(m)) AS ids",
+                       params or {})
+    for row in rows:
+        frontier[(row["type"],)].update(row["ids"])
+    depth = 1
+    while frontier and depth < MAX_DEPTH:
+        found.update(frontier)
+        next_frontier: Dict[TypePath, Set[str]] = defaultdict(set)
+        prefixes = list(frontier)
+        nodes = [{"prefix": i, "id": node_id} for i, prefix in enumerate(prefixes) for node_id in frontier[prefix]]
+        for start in range(0, len(nodes), READ_BATCH_SIZE):
+            rows = graph.query(
+                "UNWIND $nodes AS node MATCH (n) WHERE elementId(n) = node.id MATCH (n)-[r]->(m) "
+                "RETURN node.prefix AS prefix, type(r) AS type, collect(DISTINCT elementId(m)) AS ids",
+                {"nodes": nodes[start:start + READ_BATCH_SIZE]})
+            for row in rows:
+                next_frontier[prefixes[row["prefix"]] + (row["type"],)].update(row["ids"])
+        frontier = next_frontier
+        depth += 1
+    found.update(frontier)
+    if frontier:
+        print(f"WARNING: DataGuide paths deeper than {MAX_DEPTH} relationships were not summarized")
+    return found
+
+
+def _with_ancestors(type_paths: Iterable[TypePath]) -> Set[TypePath]:
+    paths: Set[TypePath] = set()
+    for type_path in type_paths:
+        paths.update(type_path[:depth] for depth in range(1, len(type_path) + 1))
+    return paths
+
+
+def existing_paths(graph: Any) -> Set[str]:
+    """`path` keys of the :DataGuide nodes written by this module (the root excluded)."""
+    rows = graph.query("MATCH (g:DataGuide) WHERE g.path IS NOT NULL AND NOT g:Root RETURN g.path AS path")
+    return {row["path"] for row in rows}
+
+
+def _ensure_root(graph: Any) -> None:
+    graph.query(INDEX_QUERY)
+    graph.query("MERGE (g:DataGuide:Root {path: $path}) ON CREATE SET g.version = 0", {"path": ROOT_PATH_KEY})
+
+
+def write_paths(graph: Any, type_paths: Iterable[TypePath], batch_size: int = WRITE_BATCH_SIZE) -> int:
+    """
+    MERGEs the :DataGuide nodes and relationships of `type_paths` (whose ancestors must be included or exist), in
+    UNWIND batches: nodes first, then relationships per type, parents before children.
+
+    Returns:
+        int: Number of paths written.
+    """
+    ordered = sorted(set(type_paths), key=len)
+    node_rows = [{"path": path_key(p), "depth": len(p)} for p in ordered]
+    for start in range(0, len(node_rows), batch_size):
+        graph.query("UNWIND $rows AS row MERGE (g:DataGuide {path: row.path}) ON CREATE SET g.depth = row.depth",
+                    {"rows": node_rows[start:start + batch_size]})
+    by_type: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+    for type_path in ordered:
+        by_type[type_path[-1]].append({"parent": path_key(type_path[:-1]), "path": path_key(type_path)})
+    for rel_type, rows in by_type.items():
+        for start in range(0, len(rows), batch_size):
+            graph.query(f"UNWIND $rows AS row MATCH (p:DataGuide {{path: row.parent}}) "
+                        f"MATCH (c:DataGuide {{path: row.path}}) MERGE (p)-[:{_escape(rel_type)}]->(c)",
+                        {"rows": rows[start:start + batch_size]})
+    return len(ordered)
+
+
+def delete_paths(graph: Any, keys: Iterable[str], batch_size: int = WRITE_BATCH_SIZE) -> int:
+    keys = list(keys)
+    for start in range(0, len(keys), batch_size):
+        graph.query("UNWIND $keys AS key MATCH (g:DataGuide {path: key}) DETACH DELETE g",
+                    {"keys": keys[start:start + batch_size]})
+    return len(keys)
+
+
+def bump_version(graph: Any) -> Optional[int]:
+    """Increments the DataGuide version; running apps drop their DataGuide-derived caches when they see it change."""
+    rows = graph.query("MATCH (g:DataGuide:Root) SET g.version = coalesce(g.version, 0) + 1, "
+                       "g.updated_at = datetime() RETURN g.version AS version")
+    return rows[0]["version"] if rows else None
+
+
+def build_dataguide(graph: Any, batch_size: int = WRITE_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Summarizes the whole graph into the DataGuide: new branches are written, branches whose paths no longer exist are
+    deleted (as are :DataGuide nodes not written by this module), and the version is bumped if anything changed.
+
+    Args:
+        graph: Neo4jGraph (or anything with `query(text, params)`).
+        batch_size (int, optional): Rows per UNWIND write. Defaults to WRITE_BATCH_SIZE.
+
+    Returns:
+        Dict[str, Any]: Number of paths, added and deleted branches, and the version.
+    """
+    with span("dataguide.build") as s:
+        paths = summarize_paths(graph)
+        _ensure_root(graph)
+        existing = existing_paths(graph)
+        wanted = {path_key(p): p for p in paths}
+        added = write_paths(graph, [p for key, p in wanted.items() if key not in existing], batch_size)
+        deleted = delete_paths(graph, existing - set(wanted), batch_size)
+        # nodes of a DataGuide built by other tools have no `path` and cannot be maintained: replace them
+        legacy = graph.query(f"MATCH (g:DataGuide) WHERE g.path IS NULL WITH g LIMIT {batch_size} "
+                             f"DETACH DELETE g RETURN count(g) AS count")[0]["count"]
+        while legacy:
+            deleted += legacy
+            legacy = graph.query(f"MATCH (g:DataGuide) WHERE g.path IS NULL WITH g LIMIT {batch_size} "
+                                 f"DETACH DELETE g RETURN count(g) AS count")[0]["count"]
+        version = bump_version(graph) if added or deleted else dataguide_version(graph)
+        s.set_attributes(paths=len(paths), added=added, deleted=deleted, version=version)
+    return {"paths": len(paths), "added": added, "deleted": deleted, "version": version}
+
+
+def type_path_to(graph: Any, node_id: str) -> TypePath:
+    """The relationship types from :Pennsieve to a node (the type path of its DataGuide branch)."""
+    rows = graph.query(TYPE_PATH_TO_NODE_QUERY, {"node_id": node_id})
+    if not rows:
+        raise ValueError(f"Node {node_id} is not reachable from :Pennsieve")
+    return tuple(rows[0]["types"])
+
+
+def dataset_ids(graph: Any, names: Sequence[str]) -> List[str]:
+    """Element ids of the :Dataset nodes with these names; raises if one of them does not exist."""
+    rows = graph.query(DATASET_IDS_QUERY, {"names": list(names)})
+    missing = set(names) - {row["name"] for row in rows}
+    if missing:
+        raise ValueError(f"No dataset named {', '.join(sorted(missing))}")
+    return [row["id"] for row in rows]
+
+
+def update_dataguide(graph: Any, node_ids: Sequence[str], batch_size: int = WRITE_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Adds the branches of newly ingested subtrees (a dataset, directory or file and everything below it) to the
+    DataGuide without summarizing the rest of the graph. Only missing branches are written; nothing is deleted (a
+    full build_dataguide() prunes branches of removed data). The version is bumped if a branch was added.
+
+    Args:
+        graph: Neo4jGraph (or anything with `query(text, params)`).
+        node_ids (Sequence[str]): Element ids of the subtree roots.
+        batch_size (int, optional): Rows per UNWIND write. Defaults to WRITE_BATCH_SIZE.
+
+    Returns:
+        Dict[str, Any]: Number of paths summarized, added branches and the version.
+    """
+    with span("dataguide.update", subtrees=len(node_ids)) as s:
+        paths: Set[TypePath] = set()
+        for node_id in node_ids:
+            base = type_path_to(graph, node_id)
+            subtree = summarize_paths(graph, NODE_ANCHOR, {"anchor_id": node_id})
+            paths |= _with_ancestors([base]) | {base + p for p in subtree}
+        _ensure_root(graph)
+        keys = [path_key(p) for p in paths]
+        present = set()
+        for start in range(0, len(keys), batch_size):
+            rows = graph.query("UNWIND $keys AS key MATCH (g:DataGuide {path: key}) RETURN g.path AS path",
+                               {"keys": keys[start:start + batch_size]})
+            present.update(row["path"] for row in rows)
+        added = write_paths(graph, [p for p in paths if path_key(p) not in present], batch_size)
+        version = bump_version(graph) if added else dataguide_version(graph)
+        s.set_attributes(paths=len(paths), added=added, version=version)
+    return {"paths": len(paths), "added": added, "version": version}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or incrementally update the :DataGuide summary.")
+    parser.add_argument("command", choices=("build", "update", "show"))
+    parser.add_argument("--dataset", action="append", default=[], help="name of a newly ingested dataset (update)")
+    parser.add_argument("--node-id", action="append", default=[],
+                        help="element id of a newly ingested dataset, directory or file node (update)")
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE, help="rows per UNWIND write")
+    args = parser.parse_args(argv)
+
+    from app.database_setup import setup_neo4j_graph
+
+    graph = setup_neo4j_graph(refresh_schema=False)
+    if args.command == "show":
+        rows = graph.query(DATAGUIDE_VERSION_QUERY)
+        print(f"version: {rows[0]['version'] if rows else None}, branches: {len(existing_paths(graph))}")
+        return 0
+    if args.command == "build":
+        report = build_dataguide(graph, args.batch_size)
+    else:
+        if not args.dataset and not args.node_id:
+            parser.error("update needs --dataset or --node-id")
+        node_ids = args.node_id + (dataset_ids(graph, args.dataset) if args.dataset else [])
+        report = update_dataguide(graph, node_ids, args.batch_size)
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
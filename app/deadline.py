@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+from app.config import Config
+from app.tracing import current_span, metrics
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's deadline expires before (or while) a stage runs."""
+
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Deadline of {budget:.1f}s exceeded during {stage}")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must finish. Created once per request by `deadline_scope()` and read
+    by every stage through `current_deadline()`, so no signature in between has to carry it.
+
+    Args:
+        seconds (float): Budget from now; math.inf for no deadline.
+    """
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str) -> None:
+        """Raises DeadlineExceeded if the deadline has passed (cooperative cancellation point)."""
+        if self.expired():
+            self._exceeded(stage)
+
+    def allows(self, expected_seconds: float) -> bool:
+        """Whether a step expected to take `expected_seconds` can still finish in time."""
+        return self.remaining() >= expected_seconds
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Awaits `awaitable`, cancelling it and raising DeadlineExceeded if it outlives the deadline."""
+        if self.expired():
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            self._exceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, timeout=None if math.isinf(self.budget) else self.remaining())
+        except asyncio.TimeoutError:
+            self._exceeded(stage)
+
+    def _exceeded(self, stage: str) -> None:
+        metrics.increment("pipeline_deadline_exceeded_total", stage=stage)
+        span_obj = current_span()
+        if span_obj is not None:
+            span_obj.set_attribute("deadline_exceeded", stage)
+        raise DeadlineExceeded(stage, self.budget) from None
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being processed, or None outside of `deadline_scope()`."""
+    return _current_deadline.get()
+
+
+def remaining_seconds(cap: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left before the current deadline (at most `cap`), for client/server-side timeouts such as Neo4j
+    transaction and Milvus search timeouts. None when no deadline is set and no cap is given.
+    """
+    deadline = current_deadline()
+    if deadline is None or math.isinf(deadline.budget):
+        return cap
+    # never hand out 0: drivers treat it as "no timeout"
+    remaining = max(deadline.remaining(), 0.001)
+    return min(remaining, cap) if cap is not None else remaining
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None) -> Iterator[Deadline]:
+    """
+    Sets the request deadline for the block (and for threads/tasks started in it, which copy the context).
+    `seconds` defaults to Config.QUERY_DEADLINE_SECONDS; 0 or a negative value means no deadline.
+    """
+    seconds = Config.QUERY_DEADLINE_SECONDS if seconds is None else seconds
+    deadline = Deadline(seconds if seconds > 0 else math.inf)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
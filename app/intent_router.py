@@ -0,0 +1,339 @@
+import re
+import textwrap
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.answer_synthesis import render_template_answer, classify_result_shape
+from app.config import Config
+from app.name_matching import resolve_dataset_name
+from app.result_guard import result_guard
+from app.tracing import span, metrics
+
+# --- pre-written Cypher, one per intent. Names and fields come in as parameters, never as query text. -----------
+
+DATASET_NAMES_QUERY = """
+    MATCH (:Pennsieve)-[:DATASET]->(d:Dataset)
+    RETURN d.name AS dataset
+    """
+
+DATASET_FILES_QUERY = """
+    MATCH (d:Dataset {name: $dataset})-[:FILES*1..]->(f:File)
+    RETURN f.name AS file
+    """
+
+DATASET_HAS_FILE_QUERY = """
+    MATCH (d:Dataset {name: $dataset})
+    OPTIONAL MATCH (d)-[:FILES*1..]->(f:File {name: $file})
+    RETURN count(f) > 0 AS has_file
+    """
+
+CONTRIBUTORS_QUERY = """
+    MATCH (d:Dataset)-[:FILES]->(:File)-[:DATA]->(:Data)-[:contributors]->(:Data)-[:INDEX]->(c:Data)
+    WHERE $dataset IS NULL OR d.name = $dataset
+    OPTIONAL MATCH (c)-[:first_name]->(first:Data)
+    OPTIONAL MATCH (c)-[:last_name]->(last:Data)
+    OPTIONAL MATCH (c)-[:orcid]->(orcid:Data)
+    OPTIONAL MATCH (c)-[:degree]->(degree:Data)
+    RETURN d.name AS dataset, first.value AS first_name, last.value AS last_name, orcid.value AS orcid,
+           degree.value AS degree
+    """
+
+MANIFEST_FIELD_QUERY = """
+    MATCH (d:Dataset {name: $dataset})-[:FILES*1..]->(:File {name: 'manifest.json'})-[:DATA]->(:Data)-[r]->(v:Data)
+    WHERE type(r) = $field
+    OPTIONAL MATCH (v)-[:name]->(n:Data)
+    RETURN d.name AS dataset, coalesce(v.value, n.value) AS value
+    """
+
+# Run once per database (`python -m app.intent_router`) so the name lookups above are index seeks
+INDEX_QUERIES = (
+    "CREATE INDEX dataset_name IF NOT EXISTS FOR (d:Dataset) ON (d.name)",
+    "CREATE INDEX file_name IF NOT EXISTS FOR (f:File) ON (f.name)",
+)
+
+# Contributor attributes a question can ask for, with the words that ask for them
+CONTRIBUTOR_FIELDS = {
+    "orcid": ("orcid", "orcids"),
+    "degree": ("degree", "degrees"),
+    "last_name": ("last name", "last names", "surname", "surnames", "family name"),
+    "first_name": ("first name", "first names", "given name"),
+}
+# manifest.json keys answered by MANIFEST_FIELD_QUERY
+MANIFEST_FIELDS = {
+    "license": ("license", "licence"),
+    "creator": ("creator", "created by"),
+    "description": ("description",),
+    "keywords": ("keyword", "keywords"),
+    "version": ("version",),
+    "identifier": ("identifier", "doi"),
+}
+
+_FILE_NAME_RE = re.compile(r"\b([\w\-]+(?:\.[\w\-]+)*\.[A-Za-z][A-Za-z0-9]{1,4})\b")
+# File types a question can restrict datasets by ("datasets with EDF files")
+_FILE_TYPE_RE = re.compile(r"\b(edf|json|csv|tsv|txt|xlsx?|mat|nii|dat|jpe?g|png|tiff?|pdf|zip|h5|nwb)\b")
+# Words that restrict a set of datasets instead of listing all of them
+_RESTRICTION_PHRASES = ("have", "has", "having", "with", "without", "contain", "contains", "containing", "include",
+                        "includes", "more than", "less than", "fewer than", "at least", "at most", "where", "field",
+                        "fields")
+
+
+def _has_phrase(text: str, phrases) -> bool:
+    return any(re.search(rf"\b{re.escape(phrase)}\b", text) for phrase in phrases)
+
+
+class NameResolver:
+    """
+    Resolves the dataset a question refers to against the dataset names in the graph, which are loaded with one
+    query and cached for `ttl_seconds` (see resolve_dataset_name() for the matching). Thread-safe.
+
+    Args:
+        graph: Object implementing the Neo4jGraph `query` method.
+        ttl_seconds (float, optional): Seconds the dataset names are cached. Defaults to
+                                       Config.DATAGUIDE_CACHE_TTL_SECONDS (names change only on ingestion too).
+    """
+
+    # Share of the phrase's content words a name must contain to be accepted as a fuzzy match
+    MIN_OVERLAP = 0.6
+
+    def __init__(self, graph: Any, ttl_seconds: Optional[float] = None):
+        self.graph = graph
+        self.ttl_seconds = Config.DATAGUIDE_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._lock = threading.Lock()
+        self._names: Optional[List[str]] = None
+        self._loaded_at = 0.0
+
+    def dataset_names(self) -> List[str]:
+        with self._lock:
+            if self._names is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return self._names
+        names = sorted({row["dataset"] for row in self.graph.query(DATASET_NAMES_QUERY) if row.get("dataset")})
+        with self._lock:
+            self._names, self._loaded_at = names, time.monotonic()
+        return names
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._names = None
+
+    def resolve_dataset(self, question: str) -> Tuple[Optional[str], float]:
+        """Returns (dataset name, confidence in [0, 1]) or (None, 0.0) when no single dataset is referred to."""
+        return resolve_dataset_name(question, self.dataset_names(), self.MIN_OVERLAP)
+
+    @staticmethod
+    def resolve_file(question: str) -> Optional[str]:
+        """The file name mentioned in the question ("banner.jpg", "manifest.json"), if any."""
+        match = _FILE_NAME_RE.search(question)
+        return match.group(1) if match else None
+
+
+class Route:
+    """A routed question: the intent, its filled slots, the Cypher to run and the router's confidence."""
+
+    def __init__(self, intent: str, confidence: float, query: str, params: Dict[str, Any],
+                 postprocess: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None):
+        self.intent = intent
+        self.confidence = confidence
+        self.query = query
+        self.params = params
+        self.postprocess = postprocess
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"intent": self.intent, "confidence": round(self.confidence, 3), "params": self.params}
+
+
+def _project(columns: List[str]) -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Keeps only `columns` (a column the row lacks is read from "value") and drops rows where all are empty."""
+    def project(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        projected = []
+        for row in rows:
+            kept = {column: row.get(column, row.get("value")) for column in columns}
+            if any(value not in (None, "") for value in kept.values()):
+                projected.append(kept)
+        return projected
+    return project
+
+
+class IntentRouter:
+    """
+    Answers the common question classes (list datasets, list the files of a dataset, does a dataset have a file,
+    contributors/ORCIDs of a dataset, a manifest.json field of a dataset) with pre-written parameterized Cypher,
+    skipping DataGuide/schema/few-shot setup and Cypher generation entirely.
+
+    A local rule-based classifier scores each intent from cue phrases; slots are filled by the NameResolver. The
+    question is routed only when the best intent's confidence (cue score times slot confidence, reduced when a
+    second intent scores close) reaches `min_confidence`; otherwise, or when the routed query returns nothing, the
+    caller falls back to LLM generation. Hits and misses are counted in `pipeline_router_total` and on the instance.
+
+    Args:
+        graph: Object implementing the Neo4jGraph `query` method.
+        min_confidence (float, optional): Defaults to Config.ROUTER_MIN_CONFIDENCE.
+        resolver (NameResolver, optional): Defaults to a NameResolver on `graph`.
+    """
+
+    def __init__(self, graph: Any, min_confidence: Optional[float] = None, resolver: Optional[NameResolver] = None):
+        self.graph = graph
+        self.min_confidence = Config.ROUTER_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.resolver = resolver or NameResolver(graph)
+        self._lock = threading.Lock()
+        self.outcomes: Dict[str, int] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        with self._lock:
+            total = sum(self.outcomes.values())
+            return self.outcomes.get("hit", 0) / total if total else 0.0
+
+    def classify(self, question: str) -> List[Tuple[float, str]]:
+        """Cue scores per intent in [0, 1], best first."""
+        text = question.lower()
+        asks_files = _has_phrase(text, ("file", "files"))
+        file_name = NameResolver.resolve_file(question)
+        asks_contributors = _has_phrase(text, ("contributor", "contributors", "contributed", "authors"))
+        contributor_field = any(_has_phrase(text, words) for words in CONTRIBUTOR_FIELDS.values())
+        manifest_field = any(_has_phrase(text, words) for words in MANIFEST_FIELDS.values())
+        reasoning = _has_phrase(text, ("why", "how many", "count", "compare", "kind", "type", "types", "size",
+                                       "largest", "average", "when", "header", "signal", "signals"))
+        scores = {
+            "list_datasets": 0.6 * _has_phrase(text, ("datasets",)) + 0.4 * _has_phrase(
+                text, ("names of the datasets", "name of the datasets", "list datasets", "all datasets",
+                       "which datasets", "what datasets")),
+            "list_files": 0.5 * asks_files + 0.5 * _has_phrase(text, ("what files", "which files", "list files",
+                                                                     "files are in", "files in", "all files")),
+            "has_file": 0.5 * (file_name is not None) + 0.5 * _has_phrase(text, ("has", "have", "contain",
+                                                                              "contains", "include", "includes")),
+            "contributors": 0.6 * asks_contributors + 0.4 * (contributor_field or _has_phrase(text, ("name", "names",
+                                                                                                 "who"))),
+            "manifest_field": 0.6 * manifest_field + 0.4 * _has_phrase(text, ("manifest", "manifest.json", "what",
+                                                                          "who")),
+        }
+        # "which datasets have EDF files / more than 10 files" filters the datasets: only an unrestricted question
+        # may list all of them, the others go to Cypher generation
+        if _has_phrase(text, _RESTRICTION_PHRASES) or asks_files or file_name is not None or _FILE_TYPE_RE.search(
+                text) or manifest_field:
+            scores["list_datasets"] *= 0.5
+        if asks_contributors or contributor_field:
+            scores["list_datasets"] *= 0.3
+            scores["manifest_field"] *= 0.5
+        if file_name is not None:
+            scores["list_files"] *= 0.5
+            scores["list_datasets"] *= 0.3
+            if file_name.lower() == "manifest.json":
+                scores["has_file"] *= 0.5 if manifest_field else 1.0
+        if reasoning:
+            scores = {intent: score * 0.5 for intent, score in scores.items()}
+        return sorted(((score, intent) for intent, score in scores.items()), reverse=True)
+
+    def route(self, question: str) -> Optional[Route]:
+        """The Route for `question`, or None when it should go to LLM Cypher generation."""
+        ranked = self.classify(question)
+        (best, intent), (second, _) = ranked[0], ranked[1]
+        if best <= 0:
+            return None
+        cue_confidence = best * (1 - 0.5 * second / best)
+        text = question.lower()
+
+        if intent == "list_datasets":
+            return Route(intent, cue_confidence, DATASET_NAMES_QUERY, {})
+
+        all_datasets = _has_phrase(text, ("our datasets", "the datasets", "all datasets", "our database",
+                                          "in our database", "every dataset"))
+        dataset, slot_confidence = self.resolver.resolve_dataset(question)
+        if intent == "contributors":
+            if dataset is None and all_datasets:
+                slot_confidence = 1.0
+            fields = [f for f, words in CONTRIBUTOR_FIELDS.items() if _has_phrase(text, words)]
+            if not fields or _has_phrase(text, ("name", "names", "who")) and "first_name" not in fields \
+                    and "last_name" not in fields:
+                fields = ["first_name", "last_name"] + fields
+            columns = fields if dataset is not None else ["dataset"] + fields
+            return Route(intent, cue_confidence * slot_confidence, CONTRIBUTORS_QUERY, {"dataset": dataset},
+                         _project(columns))
+        if dataset is None:
+            return None
+        if intent == "list_files":
+            return Route(intent, cue_confidence * slot_confidence, DATASET_FILES_QUERY, {"dataset": dataset})
+        if intent == "has_file":
+            file_name = NameResolver.resolve_file(question)
+            if file_name is None:
+                return None
+            return Route(intent, cue_confidence * slot_confidence, DATASET_HAS_FILE_QUERY,
+                         {"dataset": dataset, "file": file_name})
+        field = next(f for f, words in MANIFEST_FIELDS.items() if _has_phrase(text, words)) \
+            if any(_has_phrase(text, words) for words in MANIFEST_FIELDS.values()) else None
+        if field is None:
+            return None
+        return Route(intent, cue_confidence * slot_confidence, MANIFEST_FIELD_QUERY,
+                     {"dataset": dataset, "field": field}, _project([field]))
+
+    def _record(self, outcome: str) -> None:
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        metrics.increment("pipeline_router_total", outcome=outcome)
+
+    def answer(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Answers `question` from its routed query. Returns a response shaped like run_query's, or None when the
+        question is not routed with enough confidence, the routed query fails or returns no rows.
+        """
+        with span("router.route") as s:
+            try:
+                route = self.route(question)
+            except Exception as e:
+                # e.g. the dataset names could not be loaded: the LLM path may still work
+                print(f"Intent router failed, falling back to Cypher generation: {e}")
+                s.set_attributes(outcome="error", error=str(e))
+                self._record("error")
+                return None
+            if route is None or route.confidence < self.min_confidence:
+                outcome = "miss" if route is None else "low_confidence"
+                s.set_attribute("outcome", outcome)
+                if route is not None:
+                    s.set_attributes(intent=route.intent, confidence=route.confidence)
+                self._record(outcome)
+                return None
+            s.set_attributes(intent=route.intent, confidence=route.confidence)
+            try:
+                # rows are streamed and capped like those of generated queries (see app/result_guard.py)
+                with result_guard() as guard:
+                    rows = self.graph.query(route.query, route.params)
+            except Exception as e:
+                print(f"Routed query for intent {route.intent} failed, falling back to Cypher generation: {e}")
+                s.set_attributes(outcome="error", error=str(e))
+                self._record("error")
+                return None
+            if route.postprocess is not None:
+                rows = route.postprocess(rows)
+            answer = render_template_answer(question, rows) if rows else None
+            if answer is None:
+                s.set_attributes(outcome="empty", rows=len(rows))
+                self._record("empty")
+                return None
+            s.set_attributes(outcome="hit", rows=len(rows))
+            self._record("hit")
+        shape = classify_result_shape(rows)
+        metrics.increment("pipeline_answer_path_total", path="template", shape=shape)
+        params = ", ".join(f"${k} = {v!r}" for k, v in route.params.items())
+        return {
+            "query": question,
+            "result": answer,
+            "intermediate_steps": [{"query": f"// routed: {route.intent}{' (' + params + ')' if params else ''}\n"
+                                              f"{textwrap.dedent(route.query).strip()}"},
+                                   {"context": rows}],
+            "answer_path": "template",
+            "result_shape": shape,
+            "route": route.to_dict(),
+            "result_stats": guard.stats.to_dict(),
+        }
+
+
+def create_indexes(graph: Any) -> None:
+    """Creates the :Dataset(name) and :File(name) indexes the routed queries look names up with."""
+    for query in INDEX_QUERIES:
+        graph.query(query)
+        print(f"Ensured: {query}")
+
+
+if __name__ == '__main__':
+    from app.database_setup import setup_neo4j_graph
+    create_indexes(setup_neo4j_graph(refresh_schema=False))
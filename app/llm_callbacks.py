@@ -0,0 +1,72 @@
+"""
+LangChain callback handlers of the pipeline: LLM call spans (see `app/tracing.py`) and circuit breaker accounting
+(see `app/circuit_breaker.py`). Kept apart from those modules so that importing them does not import LangChain.
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.circuit_breaker import CircuitBreaker
+from app.tracing import Span, current_span, metrics, record_span
+
+
+class LLMSpanCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that turns every LLM call made inside a chain into an `llm.call` span carrying the
+    model name and prompt/completion token counts. Pass it through `callbacks=[...]` when invoking a chain.
+    """
+
+    def __init__(self):
+        self._starts: Dict[Any, Tuple[float, Optional[Span], Dict[str, Any]]] = {}
+
+    def _on_start(self, serialized: Dict[str, Any], run_id: Any, **kwargs: Any) -> None:
+        invocation = kwargs.get("invocation_params") or {}
+        model = invocation.get("model_name") or invocation.get("model") or (serialized or {}).get("name")
+        self._starts[run_id] = (time.perf_counter(), current_span(), {"model": model})
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: Any, **kwargs: Any) -> None:
+        self._on_start(serialized, run_id, **kwargs)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: Any,
+                            **kwargs: Any) -> None:
+        self._on_start(serialized, run_id, **kwargs)
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        start, parent, attributes = self._starts.pop(run_id, (time.perf_counter(), current_span(), {}))
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        attributes.update(
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            total_tokens=usage.get("total_tokens"),
+        )
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                metrics.increment("pipeline_llm_tokens_total", usage[f"{kind}_tokens"], kind=kind,
+                                  model=attributes.get("model"))
+        record_span("llm.call", parent, time.perf_counter() - start, **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        start, parent, attributes = self._starts.pop(run_id, (time.perf_counter(), current_span(), {}))
+        record_span("llm.call", parent, time.perf_counter() - start, status="error",
+                    error=f"{type(error).__name__}: {error}", **attributes)
+
+
+class CircuitBreakerCallbackHandler(BaseCallbackHandler):
+    """LangChain callback handler that records the latency and outcome of every LLM call into `breaker`."""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self._starts: Dict[Any, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self.breaker.record(time.perf_counter() - self._starts.pop(run_id, time.perf_counter()), ok=True)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self.breaker.record(time.perf_counter() - self._starts.pop(run_id, time.perf_counter()), ok=False)
@@ -1,4 +1,12 @@
-from app.qa_chain import run_query
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, List, Optional
+
+from app.resources import SharedResources
+
+if TYPE_CHECKING:
+    from app.batch import BatchResult
+
+# The pipeline (LangChain, Neo4j, Milvus clients) is imported on the first question, not with this module: see
+# app/warm_up.py to pay for it at startup instead.
 
 example_query1 = "Does dataset named: Test Dataset CNT has banner.jpg file?"
 example_query2 = "What are the last names of contributors in dataset named Test Dataset CNT?"
@@ -19,14 +27,58 @@ example_query9 = "Give me the name of the contributors or creators of the datase
 example_query10 = "give me 10 values for raw signals in the edf file of Test Dataset CNT?"
 
 
-def process_query(user_query: str) -> dict:
+def example_questions() -> List[str]:
+    """The canned example_query* questions above, warmed up at startup (see app/warm_up.py)."""
+    return [value for name, value in sorted(globals().items()) if name.startswith("example_query")]
+
+
+def process_query(user_query: str, resources: Optional[SharedResources] = None,
+                  deadline_seconds: Optional[float] = None) -> dict:
     """
     Given a user_query, run the Langchain CypherQA chain
-    and return the full response.
+    and return the full response. Pass `resources` to reuse process-wide clients and caches, and
+    `deadline_seconds` to override Config.QUERY_DEADLINE_SECONDS for this request.
+    """
+    from app.qa_chain import run_query
+
+    response: dict = run_query(user_query, resources=resources, deadline_seconds=deadline_seconds)
+    return response
+
+
+async def aprocess_query(user_query: str, resources: Optional[SharedResources] = None,
+                         deadline_seconds: Optional[float] = None) -> dict:
+    """
+    Async version of process_query() for callers that already run an event loop.
     """
-    response: dict = run_query(user_query)
+    from app.qa_chain import arun_query
+
+    response: dict = await arun_query(user_query, resources=resources, deadline_seconds=deadline_seconds)
     return response
 
 
+def process_queries(user_queries: List[str], resources: Optional[SharedResources] = None,
+                    concurrency: Optional[int] = None,
+                    deadline_seconds: Optional[float] = None) -> Iterator["BatchResult"]:
+    """
+    Answers many questions as one batch (see `app/batch.py`): setup, query embeddings and the vector search are
+    done once for all of them, at most `concurrency` questions generate Cypher at a time, and each BatchResult
+    (index, question, response or error) is yielded as soon as its question completes.
+    """
+    from app.batch import process_queries as _process_queries
+
+    return _process_queries(user_queries, resources, concurrency, deadline_seconds)
+
+
+def aprocess_queries(user_queries: List[str], resources: Optional[SharedResources] = None,
+                     concurrency: Optional[int] = None,
+                     deadline_seconds: Optional[float] = None) -> AsyncIterator["BatchResult"]:
+    """
+    Async version of process_queries(): `async for result in aprocess_queries(...)`.
+    """
+    from app.batch import aprocess_queries as _aprocess_queries
+
+    return _aprocess_queries(user_queries, resources, concurrency, deadline_seconds)
+
+
 if __name__ == '__main__':
     print("Please run streamlit_app.py to interact with the app.")
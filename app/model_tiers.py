@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Sequence, Tuple
+
+from app.circuit_breaker import CircuitOpenError, get_breaker
+from app.config import Config
+from app.tracing import span, metrics
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+# model name -> chat model. Replace it to run the ladder against local stand-ins (see benchmarks/fakes.py).
+ModelProvider = Callable[[str], "BaseChatModel"]
+
+
+def openai_chat_model(model: str) -> "BaseChatModel":
+    """Default ModelProvider: a ChatOpenAI client for `model`."""
+    from langchain_openai import ChatOpenAI
+
+    # o1-style reasoning models only accept the default temperature
+    reasoning = model.startswith(("o1", "o3", "o4"))
+    return ChatOpenAI(
+        model=model,
+        temperature=1 if reasoning else 0,
+        timeout=Config.LLM_REQUEST_TIMEOUT_SECONDS,
+        max_retries=2,
+    )
+
+
+def parse_ladder(spec: str) -> List[str]:
+    """"gpt-4o-mini, o1-mini-2024-09-12" -> ["gpt-4o-mini", "o1-mini-2024-09-12"]"""
+    return [model.strip() for model in spec.split(",") if model.strip()]
+
+
+class ModelTier:
+    """One rung of a ModelLadder. The chat model is created by the provider on first use."""
+
+    def __init__(self, name: str, provider: ModelProvider):
+        self.name = name
+        self._provider = provider
+        self._llm: Optional["BaseChatModel"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self) -> "BaseChatModel":
+        with self._lock:
+            if self._llm is None:
+                self._llm = self._provider(self.name)
+            return self._llm
+
+
+class ModelLadder:
+    """
+    Ordered chat models, fastest first. Callers start on the first tier and move one tier up after a failed
+    attempt (invalid Cypher, an error or an empty context for question answering; an error or an empty
+    description for description generation); the last tier is reused for any further attempt.
+
+    Every attempt is recorded per purpose and tier: its latency as stage `model_tier.<purpose>.<tier>` and its
+    outcome in `pipeline_model_tier_total{purpose, tier, outcome}`.
+
+    Args:
+        models (Sequence[str]): Model names, fastest first.
+        provider (ModelProvider, optional): Creates the chat model of a tier. Defaults to openai_chat_model.
+    """
+
+    def __init__(self, models: Sequence[str], provider: Optional[ModelProvider] = None):
+        if not models:
+            raise ValueError("A model ladder needs at least one model")
+        provider = provider or openai_chat_model
+        self.tiers = [ModelTier(model, provider) for model in models]
+
+    @classmethod
+    def single(cls, llm: "BaseChatModel", name: Optional[str] = None) -> "ModelLadder":
+        """A one-tier ladder around an existing chat model (no escalation)."""
+        return cls([name or getattr(llm, "model_name", None) or type(llm).__name__], provider=lambda _: llm)
+
+    def tier(self, level: int) -> ModelTier:
+        """The tier for the `level`-th escalation (0 = first attempt), capped at the last tier."""
+        return self.tiers[min(max(level, 0), len(self.tiers) - 1)]
+
+    @staticmethod
+    def record(purpose: str, tier: ModelTier, duration: float, outcome: str) -> None:
+        metrics.observe(f"model_tier.{purpose}.{tier.name}", duration, error=outcome == "error")
+        metrics.increment("pipeline_model_tier_total", purpose=purpose, tier=tier.name, outcome=outcome)
+
+    def invoke(self, messages: List[Any], purpose: str, accept: Callable[[str], bool] = bool) -> Tuple[str, str]:
+        """
+        Invokes the tiers in order until one returns content `accept`ed (non-empty by default). Tiers whose
+        circuit breaker (`llm.<tier>`) is open are skipped.
+
+        Returns:
+            Tuple[str, str]: The content and the name of the tier that produced it.
+
+        Raises:
+            The last tier's error if it fails (CircuitOpenError if its breaker is open); the last tier's content is
+            returned even if not accepted.
+        """
+        for level, tier in enumerate(self.tiers):
+            last = level == len(self.tiers) - 1
+            breaker = get_breaker(f"llm.{tier.name}")
+            if not breaker.allow():
+                self.record(purpose, tier, 0.0, "circuit_open")
+                if last:
+                    raise CircuitOpenError(breaker.name, breaker.retry_in())
+                continue
+            with span("llm.tier", purpose=purpose, tier=tier.name, level=level) as s:
+                start = time.perf_counter()
+                try:
+                    content = tier.llm.invoke(messages).content
+                except Exception as e:
+                    breaker.record(time.perf_counter() - start, ok=False)
+                    self.record(purpose, tier, time.perf_counter() - start, "error")
+                    s.set_attributes(outcome="error", error=str(e))
+                    if last:
+                        raise
+                    print(f"{purpose}: {tier.name} failed ({e}), escalating to {self.tiers[level + 1].name}")
+                    continue
+                breaker.record(time.perf_counter() - start, ok=True)
+                outcome = "accepted" if accept(content) else "rejected"
+                self.record(purpose, tier, time.perf_counter() - start, outcome)
+                s.set_attribute("outcome", outcome)
+            if outcome == "accepted" or last:
+                return content, tier.name
+
+
+def cypher_model_ladder(provider: Optional[ModelProvider] = None) -> ModelLadder:
+    """The ladder used to generate Cypher and answer from the context (Config.CYPHER_MODEL_LADDER)."""
+    return ModelLadder(parse_ladder(Config.CYPHER_MODEL_LADDER), provider)
+
+
+def description_model_ladder(provider: Optional[ModelProvider] = None) -> ModelLadder:
+    """The ladder used to describe DataGuide paths in bulk (Config.DESCRIPTION_MODEL_LADDER)."""
+    return ModelLadder(parse_ladder(Config.DESCRIPTION_MODEL_LADDER), provider)
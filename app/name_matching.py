@@ -0,0 +1,39 @@
+"""
+Matching of the dataset names mentioned in a question, shared by the intent router (app/intent_router.py) and the
+dataset-scoped few-shot search (paths_vectorDB/partitions.py). Pure string matching, without imports from either.
+"""
+import re
+from typing import List, Optional, Tuple
+
+_STOPWORDS = {"a", "an", "the", "of", "in", "on", "for", "and", "or", "to", "with", "about", "is", "are", "what",
+              "which", "does", "do", "has", "have", "our", "dataset", "datasets", "named", "called", "titled", "me",
+              "give", "list", "show", "database", "this", "that", "info", "file", "files", "usually", "look", "it"}
+# Phrases introducing a dataset name: "dataset named X", "dataset about X", "in X dataset"
+_DATASET_PHRASE_RE = re.compile(r"datasets?\s*(?:named|called|titled|about|on)?\s*:?\s*(.+?)(?:\?|$|\bhas\b|\bhave\b)")
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _STOPWORDS]
+
+
+def resolve_dataset_name(question: str, names: List[str], min_overlap: float = 0.6) -> Tuple[Optional[str], float]:
+    """
+    The dataset among `names` a question refers to, with a confidence in [0, 1], or (None, 0.0). Exact
+    (case-insensitive) mentions win; otherwise the name sharing the most content words with the phrase after
+    "dataset named/about ..." is chosen, if it shares at least `min_overlap` of them and is a clear winner.
+    """
+    text = question.lower()
+    exact = [name for name in names if name.lower() in text]
+    if exact:
+        # the longest mention wins ("Test Dataset CNT 2" over "Test Dataset CNT")
+        return max(exact, key=len), 1.0
+    match = _DATASET_PHRASE_RE.search(text)
+    phrase = set(_tokens(match.group(1) if match else text))
+    if not phrase:
+        return None, 0.0
+    scored = sorted(((len(phrase & set(_tokens(name))) / len(phrase), name) for name in names), reverse=True)
+    if not scored or scored[0][0] < min_overlap:
+        return None, 0.0
+    if len(scored) > 1 and scored[1][0] >= scored[0][0]:
+        return None, 0.0  # ambiguous
+    return scored[0][1], scored[0][0]
@@ -1,4 +1,4 @@
-from app.main import process_query
+from app.warm_up import warm_up
 
 if __name__ == '__main__':
     print("This script is intended to be run before running streamlit app")
@@ -6,7 +6,8 @@ if __name__ == '__main__':
     print("This is useful for the first time setup or if the collection needs to be rebuilt.\n")
     print("Running pre-run script...")
     try:
-        process_query("What are the names of the datasets in our database?")
+        # creates and fills the few-shot collection if needed and checks every backend, without answering a question
+        warm_up()
         print("Pre-run script completed successfully.")
     except Exception as e:
-        print(f"ERROR: An error occurred while running the pre-run script: {e}")
\ No newline at end of file
+        print(f"ERROR: An error occurred while running the pre-run script: {e}")
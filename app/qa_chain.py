@@ -1,58 +1,286 @@
-import os
-from langchain.chains import GraphCypherQAChain
-from langchain_openai import ChatOpenAI
+import asyncio
 import time
+from typing import Dict, List, Optional
+
+from langchain.chains import GraphCypherQAChain
 
-from app.database_setup import setup_neo4j_graph
-from app.dataguide import extract_dataguide_paths, format_paths_for_llm
+from app.circuit_breaker import CircuitOpenError, get_breaker
+from app.config import Config
+from app.answer_synthesis import synthesize_answer
+from app.dataguide import dataguide_version, format_paths_for_llm
+from app.deadline import Deadline, DeadlineExceeded, deadline_scope
+from app.model_tiers import ModelLadder
 from app.prompt_generator import get_cypher_prompt_template
-from paths_vectorDB.main import get_similar_paths_from_milvus
+from app.resources import SharedResources
+from app.result_guard import result_guard
+from app.signal_store import answer_from_signal_store
+from app.llm_callbacks import CircuitBreakerCallbackHandler, LLMSpanCallbackHandler
+from app.tracing import span, metrics, write_prometheus_textfile
+from paths_vectorDB.main import local_few_shot_examples
 
 # Load environment variables
 from dotenv import load_dotenv
 
 
-def run_query(user_query: str, max_retries: int = 3):
+def run_query(user_query: str, max_retries: int = 3, resources: Optional[SharedResources] = None,
+              deadline_seconds: Optional[float] = None):
     """
     Executes a user query against a Neo4j graph database and returns the response.
 
-    This function sets up the Neo4j graph, extracts DataGuide paths, initializes the ChatOpenAI model,
-    refreshes the graph schema, generates a Cypher prompt template, performs a vector similarity search
-    using Milvus, and finally invokes the `GraphCypherQAChain` with the user query.
+    Synchronous entry point kept for existing callers (Streamlit, `app/main.py`). It is a thin wrapper that runs
+    `arun_query` on a fresh event loop, so it must not be called from inside a running event loop (use `arun_query`).
 
     Args:
         max_retries: number of times to retry the query in case of failure (default is 3).
         user_query (str): The query string provided by the user.
+        resources (SharedResources, optional): Shared graph/LLM clients and caches (see `app/resources.py`).
+                                               If None, fresh clients are created for this query.
+        deadline_seconds (float, optional): Time budget of the whole request. Defaults to
+                                            Config.QUERY_DEADLINE_SECONDS; 0 disables the deadline.
+
+    Returns:
+        dict: The response from the GraphCypherQAChain, including the query results and intermediate steps.
+    """
+    return asyncio.run(arun_query(user_query, max_retries, resources, deadline_seconds))
+
+
+async def arun_query(user_query: str, max_retries: int = 3, resources: Optional[SharedResources] = None,
+                     deadline_seconds: Optional[float] = None, prepared: Optional["PreparedSetup"] = None):
+    """
+    Async version of `run_query`.
+
+    This function sets up the Neo4j graph, extracts DataGuide paths, refreshes the graph schema and performs a vector
+    similarity search using Milvus, and finally invokes the `GraphCypherQAChain` with the user query.
+    DataGuide extraction, schema refresh and the few-shot retrieval (query embedding + Milvus search) do not depend
+    on each other, so they run concurrently with `asyncio.gather`: setup latency before the first LLM call is that of
+    the slowest of them rather than their sum.
+
+    Every stage runs under the request deadline (see `app/deadline.py`): awaited stages are cancelled when it
+    expires, Neo4j transactions and Milvus searches get the remaining time as their server-side timeout, and a
+    retry is only started if the remaining budget is expected to cover it. When time runs out, a partial response
+    is returned (answer_path "partial", with the best Cypher generated so far and any rows already fetched).
+
+    Args:
+        max_retries: number of times to retry the query in case of failure (default is 3).
+        user_query (str): The query string provided by the user.
+        resources (SharedResources, optional): Shared graph/LLM clients and caches (see `app/resources.py`).
+                                               If None, fresh clients are created for this query.
+        deadline_seconds (float, optional): Time budget of the whole request. Defaults to
+                                            Config.QUERY_DEADLINE_SECONDS; 0 disables the deadline.
+        prepared (PreparedSetup, optional): Setup already done for a batch of questions this one belongs to
+                                            (see `app/batch.py`); those stages are skipped.
 
     Returns:
         dict: The response from the GraphCypherQAChain, including the query results and intermediate steps.
     """
     load_dotenv()
 
-    # Initialize Neo4jGraph using environment variables
-    graph = setup_neo4j_graph()
+    try:
+        with deadline_scope(deadline_seconds) as deadline, \
+                span("run_query", user_query=user_query, max_retries=max_retries) as root_span:
+            response = await _arun_query(user_query, max_retries, resources, deadline, prepared)
+            outcome = "answered" if isinstance(response, dict) else "no_answer"
+            if isinstance(response, dict) and response.get("answer_path") == "partial":
+                outcome = "deadline_exceeded"
+            root_span.set_attribute("outcome", outcome)
+            return response
+    finally:
+        # refresh the Prometheus textfile (if configured) once the whole trace has been recorded
+        write_prometheus_textfile()
 
-    # Extract DataGuide paths
-    results = extract_dataguide_paths(graph)
-    formatted_paths = "\n".join(format_paths_for_llm(results))
 
-    # Initialize ChatOpenAI with API key and model
-    llm = ChatOpenAI(
-        model="o1-mini-2024-09-12",
-        temperature=1,
-        timeout=None,
-        max_retries=2,
-    )
+async def _check_dataguide_version(resources: SharedResources) -> None:
+    # a rebuilt or incrementally updated DataGuide (see app/dataguide_builder.py) drops the caches derived from the
+    # graph's content before their TTL; an unreachable graph is left to the stages that need it to report
+    if not resources.dataguide_version_due():
+        return
+    with span("dataguide.version_check") as s:
+        try:
+            version = await asyncio.to_thread(dataguide_version, resources.graph)
+        except Exception as e:
+            s.set_attribute("error", str(e))
+            return
+        s.set_attributes(version=version, changed=resources.observe_dataguide_version(version))
+
+
+async def _fetch_dataguide_paths(resources: SharedResources) -> str:
+    with span("dataguide.fetch") as s:
+        formatted_paths = resources.dataguide_cache.get()
+        s.set_attribute("cached", formatted_paths is not None)
+        if formatted_paths is not None:
+            return formatted_paths
+        results = await resources.dataguide_fetcher(resources.graph)
+        s.set_attribute("paths", len(results))
+        formatted_paths = "\n".join(format_paths_for_llm(results))
+        resources.dataguide_cache.set(formatted_paths)
+        return formatted_paths
+
+
+async def _refresh_schema(resources: SharedResources) -> None:
+    # Neo4jGraph has no async API; the schema refresh runs in a worker thread so it overlaps the other stages.
+    with span("schema.refresh") as s:
+        cached = resources.schema_is_fresh()
+        s.set_attribute("cached", cached)
+        if not cached:
+            await asyncio.to_thread(resources.graph.refresh_schema)
+            resources.mark_schema_refreshed()
+
+
+def _prepare_measured(filled: Optional[bool]) -> Optional[bool]:
+    # None: nothing was checked; a fill takes minutes and must not count as a slow `vector` call
+    return None if filled is None else not filled
+
+
+async def _prepare_few_shot_store(resources: SharedResources) -> None:
+    """
+    Makes the few-shot store searchable before the search, through the `vector` circuit breaker: a store that cannot
+    be reached opens it, so later questions skip both the checks and the search (CircuitOpenError).
+    """
+    if resources.few_shot_preparer is None:
+        return
+    with span("few_shot.prepare") as s:
+        filled = await get_breaker("vector").acall(asyncio.to_thread, resources.few_shot_preparer, resources.graph,
+                                                   measured=_prepare_measured)
+        s.set_attribute("filled", filled)
+
 
-    # Refresh schema to ensure it's up-to-date
-    graph.refresh_schema()
+async def _retrieve_few_shot_examples(resources: SharedResources, user_query: str, top_k: int = 5,
+                                      degraded: Optional[List[str]] = None) -> List[str]:
+    with span("few_shot.retrieve", top_k=top_k) as s:
+        try:
+            # an unavailable or slow vector store degrades the prompt instead of failing (or stalling) the question
+            await _prepare_few_shot_store(resources)
+            few_shot_examples = await get_breaker("vector").acall(
+                resources.few_shot_retriever, graph=resources.graph, user_query=user_query, top_k=top_k)
+        except Exception as e:
+            print(f"Vector store unavailable, using local few-shot examples: {e}")
+            metrics.increment("pipeline_degraded_total", backend="vector",
+                              reason="circuit_open" if isinstance(e, CircuitOpenError) else "error")
+            s.set_attributes(degraded=True, error=str(e))
+            few_shot_examples = local_few_shot_examples(user_query, top_k)
+            if degraded is not None:
+                degraded.append("vector")
+        s.set_attribute("examples", len(few_shot_examples))
+    print(f"****Time taken to conduct vector similarity search in vector DB: {s.duration:.2f} seconds")
+    return few_shot_examples
+
+
+def _partial_response(user_query: str, deadline: Deadline, reason: str, best_cypher: Optional[str],
+                      context_data: List, queries_and_errors: List) -> dict:
+    """The response returned when the deadline stops the request: whatever was produced so far."""
+    print(f"Deadline of {deadline.budget:.1f}s reached ({reason}), returning partial results")
+    if context_data:
+        result = (f"Ran out of time ({deadline.budget:g}s) before the answer was written. The query returned "
+                  f"the rows shown below.")
+    elif best_cypher:
+        result = (f"Ran out of time ({deadline.budget:g}s) before a query returned results. The best Cypher "
+                  f"generated so far is shown below; try rephrasing your question.")
+    else:
+        result = f"Ran out of time ({deadline.budget:g}s) before a Cypher query was generated. Please try again."
+    return {
+        "query": user_query,
+        "result": result,
+        "intermediate_steps": [{"query": best_cypher or ""}, {"context": context_data}],
+        "answer_path": "partial",
+        "partial": True,
+        "deadline_exceeded": reason,
+        "attempt_errors": [error for _, error in queries_and_errors],
+    }
+
+
+class PreparedSetup:
+    """
+    Setup stages done once for a batch of questions (see `app/batch.py`) instead of once per question: the schema
+    refresh and the few-shot retrieval (one batched embedding call and one multi-vector search). The DataGuide is
+    shared through the resources' cache.
+
+    Args:
+        few_shot_examples (Dict[str, List[str]]): Question -> its few-shot examples. Questions missing here (e.g.
+                                                  because the batch retrieval failed) retrieve their own.
+    """
+
+    def __init__(self, few_shot_examples: Dict[str, List[str]]):
+        self.few_shot_examples = few_shot_examples
+
+
+async def _run_setup_stages(resources: SharedResources, user_query: str, degraded: List[str],
+                            prepared: Optional[PreparedSetup] = None):
+    await _check_dataguide_version(resources)
+    if prepared is None:
+        return await asyncio.gather(
+            _fetch_dataguide_paths(resources),
+            _refresh_schema(resources),
+            _retrieve_few_shot_examples(resources, user_query, top_k=5, degraded=degraded),
+        )
+    few_shot_examples = prepared.few_shot_examples.get(user_query)
+    if few_shot_examples is None:
+        formatted_paths, few_shot_examples = await asyncio.gather(
+            _fetch_dataguide_paths(resources),
+            _retrieve_few_shot_examples(resources, user_query, top_k=5, degraded=degraded),
+        )
+    else:
+        formatted_paths = await _fetch_dataguide_paths(resources)
+    return formatted_paths, None, few_shot_examples
+
+
+def _select_tier(ladder: ModelLadder, level: int):
+    """
+    The tier for the `level`-th escalation whose circuit breaker lets a call through, preferring the next tiers up
+    and then the ones below. Raises CircuitOpenError when every model is unavailable.
+    """
+    preferred = ladder.tier(level)
+    start = ladder.tiers.index(preferred)
+    candidates = ladder.tiers[start:] + ladder.tiers[:start][::-1]
+    for tier in candidates:
+        breaker = get_breaker(f"llm.{tier.name}")
+        if breaker.allow():
+            if tier is not preferred:
+                print(f"Model {preferred.name} unavailable (circuit open), using {tier.name}")
+            return tier, breaker
+    # every breaker refused: raise for the preferred model (its check() could pass if it just became half-open)
+    breaker = get_breaker(f"llm.{preferred.name}")
+    breaker.check()
+    return preferred, breaker
+
+
+async def _arun_query(user_query: str, max_retries: int, resources: Optional[SharedResources],
+                      deadline: Deadline, prepared: Optional[PreparedSetup] = None):
+    if resources is None:
+        # Fresh clients for this query only. The graph is created without a schema refresh: it is refreshed below,
+        # concurrently with the rest of the setup.
+        resources = SharedResources(dataguide_cache_ttl=0, schema_cache_ttl=0)
+    graph = resources.graph
+
+    # Questions about EDF signal values are answered from the materialized arrays, without generating Cypher
+    if resources.signal_store is not None:
+        try:
+            signal_response = answer_from_signal_store(resources.signal_store, user_query)
+        except Exception as e:
+            # e.g. an unreadable array: Cypher generation may still answer
+            print(f"Signal store failed, falling back to Cypher generation: {e}")
+            signal_response = None
+        if signal_response is not None:
+            return signal_response
+
+    # backends this request ran without (e.g. "vector" when the few-shot examples came from the local file)
+    degraded: List[str] = []
+    try:
+        # Common question classes are answered with pre-written Cypher; low-confidence ones go on to Cypher generation
+        if resources.intent_router is not None:
+            routed_response = await deadline.run(
+                "router", asyncio.to_thread(resources.intent_router.answer, user_query))
+            if routed_response is not None:
+                return routed_response
+
+        # DataGuide paths, fresh schema and few-shot examples are independent of each other
+        with span("setup.parallel"):
+            formatted_paths, _, few_shot_examples = await deadline.run(
+                "setup", _run_setup_stages(resources, user_query, degraded, prepared))
+    except DeadlineExceeded as e:
+        return _partial_response(user_query, deadline, e.stage, None, [], [])
 
     # Get Cypher prompt template
     chat_prompt = get_cypher_prompt_template()
-    start_time = time.time()
-    few_shot_examples = get_similar_paths_from_milvus(graph=graph, user_query=user_query, top_k=5)
-    end_time = time.time()
-    print(f"****Time taken to conduct vector similarity search in vector DB: {end_time - start_time:.2f} seconds")
 
     # Create a partial prompt with schema and dataguide_paths filled in. user_query will be filled in later from user query.
     partial_prompt = chat_prompt.partial(
@@ -64,93 +292,144 @@ def run_query(user_query: str, max_retries: int = 3):
     retry_count = 0
     queries_and_errors = []
     enhanced_query = user_query
+    llm_callbacks = [LLMSpanCallbackHandler()]
+    best_cypher = None
+    attempt_durations: List[float] = []
 
     while retry_count <= max_retries:
-        try:
-            # Create a fresh chain for each attempt
-            chain = GraphCypherQAChain.from_llm(
-                cypher_prompt=partial_prompt,
-                llm=llm,
-                graph=graph,
-                verbose=True,
-                validate_query=True,
-                include_run_info=True,
-                return_intermediate_steps=True,
-                allow_dangerous_requests=True,  # only use this in development NOT IN PRODUCTION
-            )
-
-            # If errors occurred on previous attempts, append error history to form an enhanced query.
-            if queries_and_errors:
-                error_history = "\n".join(
-                    [f"Tried: {q}\nError: {e}" for q, e in queries_and_errors]
-                )
-                enhanced_query = (
-                    f"{user_query}\n\nPreviously I tried these queries with these errors:\n"
-                    f"{error_history}\n\nDon't make the same mistakes."
+        # Only start another round of LLM + Neo4j calls if the remaining budget is expected to cover it
+        expected = max(sum(attempt_durations) / len(attempt_durations) if attempt_durations else 0.0,
+                       Config.QUERY_MIN_ATTEMPT_SECONDS)
+        if retry_count > 0 and not deadline.allows(expected):
+            metrics.increment("pipeline_deadline_exceeded_total", stage="retry_budget")
+            return _partial_response(user_query, deadline, "retry_budget", best_cypher, [], queries_and_errors)
+        # every failed attempt (error, invalid Cypher or empty context) moves one tier up the model ladder
+        tier, llm_breaker = _select_tier(resources.model_ladder, retry_count)
+        llm = tier.llm
+        attempt_callbacks = llm_callbacks + [CircuitBreakerCallbackHandler(llm_breaker)]
+        tier_start = time.perf_counter()
+        context_data = []
+        with span("qa.attempt", attempt=retry_count + 1, tier=tier.name) as attempt:
+            try:
+                # Create a fresh chain for each attempt
+                chain = GraphCypherQAChain.from_llm(
+                    cypher_prompt=partial_prompt,
+                    llm=llm,
+                    graph=graph,
+                    verbose=True,
+                    validate_query=True,
+                    include_run_info=True,
+                    return_intermediate_steps=True,
+                    # return the rows instead of answering; the answer step below works on the guarded rows
+                    return_direct=True,
+                    top_k=Config.RESULT_MAX_ROWS,
+                    allow_dangerous_requests=True,  # only use this in development NOT IN PRODUCTION
                 )
 
-            # Invoke the chain with the enhanced query.
-            print("\n****************\nEnhanced Query:\n", enhanced_query)
-            response = chain.invoke(enhanced_query)
-
-            # Extract intermediate steps and generated cypher query when present.
-            intermediate_steps = response.get("intermediate_steps", [])
-            context_data = []
-            generated_cypher = None
-            answer_by_llm = None
-            # retrieve the context and generated cypher query from the intermediate steps.
-            for step in intermediate_steps:
-                if "context" in step:
-                    context_data = step["context"]
-                    break
-            if intermediate_steps and not generated_cypher:
-                if "query" in intermediate_steps[0]:
-                    generated_cypher = intermediate_steps[0]["query"]
-                    # Remove leading "cypher\n" if present.
-                    if generated_cypher.startswith("cypher\n"):
-                        generated_cypher = generated_cypher.replace("cypher\n", "")
-            if response:
-                answer_by_llm = response.get("result")
-
-            # Boolean check to see if we have a valid answer: no context = invalid or don't know response = invalid.
-            is_invalid_response = (
-                    not context_data or
-                    (answer_by_llm and any(phrase in answer_by_llm.lower() for phrase in
-                                           ["don't know", "dont know", "do not know", "no result", "not sure",
-                                            "cannot find", "can't find", "unable to"]))
-            )
-
-            # Retry if context is empty.
-            if is_invalid_response:
-                # add the generated cypher query and error message to the queries_and_errors list.
-                error_msg = f"Empty context returned. Generated cypher: {generated_cypher if generated_cypher else 'No query generated'}"
-                queries_and_errors.append((enhanced_query, error_msg))
-                retry_count += 1
+                # If errors occurred on previous attempts, append error history to form an enhanced query.
+                if queries_and_errors:
+                    error_history = "\n".join(
+                        [f"Tried: {q}\nError: {e}" for q, e in queries_and_errors]
+                    )
+                    enhanced_query = (
+                        f"{user_query}\n\nPreviously I tried these queries with these errors:\n"
+                        f"{error_history}\n\nDon't make the same mistakes."
+                    )
 
-                if retry_count > max_retries:
-                    raise Exception(f"Failed after {max_retries} attempts. Last error: {error_msg}")
+                # Invoke the chain with the enhanced query.
+                print("\n****************\nEnhanced Query:\n", enhanced_query)
+                # Rows are streamed from Neo4j and capped (see app/result_guard.py)
+                with result_guard() as guard:
+                    response = await deadline.run(
+                        "qa.attempt", chain.ainvoke(enhanced_query, config={"callbacks": attempt_callbacks}))
+
+                # Extract intermediate steps and generated cypher query when present.
+                intermediate_steps = response.get("intermediate_steps", [])
+                # with return_direct=True the chain's result is the context itself
+                context_data = response.get("result") or []
+                generated_cypher = None
+                answer_by_llm = None
+                if intermediate_steps and not generated_cypher:
+                    if "query" in intermediate_steps[0]:
+                        generated_cypher = intermediate_steps[0]["query"]
+                        # Remove leading "cypher\n" if present.
+                        if generated_cypher.startswith("cypher\n"):
+                            generated_cypher = generated_cypher.replace("cypher\n", "")
+                        best_cypher = generated_cypher
+                if context_data:
+                    # simple result shapes are rendered directly, the rest goes to the QA LLM
+                    answer = await deadline.run("qa.answer",
+                                                synthesize_answer(llm, user_query, context_data, attempt_callbacks))
+                    answer_by_llm = answer.text
+                    response["answer_path"] = answer.path
+                    response["result_shape"] = answer.shape
+                    if answer.context_encoding:
+                        response["context_encoding"] = answer.context_encoding
+                # keep the response shape GraphCypherQAChain produces without return_direct
+                response["result"] = answer_by_llm
+                intermediate_steps.append({"context": context_data})
+                response["result_stats"] = guard.stats.to_dict()
 
-                # Update enhanced query with the generated cypher query.
-                enhanced_query = (
-                    f"{user_query}\n\nPreviously I tried this generated cypher query: {generated_cypher} but it gave me no results. Don't make the same mistake. Take a careful look at dataguide and schema again to ensure you aren't making up paths and following the right sequence\n"
+                # Boolean check to see if we have a valid answer: no context = invalid or don't know response = invalid.
+                is_invalid_response = (
+                        not context_data or
+                        (answer_by_llm and any(phrase in answer_by_llm.lower() for phrase in
+                                               ["don't know", "dont know", "do not know", "no result", "not sure",
+                                                "cannot find", "can't find", "unable to"]))
                 )
-                time.sleep(1)
-                continue
+                attempt.set_attributes(generated_cypher=generated_cypher, context_rows=len(context_data),
+                                       total_rows=guard.stats.total_rows, truncated=guard.stats.truncated,
+                                       outcome="empty_context" if is_invalid_response else "answered")
+                ModelLadder.record("cypher", tier, time.perf_counter() - tier_start,
+                                   "empty_context" if is_invalid_response else "answered")
+                attempt_durations.append(time.perf_counter() - tier_start)
 
-            return response
+                # Retry if context is empty.
+                if is_invalid_response:
+                    # add the generated cypher query and error message to the queries_and_errors list.
+                    error_msg = f"Empty context returned. Generated cypher: {generated_cypher if generated_cypher else 'No query generated'}"
+                    queries_and_errors.append((enhanced_query, error_msg))
+                    retry_count += 1
 
-        except Exception as e:
-            retry_count += 1
-            error_msg = str(e)
-            queries_and_errors.append((enhanced_query, error_msg))
-            print(
-                f"Query failed (attempt {retry_count}/{max_retries})"
-            )
+                    if retry_count > max_retries:
+                        raise Exception(f"Failed after {max_retries} attempts. Last error: {error_msg}")
 
-            if retry_count > max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {error_msg}")
+                    # Update enhanced query with the generated cypher query.
+                    enhanced_query = (
+                        f"{user_query}\n\nPreviously I tried this generated cypher query: {generated_cypher} but it gave me no results. Don't make the same mistake. Take a careful look at dataguide and schema again to ensure you aren't making up paths and following the right sequence\n"
+                    )
+                    await asyncio.sleep(1)
+                    continue
 
-            time.sleep(1)
+                response["model_tier"] = tier.name
+                if degraded:
+                    response["degraded"] = degraded
+                return response
+
+            except DeadlineExceeded as e:
+                attempt.set_attributes(outcome="deadline_exceeded")
+                ModelLadder.record("cypher", tier, time.perf_counter() - tier_start, "deadline_exceeded")
+                return _partial_response(user_query, deadline, e.stage, best_cypher, context_data,
+                                         queries_and_errors)
+            except Exception as e:
+                attempt_durations.append(time.perf_counter() - tier_start)
+                # the "Failed after N attempts" raised for a final empty context was recorded as such above
+                if attempt.attributes.get("outcome") != "empty_context":
+                    ModelLadder.record("cypher", tier, time.perf_counter() - tier_start, "error")
+                retry_count += 1
+                error_msg = str(e)
+                queries_and_errors.append((enhanced_query, error_msg))
+                attempt.status = "error"
+                attempt.set_attributes(outcome="error", error=error_msg)
+                print(
+                    f"Query failed (attempt {retry_count}/{max_retries})"
+                )
+
+                if retry_count > max_retries:
+                    raise Exception(f"Failed after {max_retries} attempts. Last error: {error_msg}")
+
+                await asyncio.sleep(1)
 
     # return default response if all retries fail.
     return "Sorry, I couldn't find an answer to your question. Please try rephrasing your query"
+
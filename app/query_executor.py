@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from app.config import Config
+from app.tracing import metrics
+
+
+class QueueFullError(Exception):
+    """Raised by FairQueryExecutor.submit() when the admission queue is full."""
+
+
+def normalize_question(question: str) -> str:
+    """Key used to coalesce identical questions: case-insensitive, whitespace-collapsed."""
+    return " ".join(question.lower().split())
+
+
+class _Job:
+    def __init__(self, key: str, question: str, user_id: str):
+        self.key = key
+        self.question = question
+        self.user_id = user_id  # user whose queue holds the job (the first submitter)
+        self.future: Future = Future()
+        self.running = False
+
+
+class QueryTicket:
+    """
+    Handle returned by FairQueryExecutor.submit(). Several tickets share one job when identical questions are
+    in flight at the same time (single-flight).
+    """
+
+    def __init__(self, executor: "FairQueryExecutor", job: _Job, coalesced: bool):
+        self._executor = executor
+        self._job = job
+        self.coalesced = coalesced  # True if this ticket joined an execution started by another submit
+
+    @property
+    def question(self) -> str:
+        return self._job.question
+
+    def position(self) -> int:
+        """0 when the query is running (or finished), otherwise the 1-based position in the global queue."""
+        return self._executor.queue_position(self._job)
+
+    def done(self) -> bool:
+        return self._job.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """Blocks until the query finishes and returns its response (re-raises the query's exception)."""
+        return self._job.future.result(timeout)
+
+    def add_done_callback(self, fn: Callable[["QueryTicket"], None]) -> None:
+        """Calls fn(ticket) from the worker thread that finishes the query (at once if it already finished)."""
+        self._job.future.add_done_callback(lambda _: fn(self))
+
+
+class FairQueryExecutor:
+    """
+    Process-wide, bounded pool of worker threads that runs queries with per-user fairness.
+
+    - At most `max_workers` queries run at the same time, so a burst of users cannot open a burst of parallel LLM
+      calls and Neo4j sessions.
+    - Every user has their own FIFO queue and workers take jobs round-robin across users, so one user submitting
+      many questions cannot starve the others.
+    - At most `max_queue` jobs wait at a time; further submits raise QueueFullError (admission control).
+    - Identical questions (see normalize_question()) that are queued or running are coalesced into one execution.
+
+    Args:
+        run_fn (Callable[[str], Any]): Function that answers one question, e.g. app.main.process_query.
+        max_workers (int, optional): Number of queries executed concurrently. Defaults to Config.QUERY_MAX_CONCURRENCY.
+        max_queue (int, optional): Maximum number of waiting queries. Defaults to Config.QUERY_MAX_QUEUE.
+    """
+
+    def __init__(self, run_fn: Callable[[str], Any], max_workers: Optional[int] = None,
+                 max_queue: Optional[int] = None):
+        self._run_fn = run_fn
+        self._max_workers = max_workers or Config.QUERY_MAX_CONCURRENCY
+        self._max_queue = max_queue or Config.QUERY_MAX_QUEUE
+        self._lock = threading.Condition()
+        self._user_queues: "OrderedDict[str, Deque[_Job]]" = OrderedDict()  # round-robin order of users
+        self._inflight: Dict[str, _Job] = {}
+        self._queued = 0
+        self._running = 0
+        self._shutdown = False
+        self._workers: List[threading.Thread] = []
+        for i in range(self._max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"query-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, user_id: str, question: str) -> QueryTicket:
+        key = normalize_question(question)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                metrics.increment("query_executor_coalesced_total")
+                return QueryTicket(self, job, coalesced=True)
+            if self._queued >= self._max_queue:
+                metrics.increment("query_executor_rejected_total")
+                raise QueueFullError(f"Too many queued questions ({self._queued}). Please try again shortly.")
+            job = _Job(key, question, user_id)
+            self._inflight[key] = job
+            self._user_queues.setdefault(user_id, deque()).append(job)
+            self._queued += 1
+            self._update_gauges()
+            self._lock.notify()
+            return QueryTicket(self, job, coalesced=False)
+
+    def queue_position(self, job: _Job) -> int:
+        with self._lock:
+            if job.running or job.future.done():
+                return 0
+            for position, queued_job in enumerate(self._round_robin_order(), start=1):
+                if queued_job is job:
+                    return position
+            return 0
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._shutdown = True
+            self._lock.notify_all()
+
+    def _round_robin_order(self) -> List[_Job]:
+        """The order in which queued jobs will be picked: one job per user per round, users in arrival order."""
+        order: List[_Job] = []
+        queues = [list(q) for q in self._user_queues.values()]
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            order.extend(q[depth] for q in queues if depth < len(q))
+            depth += 1
+        return order
+
+    def _next_job(self) -> _Job:
+        # caller holds the lock; take the head of the first user's queue and move that user to the back
+        user_id, queue = next(iter(self._user_queues.items()))
+        job = queue.popleft()
+        del self._user_queues[user_id]
+        if queue:
+            self._user_queues[user_id] = queue
+        self._queued -= 1
+        return job
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._user_queues and not self._shutdown:
+                    self._lock.wait()
+                if self._shutdown:
+                    return
+                job = self._next_job()
+                job.running = True
+                self._running += 1
+                self._update_gauges()
+            try:
+                job.future.set_result(self._run_fn(job.question))
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(job.key, None)
+                    self._running -= 1
+                    self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("query_executor_queued", self._queued)
+        metrics.set_gauge("query_executor_running", self._running)
@@ -0,0 +1,153 @@
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import Config
+from app.dataguide import DataGuideCache, aextract_dataguide_paths
+from app.model_tiers import ModelLadder, cypher_model_ladder
+
+if TYPE_CHECKING:
+    from app.intent_router import IntentRouter
+    from app.signal_store import SignalStore
+
+# The Neo4j, LangChain, Milvus and NumPy backed defaults are imported when an instance is created, so that importing
+# this module (e.g. from streamlit_app.py or app/service.py) stays fast.
+
+# async (graph, user_query, top_k) -> few-shot example strings
+FewShotRetriever = Callable[..., Awaitable[List[str]]]
+# async (graph, user_queries, top_k) -> few-shot example strings of each query
+BatchFewShotRetriever = Callable[..., Awaitable[List[List[str]]]]
+# (graph) -> makes the few-shot store searchable (creates, fills and indexes it if needed); blocking. Returns None if
+# it did not reach the store, True if it filled it (a slow call that says nothing about the store), False otherwise
+FewShotPreparer = Callable[[Any], Optional[bool]]
+# async (graph) -> raw DataGuide path records, as returned by extract_dataguide_paths()
+DataGuideFetcher = Callable[[Any], Awaitable[List[Dict[str, Any]]]]
+
+
+async def fetch_dataguide_with_async_driver(graph: Any) -> List[Dict[str, Any]]:
+    """Default DataGuideFetcher: awaits the DataGuide query on a short-lived async Neo4j driver."""
+    from app.database_setup import setup_async_neo4j_driver
+
+    driver = setup_async_neo4j_driver()
+    try:
+        return await aextract_dataguide_paths(driver)
+    finally:
+        await driver.close()
+
+
+class SharedResources:
+    """
+    Clients and caches shared by every query in the process instead of being rebuilt for each question:
+    the Neo4j graph handle (and its driver connection pool), the Cypher-generating LLM clients and the DataGuide and
+    schema caches.
+
+    Pass an instance to `run_query`/`process_query` through their `resources` argument. Streamlit keeps a single
+    instance per server process through `st.cache_resource`.
+
+    Every dependency can be replaced, which is how the offline benchmarks (`benchmarks/`) run the real pipeline
+    against local stand-ins.
+
+    Args:
+        graph (optional): Object implementing the Neo4jGraph `query`/`refresh_schema`/`schema` subset.
+        llm (optional): LangChain chat model used for Cypher generation and answering, as a single-tier ladder.
+        model_ladder (ModelLadder, optional): Chat models tried fastest first, escalating after a failed attempt.
+                                              Defaults to cypher_model_ladder() (Config.CYPHER_MODEL_LADDER),
+                                              or to `llm` alone when it is given.
+        few_shot_retriever (FewShotRetriever, optional): Defaults to paths_vectorDB.main.aget_similar_paths_from_milvus.
+        batch_few_shot_retriever (BatchFewShotRetriever, optional): Retrieves the examples of a whole batch of
+                                                                    questions at once (see app/batch.py). Defaults
+                                                                    to paths_vectorDB.main.aget_similar_paths_for_queries
+                                                                    unless `few_shot_retriever` is given, in which
+                                                                    case batches retrieve per question.
+        few_shot_preparer (FewShotPreparer, optional): Run before each retrieval, through the `vector` circuit
+                                                       breaker; its failures count, the duration of a collection
+                                                       fill does not. Defaults to
+                                                       paths_vectorDB.main.prepare_collection_for_search unless
+                                                       `few_shot_retriever` is given.
+        dataguide_fetcher (DataGuideFetcher, optional): Defaults to fetch_dataguide_with_async_driver.
+        dataguide_cache_ttl (float, optional): Seconds the formatted DataGuide is cached.
+                                               Defaults to Config.DATAGUIDE_CACHE_TTL_SECONDS.
+        schema_cache_ttl (float, optional): Seconds a refreshed graph schema is reused before it is refreshed again.
+                                            Defaults to Config.SCHEMA_CACHE_TTL_SECONDS.
+        signal_store (SignalStore, optional): Materialized EDF signals answering signal questions without Cypher.
+                                              Defaults to one on Config.SIGNAL_STORE_DIR if Config.SIGNAL_STORE_ENABLED.
+        intent_router (IntentRouter, optional): Answers common question classes with pre-written Cypher.
+                                                Defaults to one on `graph` if Config.ROUTER_ENABLED.
+    """
+
+    def __init__(self, graph: Any = None, llm: Any = None, few_shot_retriever: Optional[FewShotRetriever] = None,
+                 dataguide_fetcher: Optional[DataGuideFetcher] = None, dataguide_cache_ttl: Optional[float] = None,
+                 signal_store: Optional["SignalStore"] = None, intent_router: Optional["IntentRouter"] = None,
+                 model_ladder: Optional[ModelLadder] = None,
+                 batch_few_shot_retriever: Optional[BatchFewShotRetriever] = None,
+                 schema_cache_ttl: Optional[float] = None, few_shot_preparer: Optional[FewShotPreparer] = None):
+        if graph is None:
+            from app.database_setup import setup_neo4j_graph
+
+            graph = setup_neo4j_graph(refresh_schema=False)
+        self.graph = graph
+        if model_ladder is None:
+            model_ladder = ModelLadder.single(llm) if llm is not None else cypher_model_ladder()
+        self.model_ladder = model_ladder
+        if few_shot_retriever is None:
+            from paths_vectorDB.main import (aget_similar_paths_for_queries, aget_similar_paths_from_milvus,
+                                             prepare_collection_for_search)
+
+            few_shot_retriever = aget_similar_paths_from_milvus
+            batch_few_shot_retriever = batch_few_shot_retriever or aget_similar_paths_for_queries
+            few_shot_preparer = few_shot_preparer or prepare_collection_for_search
+        self.few_shot_retriever = few_shot_retriever
+        self.batch_few_shot_retriever = batch_few_shot_retriever
+        self.few_shot_preparer = few_shot_preparer
+        self.dataguide_fetcher = dataguide_fetcher or fetch_dataguide_with_async_driver
+        if dataguide_cache_ttl is None:
+            dataguide_cache_ttl = Config.DATAGUIDE_CACHE_TTL_SECONDS
+        self.dataguide_cache = DataGuideCache(dataguide_cache_ttl)
+        self.schema_cache_ttl = Config.SCHEMA_CACHE_TTL_SECONDS if schema_cache_ttl is None else schema_cache_ttl
+        self._schema_refreshed_at: Optional[float] = None
+        self._dataguide_version: Optional[int] = None
+        self._dataguide_version_checked_at: Optional[float] = None
+        if signal_store is None and Config.SIGNAL_STORE_ENABLED:
+            from app.signal_store import SignalStore
+
+            signal_store = SignalStore()
+        self.signal_store = signal_store
+        if intent_router is None and Config.ROUTER_ENABLED:
+            from app.intent_router import IntentRouter, NameResolver
+
+            # shares the DataGuide TTL: dataset names change only when data is ingested
+            intent_router = IntentRouter(self.graph, resolver=NameResolver(self.graph, dataguide_cache_ttl))
+        self.intent_router = intent_router
+
+    def schema_is_fresh(self) -> bool:
+        """True if `graph.schema` was refreshed less than `schema_cache_ttl` seconds ago."""
+        refreshed_at = self._schema_refreshed_at
+        return refreshed_at is not None and time.monotonic() - refreshed_at < self.schema_cache_ttl
+
+    def mark_schema_refreshed(self) -> None:
+        self._schema_refreshed_at = time.monotonic()
+
+    def dataguide_version_due(self) -> bool:
+        """True if the DataGuide version should be checked: something is cached and the last check is old enough."""
+        if self.dataguide_cache.ttl_seconds <= 0 and self.schema_cache_ttl <= 0:
+            return False
+        checked_at = self._dataguide_version_checked_at
+        return checked_at is None or time.monotonic() - checked_at >= Config.DATAGUIDE_VERSION_CHECK_SECONDS
+
+    def observe_dataguide_version(self, version: Optional[int]) -> bool:
+        """
+        Records the DataGuide version read from the graph. When it differs from the last one seen, the caches derived
+        from the graph's content (DataGuide, schema, the intent router's dataset names) are dropped.
+
+        Returns:
+            bool: True if the caches were dropped.
+        """
+        self._dataguide_version_checked_at = time.monotonic()
+        previous, self._dataguide_version = self._dataguide_version, version
+        if previous is None or version is None or version == previous:
+            return False
+        print(f"DataGuide version changed ({previous} -> {version}), dropping cached DataGuide and schema")
+        self.dataguide_cache.invalidate()
+        self._schema_refreshed_at = None
+        if self.intent_router is not None:
+            self.intent_router.resolver.invalidate()
+        return True
@@ -0,0 +1,98 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.config import Config
+
+# Guard active for graph queries issued in this context (set by run_query around Cypher execution only, so internal
+# queries such as DataGuide extraction or random path sampling are never truncated).
+_active_guard: ContextVar[Optional["ResultGuard"]] = ContextVar("active_result_guard", default=None)
+
+
+class ResultStats:
+    """Size information about one guarded Cypher result."""
+
+    def __init__(self):
+        self.rows_returned = 0
+        self.bytes_returned = 0
+        self.total_rows = 0  # exact when total_is_exact, otherwise a lower bound
+        self.total_is_exact = True
+        self.truncated = False
+        self.truncated_reason: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows_returned": self.rows_returned,
+            "bytes_returned": self.bytes_returned,
+            "total_rows": self.total_rows,
+            "total_is_exact": self.total_is_exact,
+            "truncated": self.truncated,
+            "truncated_reason": self.truncated_reason,
+        }
+
+
+class ResultGuard:
+    """
+    Caps how much of a Cypher result is materialized. Rows are consumed one by one from the Neo4j driver (which
+    fetches them from the server in batches) and collection stops at `max_rows` rows or `max_bytes` of JSON-encoded
+    rows, whichever comes first. Past the cap, remaining records are only counted (not converted or stored) up to
+    `count_limit` so the total stays exact when that is cheap; beyond it the rest of the result is discarded on the
+    server and the total is reported as a lower bound.
+
+    Args:
+        max_rows (int, optional): Maximum rows kept. Defaults to Config.RESULT_MAX_ROWS.
+        max_bytes (int, optional): Maximum JSON-encoded size of the kept rows. Defaults to Config.RESULT_MAX_BYTES.
+        count_limit (int, optional): Maximum rows counted for an exact total. Defaults to Config.RESULT_COUNT_LIMIT.
+    """
+
+    def __init__(self, max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                 count_limit: Optional[int] = None):
+        self.max_rows = max_rows or Config.RESULT_MAX_ROWS
+        self.max_bytes = max_bytes or Config.RESULT_MAX_BYTES
+        self.count_limit = count_limit or Config.RESULT_COUNT_LIMIT
+        self.stats = ResultStats()  # stats of the most recent consume()
+
+    def consume(self, records: Iterable[Any], sanitize: Optional[Callable[[Any], Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Consumes neo4j Records from `records` and returns the kept rows as dictionaries (like Neo4jGraph.query()).
+        The caller should call `result.consume()` afterwards to discard whatever was not read.
+        """
+        stats = ResultStats()
+        rows: List[Dict[str, Any]] = []
+        for record in records:
+            stats.total_rows += 1
+            if stats.truncated:
+                if stats.total_rows >= self.count_limit:
+                    stats.total_is_exact = False
+                    break
+                continue
+            row = record.data()
+            if sanitize:
+                row = sanitize(row)
+            row_bytes = len(json.dumps(row, default=str))
+            if stats.rows_returned >= self.max_rows or stats.bytes_returned + row_bytes > self.max_bytes:
+                stats.truncated = True
+                stats.truncated_reason = "max_rows" if stats.rows_returned >= self.max_rows else "max_bytes"
+                continue
+            rows.append(row)
+            stats.rows_returned += 1
+            stats.bytes_returned += row_bytes
+        self.stats = stats
+        return rows
+
+
+@contextmanager
+def result_guard(max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                 count_limit: Optional[int] = None) -> Iterator[ResultGuard]:
+    """Activates a ResultGuard for graph queries issued inside the `with` block."""
+    guard = ResultGuard(max_rows, max_bytes, count_limit)
+    token = _active_guard.set(guard)
+    try:
+        yield guard
+    finally:
+        _active_guard.reset(token)
+
+
+def active_result_guard() -> Optional[ResultGuard]:
+    return _active_guard.get()
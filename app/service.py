@@ -0,0 +1,305 @@
+"""
+Long-running HTTP/JSON query service. One process holds all warm state (graph handle and schema, DataGuide,
+chat model clients, the few-shot collection checks and the worker pool) and answers questions through the same
+FairQueryExecutor the Streamlit app uses, so it can be scaled horizontally behind a load balancer.
+
+Endpoints:
+    POST /query         {"question": "...", "user_id": "..."} -> the response of process_query() as JSON.
+                        429 when the queue is full, 503 while the service is warming up.
+    POST /query/stream  Same body; newline-delimited JSON events: "queued" (queue position), "started",
+                        "stage" (each finished pipeline stage) and finally "result" or "error".
+    GET  /health        200 once warm (503 while warming up), with circuit breaker states and queue sizes.
+    GET  /metrics       Stage latencies and counters in Prometheus text format.
+
+Usage (from the repository root):
+    python -m app.service --port 8080
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from app.circuit_breaker import breaker_states
+from app.config import Config
+from app.main import process_query
+from app.query_executor import FairQueryExecutor, QueryTicket, QueueFullError, normalize_question
+from app.resources import SharedResources
+from app.tracing import Span, add_span_exporter, metrics, remove_span_exporter, span
+from app.warm_up import warm_up
+
+# Seconds between warm-up attempts while a backend is unreachable at startup
+WARM_UP_RETRY_SECONDS = 10
+# Seconds between queue position checks of a streaming request
+STREAM_POLL_SECONDS = 0.25
+
+
+class QueryService:
+    """
+    The warm state of a service process and the questions it is answering.
+
+    Args:
+        resources (SharedResources, optional): Shared clients and caches. Created by warm_up() if not given.
+        max_workers (int, optional): Questions answered concurrently. Defaults to Config.QUERY_MAX_CONCURRENCY.
+        max_queue (int, optional): Questions waiting at most. Defaults to Config.QUERY_MAX_QUEUE.
+    """
+
+    def __init__(self, resources: Optional[SharedResources] = None, max_workers: Optional[int] = None,
+                 max_queue: Optional[int] = None):
+        self.resources = resources
+        self.executor = FairQueryExecutor(run_fn=self._answer, max_workers=max_workers, max_queue=max_queue)
+        self.ready = False
+        self.warm_up_error: Optional[str] = None
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        # trace id of a running execution -> normalized question, and question -> stage listeners
+        self._trace_questions: Dict[str, str] = {}
+        self._listeners: Dict[str, List[Callable[[Span], None]]] = defaultdict(list)
+
+    def start(self) -> None:
+        """Starts forwarding stages to streaming requests and warms up in a background thread."""
+        add_span_exporter(self._export_span)
+        threading.Thread(target=self._warm_up_until_ready, name="service-warm-up", daemon=True).start()
+
+    def close(self) -> None:
+        remove_span_exporter(self._export_span)
+        self.executor.shutdown()
+
+    def warm_up(self) -> None:
+        """Builds the state every question needs before the first one arrives (see app/warm_up.py)."""
+        self.resources = warm_up(self.resources)
+        self.ready = True
+        self.warm_up_error = None
+
+    def _warm_up_until_ready(self) -> None:
+        while True:
+            try:
+                self.warm_up()
+                print(f"Query service warm after {time.time() - self.started_at:.1f}s")
+                if Config.FEW_SHOT_VERIFY_INTERVAL_SECONDS > 0:
+                    from paths_vectorDB.stale_paths import start_verifier
+
+                    start_verifier(self.resources.graph)
+                return
+            except Exception as e:
+                self.warm_up_error = str(e) or type(e).__name__
+                print(f"Warm-up failed, retrying in {WARM_UP_RETRY_SECONDS}s: {self.warm_up_error}")
+                time.sleep(WARM_UP_RETRY_SECONDS)
+
+    def submit(self, user_id: str, question: str) -> QueryTicket:
+        return self.executor.submit(user_id, question)
+
+    def _answer(self, question: str) -> Any:
+        # executor worker: the root span's trace id tells _export_span() which question a finished stage belongs to
+        with span("service.query") as root:
+            with self._lock:
+                self._trace_questions[root.trace_id] = normalize_question(question)
+            try:
+                return process_query(question, resources=self.resources)
+            finally:
+                with self._lock:
+                    self._trace_questions.pop(root.trace_id, None)
+
+    def listen(self, question: str, listener: Callable[[Span], None]) -> Callable[[], None]:
+        """
+        Calls listener(span) from the worker thread for every stage finished while `question` (or an identical
+        question it is coalesced with) is answered. Returns the function that stops listening.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._listeners[key].append(listener)
+
+        def stop() -> None:
+            with self._lock:
+                listeners = self._listeners.get(key, [])
+                if listener in listeners:
+                    listeners.remove(listener)
+                if not listeners:
+                    self._listeners.pop(key, None)
+        return stop
+
+    def _export_span(self, span_obj: Span) -> None:
+        with self._lock:
+            key = self._trace_questions.get(span_obj.trace_id)
+            listeners = list(self._listeners.get(key, ())) if key is not None else []
+        for listener in listeners:
+            listener(span_obj)
+
+    def health(self) -> Dict[str, Any]:
+        snapshot = metrics.snapshot()["gauges"]
+        return {
+            "status": "ok" if self.ready else "warming_up",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "warm_up_error": self.warm_up_error,
+            "queued": snapshot.get("query_executor_queued", 0),
+            "running": snapshot.get("query_executor_running", 0),
+            "circuit_breakers": breaker_states(),
+        }
+
+
+SERVICE_KEY = web.AppKey("service", QueryService)
+
+
+def _json_response(body: Any, status: int = 200) -> web.Response:
+    return web.Response(text=json.dumps(body, default=str), status=status, content_type="application/json")
+
+
+def _as_response_dict(response: Any) -> Dict[str, Any]:
+    # run_query() answers a few failures with a plain message instead of a response dict
+    return response if isinstance(response, dict) else {"result": str(response)}
+
+
+def _stage_event(span_obj: Span) -> Dict[str, Any]:
+    return {"event": "stage", "stage": span_obj.name, "status": span_obj.status,
+            "duration": round(span_obj.duration or 0.0, 3)}
+
+
+async def _read_question(request: web.Request) -> Tuple[str, str]:
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be JSON"}), content_type="application/json")
+    question = body.get("question") if isinstance(body, dict) else None
+    if not isinstance(question, str) or not question.strip():
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Missing 'question'"}), content_type="application/json")
+    # without a user id every anonymous caller shares one fairness queue, like a single busy user
+    user_id = str(body.get("user_id") or request.remote or "anonymous")
+    return question, user_id
+
+
+def _submit(service: QueryService, user_id: str, question: str) -> QueryTicket:
+    """Raises the HTTP error that tells a load balancer or client to retry elsewhere or later."""
+    if not service.ready:
+        raise web.HTTPServiceUnavailable(text=json.dumps({"error": "The query service is warming up."}),
+                                         content_type="application/json")
+    try:
+        return service.submit(user_id, question)
+    except QueueFullError as e:
+        raise web.HTTPTooManyRequests(text=json.dumps({"error": str(e)}), content_type="application/json")
+
+
+async def _wait_for(ticket: QueryTicket) -> Any:
+    """Awaits the ticket's result without blocking the event loop (and without cancelling a shared execution)."""
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+
+    def settle(_: QueryTicket) -> None:
+        if not finished.done():
+            finished.set_result(None)
+
+    ticket.add_done_callback(lambda t: loop.call_soon_threadsafe(settle, t))
+    await finished
+    return ticket.result()
+
+
+async def handle_query(request: web.Request) -> web.Response:
+    service = request.app[SERVICE_KEY]
+    question, user_id = await _read_question(request)
+    ticket = _submit(service, user_id, question)
+    try:
+        response = await _wait_for(ticket)
+    except Exception as e:
+        return _json_response({"error": str(e) or type(e).__name__}, status=500)
+    return _json_response(_as_response_dict(response))
+
+
+async def handle_query_stream(request: web.Request) -> web.StreamResponse:
+    service = request.app[SERVICE_KEY]
+    question, user_id = await _read_question(request)
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    # listen before submitting so that no stage of a fast execution is missed
+    stop_listening = service.listen(question, lambda s: loop.call_soon_threadsafe(events.put_nowait, _stage_event(s)))
+    try:
+        ticket = _submit(service, user_id, question)
+    except web.HTTPException:
+        stop_listening()
+        raise
+
+    stream = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache"})
+    await stream.prepare(request)
+
+    async def send(event: Dict[str, Any]) -> None:
+        await stream.write((json.dumps(event, default=str) + "\n").encode())
+
+    result = asyncio.ensure_future(_wait_for(ticket))
+    try:
+        position = ticket.position()
+        await send({"event": "queued" if position else "started", "position": position,
+                    "coalesced": ticket.coalesced})
+        while not result.done() or not events.empty():
+            try:
+                await send(await asyncio.wait_for(events.get(), timeout=STREAM_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            new_position = ticket.position()
+            if new_position != position:
+                position = new_position
+                await send({"event": "queued" if position else "started", "position": position,
+                            "coalesced": ticket.coalesced})
+        try:
+            await send({"event": "result", "response": _as_response_dict(result.result())})
+        except Exception as e:
+            await send({"event": "error", "error": str(e) or type(e).__name__})
+        await stream.write_eof()
+    finally:
+        # a disconnected client stops receiving events; the execution goes on for coalesced requests
+        stop_listening()
+        result.cancel()
+    return stream
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    service = request.app[SERVICE_KEY]
+    return _json_response(service.health(), status=200 if service.ready else 503)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+def create_app(service: Optional[QueryService] = None) -> web.Application:
+    """
+    The aiohttp application of the service. Warm-up starts with the application; requests are refused with 503
+    until it has finished.
+    """
+    service = service or QueryService()
+    app = web.Application()
+    app[SERVICE_KEY] = service
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/query/stream", handle_query_stream)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+
+    async def on_startup(_: web.Application) -> None:
+        service.start()
+
+    async def on_cleanup(_: web.Application) -> None:
+        service.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve process_query over HTTP/JSON with warm state.")
+    parser.add_argument("--host", default=Config.QUERY_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=Config.QUERY_SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=Config.QUERY_MAX_CONCURRENCY,
+                        help="questions answered concurrently")
+    parser.add_argument("--max-queue", type=int, default=Config.QUERY_MAX_QUEUE, help="questions waiting at most")
+    args = parser.parse_args(argv)
+
+    web.run_app(create_app(QueryService(max_workers=args.workers, max_queue=args.max_queue)),
+                host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
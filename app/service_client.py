@@ -0,0 +1,118 @@
+"""
+Client of the query service (`app/service.py`) with the same submit()/ticket interface as FairQueryExecutor, so the
+Streamlit app can send questions to a running service instead of answering them in its own process.
+"""
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from app.config import Config
+from app.query_executor import QueueFullError
+
+# Seconds a streaming request may go without any event before it is given up (on top of the query deadline)
+STREAM_GRACE_SECONDS = 30
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when the query service cannot be reached or is still warming up."""
+
+
+class RemoteQueryTicket:
+    """
+    A question sent to the query service's streaming endpoint. Mirrors QueryTicket: position(), done(), result()
+    and `coalesced` follow the service's events, and `stages` lists the pipeline stages finished so far.
+    """
+
+    def __init__(self, question: str, response: Any):
+        self.question = question
+        self.coalesced = False
+        self.stages: List[str] = []
+        self._position = 0
+        self._future: Future = Future()
+        self._response = response
+        threading.Thread(target=self._read_events, name="service-ticket", daemon=True).start()
+
+    def position(self) -> int:
+        return self._position
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        return self._future.result(timeout)
+
+    def _read_events(self) -> None:
+        try:
+            with self._response:
+                for line in self._response:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    kind = event.get("event")
+                    if kind in ("queued", "started"):
+                        self._position = event.get("position", 0)
+                        self.coalesced = event.get("coalesced", self.coalesced)
+                    elif kind == "stage":
+                        self.stages.append(event["stage"])
+                    elif kind == "result":
+                        self._future.set_result(event["response"])
+                        return
+                    elif kind == "error":
+                        self._future.set_exception(RuntimeError(event.get("error")))
+                        return
+            self._future.set_exception(ServiceUnavailableError("The query service closed the connection."))
+        except Exception as e:
+            if not self._future.done():
+                self._future.set_exception(ServiceUnavailableError(f"Lost the query service connection: {e}"))
+
+
+class QueryServiceClient:
+    """
+    Sends questions to the query service at `url` (e.g. "http://query-service:8080").
+
+    Args:
+        url (str, optional): Base URL of the service. Defaults to Config.QUERY_SERVICE_URL.
+        timeout (float, optional): Seconds to wait for the next event of a question. Defaults to the query deadline
+                                   plus STREAM_GRACE_SECONDS (no limit when the deadline is disabled).
+    """
+
+    def __init__(self, url: Optional[str] = None, timeout: Optional[float] = None):
+        self.url = (url or Config.QUERY_SERVICE_URL).rstrip("/")
+        if timeout is None and Config.QUERY_DEADLINE_SECONDS > 0:
+            timeout = Config.QUERY_DEADLINE_SECONDS + STREAM_GRACE_SECONDS
+        self.timeout = timeout
+
+    def submit(self, user_id: str, question: str) -> RemoteQueryTicket:
+        """Raises QueueFullError when the service's queue is full and ServiceUnavailableError when it is down."""
+        request = urllib.request.Request(f"{self.url}/query/stream",
+                                         data=json.dumps({"question": question, "user_id": user_id}).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            message = _error_message(e)
+            if e.code == 429:
+                raise QueueFullError(message) from None
+            if e.code == 503:
+                raise ServiceUnavailableError(message) from None
+            raise RuntimeError(f"Query service error {e.code}: {message}") from None
+        except (urllib.error.URLError, OSError) as e:
+            raise ServiceUnavailableError(f"The query service at {self.url} is unreachable: {e}") from None
+        return RemoteQueryTicket(question, response)
+
+    def health(self) -> Dict[str, Any]:
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=10) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read() or b"{}")
+
+
+def _error_message(error: urllib.error.HTTPError) -> str:
+    try:
+        return json.loads(error.read()).get("error") or error.reason
+    except (ValueError, AttributeError):
+        return str(error.reason)
@@ -0,0 +1,331 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.graphs import Neo4jGraph
+
+from app.config import Config
+from app.tracing import span, metrics
+
+# Keys of the EDF :Data object holding signal arrays (channel -> record -> sample)
+SIGNAL_KEYS = ("_rawSignals", "_physicalSignals")
+MANIFEST_FILE = "manifest.json"
+# Property set on :File nodes that have materialized signals, relative to Config.SIGNAL_STORE_DIR
+MANIFEST_PROPERTY = "signal_manifest"
+# Manifest key of the graph numbers of the first channel, record and sample of an array (its indexes 0): `:INDEX`
+# positions usually start at 1, and the questions and answers use the graph's numbering
+BASES_KEY = "bases"
+
+# Channel numbers are read from the `:INDEX` relationships instead of assumed to be 0..children-1
+EDF_SIGNALS_QUERY = """
+    MATCH (d:Dataset)-[:FILES*1..]->(f:File)-[:DATA]->(:Data)-[s]->(signals:Data)-[c:INDEX]->(:Data)
+    WHERE type(s) IN $signal_keys
+    RETURN d.name AS dataset, elementId(f) AS file_id, f.name AS file, type(s) AS signal,
+           min(toInteger(c.index)) AS first_channel, max(toInteger(c.index)) AS last_channel
+    """
+
+# One channel at a time, so a whole file is never materialized as query rows at once
+CHANNEL_VALUES_QUERY = """
+    MATCH (f:File)-[:DATA]->(:Data)-[s]->(:Data)-[c:INDEX]->(:Data)-[r:INDEX]->(:Data)-[k]->(v:Data)
+    WHERE elementId(f) = $file_id AND type(s) = $signal AND toInteger(c.index) = $channel
+    RETURN toInteger(r.index) AS record, type(k) AS sample, v.value AS value
+    """
+
+LINK_MANIFEST_QUERY = f"""
+    MATCH (f:File) WHERE elementId(f) = $file_id
+    SET f.{MANIFEST_PROPERTY} = $manifest
+    """
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", text).strip("_")[:80] or "unnamed"
+
+
+def materialize_signals(graph: Neo4jGraph, store_dir: Optional[str] = None, overwrite: bool = False) -> List[str]:
+    """
+    Extracts the EDF signal arrays stored one node per sample (`_rawSignals` -> INDEX -> INDEX -> numeric key ->
+    {value}) into memory-mapped `.npy` files of shape (channels, records, samples), one per signal key and file,
+    writes a manifest.json next to them and links it from the :File node (`signal_manifest` property).
+
+    Pitfalls:
+        - Re-run after ingesting new EDF files; already materialized files are skipped unless `overwrite` is True.
+        - Records/samples missing in the graph are stored as NaN.
+        - Array positions start at 0 while `:INDEX` numbers usually start at 1: the manifest records the graph number
+          of each array's first channel, record and sample (`bases`), and SignalStore maps between them.
+
+    Args:
+        graph (Neo4jGraph): Graph to read the signals from.
+        store_dir (str, optional): Output directory. Defaults to Config.SIGNAL_STORE_DIR.
+        overwrite (bool, optional): Re-extract files that already have a manifest. Defaults to False.
+
+    Returns:
+        List[str]: Paths of the manifests written.
+    """
+    store_dir = store_dir or Config.SIGNAL_STORE_DIR
+    by_file: Dict[str, Dict[str, Any]] = {}
+    for row in graph.query(EDF_SIGNALS_QUERY, {"signal_keys": list(SIGNAL_KEYS)}):
+        entry = by_file.setdefault(row["file_id"], {"dataset": row["dataset"], "file": row["file"], "signals": {}})
+        entry["signals"][row["signal"]] = (row["first_channel"], row["last_channel"])
+
+    written = []
+    for file_id, entry in by_file.items():
+        file_dir_name = f"{_slug(entry['file'])}-{hashlib.sha1(file_id.encode()).hexdigest()[:8]}"
+        relative_dir = os.path.join(_slug(entry["dataset"]), file_dir_name)
+        file_dir = os.path.join(store_dir, relative_dir)
+        manifest_path = os.path.join(file_dir, MANIFEST_FILE)
+        if os.path.exists(manifest_path) and not overwrite:
+            print(f"Signals of {entry['file']} ({entry['dataset']}) already materialized, skipping.")
+            continue
+        os.makedirs(file_dir, exist_ok=True)
+        manifest = {"dataset": entry["dataset"], "file": entry["file"], "file_id": file_id,
+                    "created": time.time(), "signals": {}}
+        for signal, (first_channel, last_channel) in entry["signals"].items():
+            with span("signal_store.materialize", file=entry["file"], signal=signal,
+                      channels=last_channel - first_channel + 1) as s:
+                array_file = f"{signal.lstrip('_')}.npy"
+                materialized = _materialize_signal(graph, file_id, signal, first_channel, last_channel,
+                                                   os.path.join(file_dir, array_file))
+                shape = materialized[0] if materialized else None
+                s.set_attribute("shape", shape)
+            if materialized:
+                manifest["signals"][signal] = {"path": array_file, "shape": shape, "dtype": "float64",
+                                               BASES_KEY: materialized[1]}
+            print(f"Materialized {signal} of {entry['file']} ({entry['dataset']}) with shape {shape} in "
+                  f"{s.duration:.2f} seconds.")
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        graph.query(LINK_MANIFEST_QUERY, {"file_id": file_id, "manifest": os.path.join(relative_dir, MANIFEST_FILE)})
+        written.append(manifest_path)
+    return written
+
+
+def _materialize_signal(graph: Neo4jGraph, file_id: str, signal: str, first_channel: int, last_channel: int,
+                        path: str) -> Optional[Tuple[List[int], Dict[str, int]]]:
+    """Writes the array of one signal; returns its shape and the graph numbers of its first channel/record/sample."""
+    array = None
+    bases = {"channel": first_channel, "record": 0, "sample": 0}
+    for channel in range(first_channel, last_channel + 1):
+        rows = graph.query(CHANNEL_VALUES_QUERY, {"file_id": file_id, "signal": signal, "channel": channel})
+        rows = [row for row in rows if row["record"] is not None and row["sample"].isdigit()]
+        if not rows:
+            continue
+        if array is None:
+            # EDF signals are rectangular: the first channel gives the record and sample numbers
+            records = [row["record"] for row in rows]
+            samples = [int(row["sample"]) for row in rows]
+            bases.update(record=min(records), sample=min(samples))
+            shape = (last_channel - first_channel + 1, max(records) - bases["record"] + 1,
+                     max(samples) - bases["sample"] + 1)
+            array = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=shape)
+            array[:] = np.nan
+        for row in rows:
+            record, sample = row["record"] - bases["record"], int(row["sample"]) - bases["sample"]
+            if 0 <= record < array.shape[1] and 0 <= sample < array.shape[2]:
+                array[channel - first_channel, record, sample] = row["value"]
+    if array is None:
+        return None
+    array.flush()
+    return list(array.shape), bases
+
+
+class SignalRequest:
+    """A signal question parsed by SignalStore.parse(): which array, which part of it and what to compute."""
+
+    def __init__(self, manifest: Dict[str, Any], signal: str, operation: str, count: int = 10,
+                 channel: Optional[int] = None, record: Optional[int] = None, aggregate: Optional[str] = None):
+        self.manifest = manifest
+        self.signal = signal
+        self.operation = operation  # "slice" | "aggregate" | "sample"
+        self.count = count
+        self.channel = channel
+        self.record = record
+        self.aggregate = aggregate  # "mean" | "min" | "max" | "std" | "sum" | "count"
+
+    def describe(self) -> str:
+        where = ", ".join(f"{k}={v}" for k, v in (("channel", self.channel), ("record", self.record)) if v is not None)
+        what = {"slice": f"first {self.count} values", "sample": f"{self.count} random values",
+                "aggregate": self.aggregate}[self.operation]
+        return (f"// answered from the signal store (no graph traversal)\n"
+                f"// {self.manifest['dataset']} / {self.manifest['file']} / {self.signal}"
+                f"{' [' + where + ']' if where else ''}: {what}")
+
+
+class SignalStore:
+    """
+    Read side of the materialized EDF signals: finds manifests under `store_dir`, opens the arrays memory-mapped
+    (only the pages actually read are loaded) and answers slice, aggregate and sample requests over them.
+
+    Args:
+        store_dir (str, optional): Directory written by materialize_signals(). Defaults to Config.SIGNAL_STORE_DIR.
+    """
+
+    AGGREGATES = {"average": "mean", "mean": "mean", "minimum": "min", "min": "min", "lowest": "min",
+                  "maximum": "max", "max": "max", "highest": "max", "standard deviation": "std", "std": "std",
+                  "sum": "sum", "count": "count"}
+
+    def __init__(self, store_dir: Optional[str] = None):
+        self.store_dir = store_dir or Config.SIGNAL_STORE_DIR
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def manifests(self) -> List[Dict[str, Any]]:
+        manifests = []
+        for path in glob.glob(os.path.join(self.store_dir, "*", "*", MANIFEST_FILE)):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: unreadable signal manifest {path}: {e}")
+                continue
+            manifest["dir"] = os.path.dirname(path)
+            manifests.append(manifest)
+        return manifests
+
+    def array(self, manifest: Dict[str, Any], signal: str) -> np.ndarray:
+        path = os.path.join(manifest["dir"], manifest["signals"][signal]["path"])
+        if path not in self._arrays:
+            self._arrays[path] = np.load(path, mmap_mode="r")
+        return self._arrays[path]
+
+    def parse(self, question: str) -> Optional[SignalRequest]:
+        """
+        Recognizes questions about the values of raw/physical signals of one materialized EDF file, e.g.
+        "give me 10 values for raw signals in the edf file of Test Dataset CNT?" or "what is the average physical
+        signal of channel 3 in test.edf?". Returns None when the question is not such a request or does not name
+        the dataset or the file of exactly one materialized file ("how many raw signal files are there" is not about
+        the values of one), so the caller falls back to Cypher generation.
+        """
+        text = question.lower()
+        if "raw signal" in text:
+            signal = "_rawSignals"
+        elif "physical signal" in text:
+            signal = "_physicalSignals"
+        else:
+            return None
+        candidates = [m for m in self.manifests() if signal in m["signals"]]
+        # only a question naming the dataset or the file is about the values of one file
+        candidates = ([m for m in candidates if m["dataset"].lower() in text]
+                      or [m for m in candidates if m["file"].lower() in text])
+        if len(candidates) > 1:
+            candidates = [m for m in candidates if m["file"].lower() in text]
+        if len(candidates) != 1:
+            return None
+
+        channel = _int_after(r"(?:channel|signal)\s*(?:#|number|no\.?)?\s*(\d+)", text)
+        record = _int_after(r"record\s*(?:#|number|no\.?)?\s*(\d+)", text)
+        aggregate = next((op for phrase, op in self.AGGREGATES.items() if re.search(rf"\b{phrase}\b", text)), None)
+        count = _int_after(r"\b(\d+)\s+(?:random\s+)?(?:values|samples|points|numbers)", text) or 10
+        if aggregate:
+            operation = "aggregate"
+        elif re.search(r"\b(random|sample of|randomly)\b", text):
+            operation = "sample"
+        else:
+            operation = "slice"
+        return SignalRequest(candidates[0], signal, operation, count, channel, record, aggregate)
+
+    def execute(self, request: SignalRequest, max_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Runs a parsed request against the memory-mapped array and returns rows like a Cypher result. Channel, record
+        and sample numbers (in the request and the rows) are the graph's `:INDEX` numbers, not array positions.
+        """
+        max_rows = max_rows or Config.RESULT_MAX_ROWS
+        array = self.array(request.manifest, request.signal)
+        # manifests written before the bases were recorded assumed numbering from 0
+        bases = request.manifest["signals"][request.signal].get(BASES_KEY, {})
+        channel_base, record_base, sample_base = (bases.get(k, 0) for k in ("channel", "record", "sample"))
+        channel = request.channel - channel_base if request.channel is not None else None
+        record = request.record - record_base if request.record is not None else None
+        channels = [channel] if channel is not None else list(range(array.shape[0]))
+        channels = [c for c in channels if 0 <= c < array.shape[0]]
+        base = {"dataset": request.manifest["dataset"], "file": request.manifest["file"], "signal": request.signal}
+
+        if request.operation == "aggregate":
+            # out-of-range channels and records select nothing, as in the slice below
+            if (channel is not None and not channels) or (record is not None and not 0 <= record < array.shape[1]):
+                return []
+            values = array[channel] if channel is not None else array
+            if record is not None:
+                values = values[..., record, :]
+            return [{**base, "channel": request.channel, "aggregate": request.aggregate,
+                     "value": _aggregate(np.asarray(values), request.aggregate)}]
+
+        # (channel, record, sample) coordinates in storage order, limited to the requested records
+        records = [record] if record is not None else list(range(array.shape[1]))
+        records = [r for r in records if 0 <= r < array.shape[1]]
+        total = len(channels) * len(records) * array.shape[2]
+        count = min(request.count, total, max_rows)
+        if request.operation == "sample":
+            flat = np.sort(np.random.default_rng(0).choice(total, size=count, replace=False))
+        else:
+            flat = np.arange(count)
+        rows = []
+        for position in flat:
+            c, rest = divmod(int(position), len(records) * array.shape[2])
+            r, k = divmod(rest, array.shape[2])
+            value = float(array[channels[c], records[r], k])
+            rows.append({**base, "channel": channels[c] + channel_base, "record": records[r] + record_base,
+                         "sample": k + sample_base, "value": None if np.isnan(value) else value})
+        return rows
+
+
+def _int_after(pattern: str, text: str) -> Optional[int]:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else None
+
+
+def _aggregate(values: np.ndarray, op: str) -> float:
+    if op == "count":
+        return float(np.count_nonzero(~np.isnan(values)))
+    return float({"mean": np.nanmean, "min": np.nanmin, "max": np.nanmax, "std": np.nanstd,
+                  "sum": np.nansum}[op](values))
+
+
+def answer_from_signal_store(store: SignalStore, question: str) -> Optional[Dict[str, Any]]:
+    """
+    Answers a signal question straight from the memory-mapped arrays. Returns a response shaped like run_query's
+    (result, intermediate_steps with a description of the operation and the rows as context), or None when the
+    question is not a signal request the store can answer.
+    """
+    request = store.parse(question)
+    if request is None:
+        return None
+    with span("signal_store.answer", operation=request.operation, signal=request.signal,
+              file=request.manifest["file"]) as s:
+        rows = store.execute(request)
+        s.set_attribute("rows", len(rows))
+    metrics.increment("pipeline_answer_path_total", path="signal_store", shape=request.operation)
+    return {
+        "query": question,
+        "result": _render_answer(request, rows),
+        "intermediate_steps": [{"query": request.describe()}, {"context": rows}],
+        "answer_path": "signal_store",
+        "result_shape": request.operation,
+        "result_stats": {"rows_returned": len(rows), "total_rows": len(rows), "total_is_exact": True,
+                         "truncated": False, "truncated_reason": None},
+    }
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
+
+
+def _render_answer(request: SignalRequest, rows: List[Dict[str, Any]]) -> str:
+    source = f"{request.signal} of {request.manifest['file']} in dataset {request.manifest['dataset']}"
+    if not rows:
+        return f"No values found in {source} for the requested channel/record."
+    if request.operation == "aggregate":
+        scope = f"channel {request.channel}" if request.channel is not None else "all channels"
+        value = rows[0]["value"]
+        return f"The {request.aggregate} of {source} ({scope}) is **{_format_number(value)}**."
+    values = ", ".join("" if row["value"] is None else _format_number(row["value"]) for row in rows)
+    kind = "random values" if request.operation == "sample" else "values"
+    return f"{len(rows)} {kind} from {source}: {values}"
+
+
+if __name__ == '__main__':
+    from app.database_setup import setup_neo4j_graph
+    materialize_signals(setup_neo4j_graph(refresh_schema=False))
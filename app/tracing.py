@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.config import Config
+
+# Span that is currently open in this thread / asyncio task. Nested spans use it as their parent.
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+# Prometheus histogram buckets (seconds). Covers sub-ms vector search up to multi-minute LLM retries.
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0,
+                                      60.0, 120.0)
+# Number of most recent durations kept per stage to compute p50/p95/p99.
+_RESERVOIR_SIZE = 2048
+
+
+class Span:
+    """
+    A single timed stage of the pipeline. Spans nest: a span opened while another one is open becomes its child
+    and shares its trace_id. Attributes are free-form key/value pairs (row counts, token counts, attempt number...).
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start_perf
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_seconds": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe, process-wide store for per-stage latency histograms plus generic counters and gauges.
+    Rendered in Prometheus text format by render_prometheus().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bucket_counts: Dict[str, List[int]] = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self._sums: Dict[str, float] = defaultdict(float)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._reservoirs: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_RESERVOIR_SIZE))
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, stage: str, duration: float, error: bool = False) -> None:
+        with self._lock:
+            buckets = self._bucket_counts[stage]
+            for i, upper in enumerate(LATENCY_BUCKETS):
+                if duration <= upper:
+                    buckets[i] += 1
+            self._sums[stage] += duration
+            self._counts[stage] += 1
+            self._reservoirs[stage].append(duration)
+            if error:
+                self._errors[stage] += 1
+
+    def increment(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def percentiles(self, stage: str) -> Dict[str, float]:
+        with self._lock:
+            samples = sorted(self._reservoirs.get(stage, ()))
+        return _percentiles(samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable view of every stage (count, errors, mean, p50/p95/p99), counter and gauge."""
+        with self._lock:
+            stages = {stage: (self._counts[stage], self._errors[stage], self._sums[stage],
+                              sorted(self._reservoirs[stage])) for stage in self._counts}
+            counters = {_series_name(n, l): v for (n, l), v in self._counters.items()}
+            gauges = {_series_name(n, l): v for (n, l), v in self._gauges.items()}
+        result: Dict[str, Any] = {"stages": {}, "counters": counters, "gauges": gauges}
+        for stage in sorted(stages):
+            count, errors, total, samples = stages[stage]
+            result["stages"][stage] = {
+                "count": count,
+                "errors": errors,
+                "mean_seconds": total / count if count else 0.0,
+                **_percentiles(samples),
+            }
+        return result
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            stages = sorted(self._counts.keys())
+            lines.append("# HELP pipeline_stage_duration_seconds Duration of each query pipeline stage.")
+            lines.append("# TYPE pipeline_stage_duration_seconds histogram")
+            for stage in stages:
+                for upper, count in zip(LATENCY_BUCKETS, self._bucket_counts[stage]):
+                    lines.append(f'pipeline_stage_duration_seconds_bucket{{stage="{stage}",le="{upper}"}} {count}')
+                lines.append(f'pipeline_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} '
+                             f'{self._counts[stage]}')
+                lines.append(f'pipeline_stage_duration_seconds_sum{{stage="{stage}"}} {self._sums[stage]}')
+                lines.append(f'pipeline_stage_duration_seconds_count{{stage="{stage}"}} {self._counts[stage]}')
+            lines.append("# HELP pipeline_stage_errors_total Number of stage executions that raised.")
+            lines.append("# TYPE pipeline_stage_errors_total counter")
+            for stage in stages:
+                lines.append(f'pipeline_stage_errors_total{{stage="{stage}"}} {self._errors[stage]}')
+            reservoirs = {stage: sorted(self._reservoirs[stage]) for stage in stages}
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines.append("# HELP pipeline_stage_latency_seconds Recent p50/p95/p99 latency of each pipeline stage.")
+        lines.append("# TYPE pipeline_stage_latency_seconds summary")
+        for stage, samples in reservoirs.items():
+            for label, value in _percentiles(samples).items():
+                quantile = {"p50": "0.5", "p95": "0.95", "p99": "0.99"}[label]
+                lines.append(f'pipeline_stage_latency_seconds{{stage="{stage}",quantile="{quantile}"}} {value}')
+
+        emitted_types = set()
+        for (name, labels), value in counters:
+            if name not in emitted_types:
+                lines.append(f"# TYPE {name} counter")
+                emitted_types.add(name)
+            lines.append(f"{_series_name(name, labels)} {value}")
+        for (name, labels), value in gauges:
+            if name not in emitted_types:
+                lines.append(f"# TYPE {name} gauge")
+                emitted_types.add(name)
+            lines.append(f"{_series_name(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._bucket_counts.clear()
+            self._sums.clear()
+            self._counts.clear()
+            self._errors.clear()
+            self._reservoirs.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+def _series_name(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{label_str}}}"
+
+
+def _percentiles(sorted_samples: List[float]) -> Dict[str, float]:
+    if not sorted_samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    last = len(sorted_samples) - 1
+    return {
+        "p50": sorted_samples[round(0.50 * last)],
+        "p95": sorted_samples[round(0.95 * last)],
+        "p99": sorted_samples[round(0.99 * last)],
+    }
+
+
+# Process-wide registry used by all spans
+metrics = MetricsRegistry()
+
+# Callables that receive every finished span. JSON log export is registered by default (see bottom of module).
+_span_exporters: List[Callable[[Span], None]] = []
+_export_lock = threading.Lock()
+
+
+def add_span_exporter(exporter: Callable[[Span], None]) -> None:
+    """Registers a callable that is invoked with every finished span (e.g. to collect spans in a benchmark)."""
+    _span_exporters.append(exporter)
+
+
+def remove_span_exporter(exporter: Callable[[Span], None]) -> None:
+    if exporter in _span_exporters:
+        _span_exporters.remove(exporter)
+
+
+def _finish(span_obj: Span) -> None:
+    span_obj.end()
+    metrics.observe(span_obj.name, span_obj.duration, error=span_obj.status == "error")
+    for exporter in list(_span_exporters):
+        try:
+            exporter(span_obj)
+        except Exception as e:
+            print(f"ERROR: span exporter {exporter} failed: {e}")
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Opens a span for the duration of the `with` block. The span is a child of the span currently open in this
+    context (if any), records an error status if the block raises, and feeds its duration into the per-stage histogram.
+
+    Example:
+        with span("vector.search", top_k=5) as s:
+            hits = collection.search(...)
+            s.set_attribute("hits", len(hits))
+    """
+    parent = _current_span.get()
+    span_obj = Span(name, parent, attributes)
+    token = _current_span.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.status = "error"
+        span_obj.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(span_obj)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record_span(name: str, parent: Optional[Span], duration: float, status: str = "ok", **attributes: Any) -> Span:
+    """
+    Records a span that has already finished, e.g. an LLM call observed through LangChain callbacks where the start
+    and end happen in different callbacks and cannot be wrapped in a `with` block.
+    """
+    span_obj = Span(name, parent, attributes)
+    span_obj.start_time = time.time() - duration
+    span_obj.duration = duration
+    span_obj.status = status
+    _finish(span_obj)
+    return span_obj
+
+
+def _json_log_exporter(span_obj: Span) -> None:
+    """Appends the finished span as one JSON line to Config.TRACE_LOG_PATH."""
+    if not Config.TRACE_LOG_PATH:
+        return
+    line = json.dumps(span_obj.to_dict(), default=str)
+    with _export_lock:
+        with open(Config.TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def write_prometheus_textfile(path: Optional[str] = None) -> None:
+    """
+    Writes the current metrics in Prometheus text format to `path` (defaults to Config.METRICS_TEXTFILE_PATH), e.g.
+    for the node_exporter textfile collector. Written to a temp file first so scrapers never read a partial file.
+    """
+    path = path or Config.METRICS_TEXTFILE_PATH
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+add_span_exporter(_json_log_exporter)
@@ -0,0 +1,95 @@
+"""
+Warm-up of a process that answers questions. Entry points import only light modules and the pipeline is imported on
+the first question; warm_up() pays for that and for every cold cache and connection at startup instead, so the first
+user does not.
+
+Usage (from the repository root):
+    python -m app.warm_up     # checks every backend, creating and filling the few-shot collection if needed
+"""
+import argparse
+import asyncio
+import importlib
+import sys
+import threading
+from typing import List, Optional
+
+from app.main import example_questions
+from app.resources import SharedResources
+from app.tracing import span, write_prometheus_textfile
+
+
+def warm_up(resources: Optional[SharedResources] = None, questions: Optional[List[str]] = None) -> SharedResources:
+    """
+    Prepares a process to answer questions at full speed:
+
+    - imports the pipeline (LangChain, the Neo4j driver, pymilvus);
+    - opens the Neo4j connection pool (creating the SharedResources) and the chat model clients of the ladder;
+    - primes the DataGuide and schema caches and the intent router's dataset names;
+    - makes sure the few-shot collection exists, is filled and indexed, and loads its keyword index;
+    - embeds the canned example questions and retrieves their few-shot examples, which fills the query embedding
+      cache (see paths_vectorDB.main.cached_query_embedding()).
+
+    Args:
+        resources (SharedResources, optional): The resources to warm. Created if not given.
+        questions (List[str], optional): Questions to pre-embed. Defaults to app.main.example_questions().
+
+    Returns:
+        SharedResources: The warmed resources.
+
+    Raises:
+        Exception: The first backend that could not be reached.
+    """
+    with span("warm_up") as s:
+        with span("warm_up.imports"):
+            importlib.import_module("app.qa_chain")
+        resources = resources or SharedResources()
+        for tier in resources.model_ladder.tiers:
+            tier.llm  # instantiates the client
+        asyncio.run(_awarm_up(resources, example_questions() if questions is None else questions))
+    print(f"Warm-up done in {s.duration:.1f}s")
+    return resources
+
+
+async def _awarm_up(resources: SharedResources, questions: List[str]) -> None:
+    from app.qa_chain import _check_dataguide_version, _fetch_dataguide_paths, _refresh_schema
+
+    # records the current DataGuide version, so that a later rebuild is noticed
+    await _check_dataguide_version(resources)
+    stages = [_fetch_dataguide_paths(resources), _refresh_schema(resources)]
+    if resources.intent_router is not None:
+        stages.append(asyncio.to_thread(resources.intent_router.resolver.dataset_names))
+    if questions and resources.batch_few_shot_retriever is not None:
+        stages.append(resources.batch_few_shot_retriever(graph=resources.graph, user_queries=questions, top_k=5))
+    elif questions:
+        stages.append(resources.few_shot_retriever(graph=resources.graph, user_query=questions[0], top_k=5))
+    with span("warm_up.caches", questions=len(questions)):
+        await asyncio.gather(*stages)
+
+
+def start_warm_up(resources: Optional[SharedResources] = None) -> threading.Thread:
+    """Runs warm_up() in a daemon thread; a failure is printed, and the first questions then warm up on their own."""
+    def run() -> None:
+        try:
+            warm_up(resources)
+        except Exception as e:
+            print(f"Warm-up failed: {e}")
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv: List[str] = None) -> int:
+    argparse.ArgumentParser(description="Warm up and check every backend of the question pipeline.").parse_args(argv)
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"ERROR: Warm-up failed: {e}")
+        return 1
+    finally:
+        write_prometheus_textfile()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Recall/latency/memory tuning of the few-shot collection's ANN index (see `paths_vectorDB/vector_index.py`).
+
+The embeddings of a live collection are copied into a scratch collection (optionally grown to `--scale` vectors by
+adding perturbed copies, to see how a configuration behaves at 100k vectors). Every candidate configuration
+(FLAT, IVF_FLAT and IVF_SQ8 over a few nlist/nprobe values, HNSW over a few M/ef values, or `--configs`) is built
+in turn and searched with `--queries` perturbed copies of real embeddings. The report gives, per configuration,
+recall@k against exact inner-product search (computed with NumPy), p50/p99 search latency, the loaded segments'
+memory and the build time. The source collection is never modified.
+
+Usage (from the repository root, Milvus running and the collection filled):
+    python -m benchmarks.ann_tuning --collection default
+    python -m benchmarks.ann_tuning --collection default --scale 100000 --json ann.json
+    python -m benchmarks.ann_tuning --configs \
+        '[{"index_type": "HNSW", "params": {"M": 8}, "search_params": {"ef": 32}}]'
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, connections, utility
+
+from paths_vectorDB.vector_index import IndexSpec
+
+INSERT_BATCH = 5000
+# Standard deviation of the noise added to real embeddings (before re-normalizing) for extra vectors and queries
+NOISE = 0.05
+
+
+def load_embeddings(collection_name: str) -> np.ndarray:
+    """All embeddings of a live collection as an (n, dim) float32 array."""
+    collection = Collection(collection_name)
+    collection.load()
+    rows = collection.query(expr="id >= 0", output_fields=["embedding"], limit=16384)
+    return np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+
+
+def perturbed(vectors: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """`count` noisy, L2-normalized copies of randomly chosen rows of `vectors`."""
+    picked = vectors[rng.integers(0, len(vectors), size=count)]
+    noisy = picked + rng.normal(0.0, NOISE, size=picked.shape).astype(np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def candidate_specs(num_vectors: int, top_k: int) -> List[IndexSpec]:
+    """FLAT plus IVF (nlist around sqrt(n) and 4*sqrt(n)) and HNSW variants sized for `num_vectors`."""
+    specs = [IndexSpec("FLAT")]
+    root = math.sqrt(num_vectors)
+    nlists = sorted({max(1, min(65536, int(factor * root))) for factor in (1, 4)})
+    for index_type in ("IVF_FLAT", "IVF_SQ8"):
+        for nlist in nlists:
+            for nprobe in sorted({1, min(8, nlist), min(32, nlist)}):
+                specs.append(IndexSpec(index_type, {"nlist": nlist}, {"nprobe": nprobe}))
+    for m in (8, 16):
+        for ef in sorted({max(top_k, 16), 64, 256}):
+            specs.append(IndexSpec("HNSW", {"M": m, "efConstruction": 200}, {"ef": ef}))
+    return specs
+
+
+def create_scratch_collection(name: str, vectors: np.ndarray) -> Collection:
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+    schema = CollectionSchema(fields=[
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=vectors.shape[1]),
+    ], description="ANN tuning scratch collection")
+    collection = Collection(name=name, schema=schema)
+    for start in range(0, len(vectors), INSERT_BATCH):
+        batch = vectors[start:start + INSERT_BATCH]
+        collection.insert([list(range(start, start + len(batch))), batch.tolist()])
+    collection.flush()
+    return collection
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] if ordered else 0.0
+
+
+def measure(collection: Collection, spec: IndexSpec, queries: np.ndarray, exact: np.ndarray,
+            top_k: int, repeats: int) -> Dict[str, Any]:
+    """Builds `spec` on the scratch collection and measures recall@k, latency, memory and build time."""
+    collection.release()
+    if collection.indexes:
+        collection.drop_index()
+    start = time.perf_counter()
+    collection.create_index(field_name="embedding", index_params=spec.index_params())
+    utility.wait_for_index_building_complete(collection.name)
+    build_seconds = time.perf_counter() - start
+    collection.load()
+    memory = sum(segment.mem_size for segment in utility.get_query_segment_info(collection.name))
+
+    param = spec.search_param()
+    collection.search(data=[queries[0].tolist()], anns_field="embedding", param=param, limit=top_k)  # warm-up
+    latencies, recalls = [], []
+    for _ in range(repeats):
+        for query, truth in zip(queries, exact):
+            start = time.perf_counter()
+            results = collection.search(data=[query.tolist()], anns_field="embedding", param=param, limit=top_k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len({hit.id for hit in results[0]} & set(truth.tolist())) / top_k)
+    return {
+        "index": spec.label,
+        "index_type": spec.index_type,
+        "params": spec.params,
+        "search_params": spec.search_params,
+        f"recall@{top_k}": round(sum(recalls) / len(recalls), 4),
+        "p50_ms": round(1000 * _percentile(latencies, 50), 3),
+        "p99_ms": round(1000 * _percentile(latencies, 99), 3),
+        "memory_mib": round(memory / 2 ** 20, 2),
+        "build_seconds": round(build_seconds, 3),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recall/latency/memory of ANN index configurations.")
+    parser.add_argument("--collection", default="default", help="live collection whose embeddings are used")
+    parser.add_argument("--scale", type=int, help="grow the scratch collection to this many vectors")
+    parser.add_argument("--queries", type=int, default=200, help="number of query vectors (default 200)")
+    parser.add_argument("--repeats", type=int, default=3, help="times each query is searched (default 3)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--configs", help="JSON list of {index_type, params, search_params} to measure instead "
+                                          "of the default grid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch collection")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    connections.connect(alias="default", host='localhost', port='19530')
+    if not utility.has_collection(args.collection):
+        print(f"Collection {args.collection} does not exist.")
+        return 1
+    rng = np.random.default_rng(args.seed)
+    vectors = load_embeddings(args.collection)
+    if len(vectors) == 0:
+        print(f"Collection {args.collection} is empty.")
+        return 1
+    if args.scale and args.scale > len(vectors):
+        vectors = np.concatenate([vectors, perturbed(vectors, args.scale - len(vectors), rng)])
+    queries = perturbed(vectors, args.queries, rng)
+    top_k = min(args.top_k, len(vectors))
+    # ground truth: exact inner-product top k (ids are row numbers in the scratch collection)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :top_k]
+
+    if args.configs:
+        specs = [IndexSpec(c["index_type"], c.get("params"), c.get("search_params")) for c in json.loads(args.configs)]
+    else:
+        specs = candidate_specs(len(vectors), top_k)
+
+    scratch = f"{args.collection}_ann_tuning"
+    print(f"Copying {len(vectors)} vectors (dim {vectors.shape[1]}) into '{scratch}'...")
+    collection = create_scratch_collection(scratch, vectors)
+    rows = []
+    try:
+        for spec in specs:
+            print(f"Measuring {spec.label}...")
+            rows.append(measure(collection, spec, queries, exact, top_k, args.repeats))
+    finally:
+        if not args.keep:
+            utility.drop_collection(scratch)
+
+    columns = ["index", f"recall@{top_k}", "p50_ms", "p99_ms", "memory_mib", "build_seconds"]
+    width = max(len(row["index"]) for row in rows) + 2
+    print(f"\n{len(vectors)} vectors, {len(queries)} queries x {args.repeats}")
+    print(f"{columns[0]:<{width}}" + "".join(f"{column:>14}" for column in columns[1:]))
+    for row in rows:
+        print(f"{row['index']:<{width}}" + "".join(f"{row[column]:>14}" for column in columns[1:]))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"collection": args.collection, "vectors": len(vectors), "queries": len(queries),
+                       "top_k": top_k, "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,488 @@
+"""
+Record/replay of the pipeline's external calls.
+
+Recording runs the real pipeline against the live services and stores every LLM call (`ChatOpenAI`), embedding call
+(`OpenAIEmbeddings.embed_query`), graph query / schema refresh / document import and Milvus operation with its
+inputs, outputs and observed latency in a gzip-compressed JSON-lines cassette. Replaying runs a new build of
+`run_query` or `fill_collection_with_random_paths` against the cassette instead of the services, optionally sleeping
+for the recorded latencies, so benchmarks use real prompts and real result shapes and are deterministic.
+
+Usage (from the repository root):
+    python -m benchmarks.cassette record session.jsonl.gz "What are the names of the datasets in our database?"
+    python -m benchmarks.cassette record session.jsonl.gz --fill-paths 10 --collection scratch
+    python -m benchmarks.cassette replay session.jsonl.gz --emulate-latency
+    python -m benchmarks.run_benchmark --cassette session.jsonl.gz --emulate-latency
+"""
+import argparse
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.graphs.graph_store import GraphStore
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+import app.main as app_main
+import paths_vectorDB.main as vector_main
+from app.database_setup import setup_neo4j_graph
+from app.dataguide import DATAGUIDE_PATHS_QUERY, extract_dataguide_paths
+from app.qa_chain import run_query
+from app.resources import SharedResources, fetch_dataguide_with_async_driver
+from app.result_guard import active_result_guard
+from app.tracing import span
+
+CASSETTE_VERSION = 1
+
+KIND_LLM = "llm"
+KIND_EMBEDDING = "embedding"
+KIND_GRAPH = "graph"
+KIND_SCHEMA = "schema"
+KIND_GRAPH_WRITE = "graph_write"
+KIND_VECTOR = "vector"
+
+# Milvus operations called through paths_vectorDB.main; replayed as a whole (including any embedding calls they make)
+_VECTOR_FUNCTIONS = ("prepare_collection_for_search", "search_similar_vectors", "insert_single_data",
+                     "remove_collection", "get_collection_size")
+
+
+class CassetteMissError(Exception):
+    """Raised on replay when a call has no recorded interaction."""
+
+
+def _request_key(kind: str, request: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps([kind, request], sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+
+def _encode_vector(vector: List[float]) -> str:
+    # float32 + base64 is ~4x smaller than a JSON list of floats; embeddings are float32 on the API side anyway
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+
+
+def _encode_vectors(vectors: List[List[float]]) -> List[str]:
+    return [_encode_vector(vector) for vector in vectors]
+
+
+def _decode_vectors(data: List[str]) -> List[List[float]]:
+    return [_decode_vector(vector) for vector in data]
+
+
+def _vector_digest(vector: List[float]) -> str:
+    return hashlib.sha256(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()[:24]
+
+
+def _is_vector_data(value: Any) -> bool:
+    """A vector or a list of vectors (as opposed to e.g. a list of query strings)."""
+    return isinstance(value, list) and bool(value) and isinstance(value[0], (float, int, list))
+
+
+class Cassette:
+    """
+    Ordered list of recorded interactions, each `{kind, key, request, response, latency}`, plus the questions asked
+    during the session.
+
+    On replay a call is matched by the hash of its request; repeated identical calls are answered in recording order
+    and the last one is reused once they run out (e.g. for benchmark iterations). When a request has no exact match
+    (say, the Cypher prompt template changed in the new build), the next unused interaction of the same kind is
+    returned and counted in `misses`, unless `strict` is set.
+
+    Args:
+        path (str): Cassette file (gzip-compressed JSON lines).
+        emulate_latency (bool, optional): Sleep for the recorded latency on every replayed call. Defaults to False.
+        strict (bool, optional): Raise CassetteMissError instead of falling back on unmatched requests.
+    """
+
+    def __init__(self, path: str, emulate_latency: bool = False, strict: bool = False):
+        self.path = path
+        self.emulate_latency = emulate_latency
+        self.strict = strict
+        self.interactions: List[Dict[str, Any]] = []
+        self.questions: List[str] = []
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Deque[int]] = {}
+        self._by_kind: Dict[str, List[int]] = {}
+        self._used: set = set()
+
+    # --- file format -------------------------------------------------------------------------------------------
+
+    @classmethod
+    def load(cls, path: str, emulate_latency: bool = False, strict: bool = False) -> "Cassette":
+        cassette = cls(path, emulate_latency, strict)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')} in {path}")
+            cassette.questions = header.get("questions", [])
+            for line in f:
+                cassette._add(json.loads(line))
+        return cassette
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        with self._lock:
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write(json.dumps({"version": CASSETTE_VERSION, "created": time.time(),
+                                    "questions": self.questions}) + "\n")
+                for interaction in self.interactions:
+                    f.write(json.dumps(interaction, separators=(",", ":"), default=str) + "\n")
+        print(f"Cassette with {len(self.interactions)} interactions written to {path}")
+
+    def _add(self, interaction: Dict[str, Any]) -> None:
+        index = len(self.interactions)
+        self.interactions.append(interaction)
+        self._by_key.setdefault(interaction["key"], deque()).append(index)
+        self._by_kind.setdefault(interaction["kind"], []).append(index)
+
+    # --- record / replay ---------------------------------------------------------------------------------------
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, latency: float) -> None:
+        with self._lock:
+            self._add({"kind": kind, "key": _request_key(kind, request), "request": request, "response": response,
+                       "latency": round(latency, 6)})
+
+    def take(self, kind: str, request: Dict[str, Any]) -> Tuple[Any, float]:
+        """Returns the recorded (response, latency) for a request. Does not sleep; see replay()/areplay()."""
+        with self._lock:
+            indices = self._by_key.get(_request_key(kind, request))
+            if indices:
+                index = indices.popleft() if len(indices) > 1 else indices[0]
+            else:
+                index = next((i for i in self._by_kind.get(kind, []) if i not in self._used), None)
+                if self.strict or index is None:
+                    raise CassetteMissError(f"No recorded {kind} interaction for {json.dumps(request, default=str)[:300]}")
+                self.misses += 1
+            self._used.add(index)
+            interaction = self.interactions[index]
+            return interaction["response"], interaction["latency"]
+
+    def replay(self, kind: str, request: Dict[str, Any]) -> Any:
+        response, latency = self.take(kind, request)
+        if self.emulate_latency:
+            time.sleep(latency)
+        return response
+
+    async def areplay(self, kind: str, request: Dict[str, Any]) -> Any:
+        response, latency = self.take(kind, request)
+        if self.emulate_latency:
+            await asyncio.sleep(latency)
+        return response
+
+    # --- patching ----------------------------------------------------------------------------------------------
+
+    @contextmanager
+    def recording(self, seed: int = 0) -> Iterator["Cassette"]:
+        """Records LLM, embedding and Milvus calls made inside the block (graph calls go through RecordingGraph)."""
+        with self._patched(replaying=False, seed=seed):
+            yield self
+
+    @contextmanager
+    def replaying(self, seed: int = 0) -> Iterator["Cassette"]:
+        """Answers LLM, embedding and Milvus calls made inside the block from the cassette."""
+        with self._patched(replaying=True, seed=seed):
+            yield self
+
+    @contextmanager
+    def _patched(self, replaying: bool, seed: int) -> Iterator[None]:
+        originals: List[Tuple[Any, str, Any]] = []
+
+        def patch(target: Any, name: str, replacement: Any) -> None:
+            originals.append((target, name, getattr(target, name)))
+            setattr(target, name, replacement)
+
+        wrap = self._replay_wrapper if replaying else self._record_wrapper
+        patch(ChatOpenAI, "_generate", wrap(KIND_LLM, ChatOpenAI._generate, _llm_request, _dump_chat_result,
+                                            _load_chat_result, method=True))
+        patch(ChatOpenAI, "_agenerate", wrap(KIND_LLM, ChatOpenAI._agenerate, _llm_request, _dump_chat_result,
+                                             _load_chat_result, method=True, is_async=True))
+        patch(OpenAIEmbeddings, "embed_query", wrap(KIND_EMBEDDING, OpenAIEmbeddings.embed_query,
+                                                    _embedding_request, _encode_vector, _decode_vector, method=True))
+        patch(OpenAIEmbeddings, "aembed_query", wrap(KIND_EMBEDDING, OpenAIEmbeddings.aembed_query,
+                                                     _embedding_request, _encode_vector, _decode_vector, method=True,
+                                                     is_async=True))
+        for name in _VECTOR_FUNCTIONS:
+            patch(vector_main, name, wrap(KIND_VECTOR, getattr(vector_main, name), _vector_request(name)))
+        patch(OpenAIEmbeddings, "aembed_documents", wrap(KIND_EMBEDDING, OpenAIEmbeddings.aembed_documents,
+                                                         _embeddings_request, _encode_vectors, _decode_vectors,
+                                                         method=True, is_async=True))
+        for name in ("asearch_similar_vectors", "asearch_similar_vectors_batch"):
+            patch(vector_main, name, wrap(KIND_VECTOR, getattr(vector_main, name), _vector_request(name),
+                                          is_async=True))
+        if replaying:
+            patch(vector_main, "write_paths_and_descriptions_to_file", lambda *args, **kwargs: None)
+            patch(vector_main, "API_PAUSE_SECONDS", 0)
+        # the OpenAI clients refuse to be created without a key, even though replay never calls the API
+        had_key = "OPENAI_API_KEY" in os.environ
+        if replaying and not had_key:
+            os.environ["OPENAI_API_KEY"] = "replay"
+        # random path sampling must pick the same nodes on record and replay
+        random_state = random.getstate()
+        random.seed(seed)
+        try:
+            yield
+        finally:
+            random.setstate(random_state)
+            if replaying and not had_key:
+                os.environ.pop("OPENAI_API_KEY", None)
+            for target, name, original in reversed(originals):
+                setattr(target, name, original)
+
+    def _record_wrapper(self, kind: str, fn: Callable, make_request: Callable, dump: Callable = lambda r: r,
+                        load: Callable = lambda r: r, method: bool = False, is_async: bool = False) -> Callable:
+        cassette = self
+
+        def request_of(args, kwargs):
+            return make_request(*(args[1:] if method else args), **kwargs)
+
+        if is_async:
+            async def recorder(*args, **kwargs):
+                start = time.perf_counter()
+                result = await fn(*args, **kwargs)
+                cassette.record(kind, request_of(args, kwargs), dump(result), time.perf_counter() - start)
+                return result
+        else:
+            def recorder(*args, **kwargs):
+                start = time.perf_counter()
+                result = fn(*args, **kwargs)
+                cassette.record(kind, request_of(args, kwargs), dump(result), time.perf_counter() - start)
+                return result
+        return recorder
+
+    def _replay_wrapper(self, kind: str, fn: Callable, make_request: Callable, dump: Callable = lambda r: r,
+                        load: Callable = lambda r: r, method: bool = False, is_async: bool = False) -> Callable:
+        cassette = self
+
+        def request_of(args, kwargs):
+            return make_request(*(args[1:] if method else args), **kwargs)
+
+        if is_async:
+            async def replayer(*args, **kwargs):
+                return load(await cassette.areplay(kind, request_of(args, kwargs)))
+        else:
+            def replayer(*args, **kwargs):
+                return load(cassette.replay(kind, request_of(args, kwargs)))
+        return replayer
+
+
+# --- request/response serialization ------------------------------------------------------------------------------
+
+def _llm_request(messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None,
+                 **kwargs: Any) -> Dict[str, Any]:
+    return {"messages": [[message.type, message.content] for message in messages], "stop": stop}
+
+
+def _dump_chat_result(result: ChatResult) -> Dict[str, Any]:
+    return {"generations": [{"text": generation.message.content, "info": generation.generation_info}
+                            for generation in result.generations],
+            "llm_output": result.llm_output}
+
+
+def _load_chat_result(data: Dict[str, Any]) -> ChatResult:
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=g["text"]), generation_info=g["info"])
+                                   for g in data["generations"]],
+                      llm_output=data["llm_output"])
+
+
+def _embedding_request(text: str, **kwargs: Any) -> Dict[str, Any]:
+    return {"text": text}
+
+
+def _embeddings_request(texts: List[str], **kwargs: Any) -> Dict[str, Any]:
+    return {"texts": list(texts)}
+
+
+def _vector_request(name: str) -> Callable[..., Dict[str, Any]]:
+    def make_request(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        # graphs are not part of the request (they are recorded separately); vectors are keyed by digest
+        values = [_vector_digest(a) if _is_vector_data(a) else a for a in args if not hasattr(a, "query")]
+        named = {k: (_vector_digest(v) if _is_vector_data(v) else v) for k, v in kwargs.items() if k != "graph"}
+        return {"function": name, "args": values, "kwargs": named}
+    return make_request
+
+
+# --- graph ---------------------------------------------------------------------------------------------------------
+
+class RecordingGraph(GraphStore):
+    """
+    Proxy around a Neo4jGraph that records `query()` results (with the result guard's stats, when one is active),
+    `refresh_schema()` outcomes and `add_graph_documents()` imports into `cassette`. Everything else is delegated to
+    the wrapped graph.
+    """
+
+    def __init__(self, graph: Any, cassette: Cassette):
+        self._graph = graph
+        self._cassette = cassette
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._graph, name)
+
+    @property
+    def get_schema(self) -> str:
+        return self._graph.schema
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self._graph.structured_schema
+
+    def add_graph_documents(self, graph_documents: List[Any], include_source: bool = False) -> None:
+        start = time.perf_counter()
+        self._graph.add_graph_documents(graph_documents, include_source)
+        self._cassette.record(KIND_GRAPH_WRITE, _graph_documents_request(graph_documents, include_source), None,
+                              time.perf_counter() - start)
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        rows = self._graph.query(query, params)
+        guard = active_result_guard()
+        self._cassette.record(KIND_GRAPH, {"query": query, "params": params},
+                              {"rows": rows, "stats": guard.stats.to_dict() if guard is not None else None},
+                              time.perf_counter() - start)
+        return rows
+
+    def refresh_schema(self) -> None:
+        start = time.perf_counter()
+        self._graph.refresh_schema()
+        self._cassette.record(KIND_SCHEMA, {}, {"schema": self._graph.schema,
+                                                "structured_schema": self._graph.structured_schema},
+                              time.perf_counter() - start)
+
+
+class ReplayGraph(GraphStore):
+    """
+    Stand-in for Neo4jGraph that answers `query()` and `refresh_schema()` from a cassette, and checks that
+    `add_graph_documents()` imports were recorded.
+    """
+
+    def __init__(self, cassette: Cassette):
+        self._cassette = cassette
+        self.schema = ""
+        self.structured_schema: Dict[str, Any] = {}
+
+    @property
+    def get_schema(self) -> str:
+        return self.schema
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self.structured_schema
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        with span("neo4j.query", query=query[:500], backend="cassette") as s:
+            response = self._cassette.replay(KIND_GRAPH, {"query": query, "params": params})
+            guard = active_result_guard()
+            if guard is not None and response.get("stats"):
+                for key, value in response["stats"].items():
+                    setattr(guard.stats, key, value)
+            s.set_attribute("rows", len(response["rows"]))
+            return response["rows"]
+
+    def refresh_schema(self) -> None:
+        response = self._cassette.replay(KIND_SCHEMA, {})
+        self.schema = response["schema"]
+        self.structured_schema = response["structured_schema"]
+
+    def add_graph_documents(self, graph_documents: List[Any], include_source: bool = False) -> None:
+        # nothing to write: the import only has to have been recorded (CassetteMissError otherwise)
+        self._cassette.replay(KIND_GRAPH_WRITE, _graph_documents_request(graph_documents, include_source))
+
+
+def _graph_documents_request(graph_documents: List[Any], include_source: bool) -> Dict[str, Any]:
+    return {"include_source": include_source, "documents": [{
+        "nodes": [[node.type, node.id, node.properties] for node in document.nodes],
+        "relationships": [[rel.source.id, rel.type, rel.target.id, rel.properties] for rel in document.relationships],
+        "source": document.source.page_content if document.source is not None else None,
+    } for document in graph_documents]}
+
+
+def recording_dataguide_fetcher(cassette: Cassette, fetcher: Callable) -> Callable:
+    """
+    Wraps a DataGuideFetcher so its result is recorded as the graph query it stands for; on replay the DataGuide
+    is then read through ReplayGraph.query() like any other graph query.
+    """
+    async def fetch(graph: Any) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        results = await fetcher(graph)
+        cassette.record(KIND_GRAPH, {"query": DATAGUIDE_PATHS_QUERY, "params": {}}, {"rows": results, "stats": None},
+                        time.perf_counter() - start)
+        return results
+    return fetch
+
+
+def replay_resources(cassette: Cassette) -> SharedResources:
+    """SharedResources whose graph and DataGuide come from `cassette` (use inside `cassette.replaying()`)."""
+    graph = ReplayGraph(cassette)
+    return SharedResources(graph=graph, dataguide_fetcher=lambda g: asyncio.to_thread(extract_dataguide_paths, g),
+                           dataguide_cache_ttl=0)
+
+
+# --- CLI -----------------------------------------------------------------------------------------------------------
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Record or replay the pipeline's external calls.")
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("cassette", help="cassette file (.jsonl.gz)")
+    parser.add_argument("questions", nargs="*", help="questions to record (default: app/main.py examples)")
+    parser.add_argument("--fill-paths", type=int, default=0,
+                        help="also run fill_collection_with_random_paths with this many paths")
+    parser.add_argument("--collection", default="default", help="collection used by --fill-paths")
+    parser.add_argument("--emulate-latency", action="store_true", help="sleep for the recorded latencies")
+    parser.add_argument("--strict", action="store_true", help="fail on requests that were not recorded")
+    args = parser.parse_args(argv)
+
+    if args.mode == "record":
+        cassette = Cassette(args.cassette)
+        cassette.questions = args.questions or [value for name, value in sorted(vars(app_main).items())
+                                                if name.startswith("example_query")]
+        with cassette.recording():
+            graph = RecordingGraph(setup_neo4j_graph(refresh_schema=False), cassette)
+            resources = SharedResources(
+                graph=graph,
+                dataguide_fetcher=recording_dataguide_fetcher(cassette, fetch_dataguide_with_async_driver),
+                dataguide_cache_ttl=0,
+            )
+            for question in cassette.questions:
+                try:
+                    run_query(question, resources=resources)
+                except Exception as e:
+                    print(f"FAILED: {question}: {e}")
+            if args.fill_paths:
+                vector_main.fill_collection_with_random_paths(graph, args.collection, args.fill_paths)
+        cassette.save()
+        return 0
+
+    cassette = Cassette.load(args.cassette, emulate_latency=args.emulate_latency, strict=args.strict)
+    failures = 0
+    with cassette.replaying():
+        resources = replay_resources(cassette)
+        for question in cassette.questions:
+            start = time.perf_counter()
+            try:
+                response = run_query(question, resources=resources)
+                answer = response.get("result") if isinstance(response, dict) else response
+            except Exception as e:
+                failures += 1
+                answer = f"FAILED: {e}"
+            print(f"[{time.perf_counter() - start:.2f}s] {question}\n    -> {answer}")
+        if args.fill_paths:
+            vector_main.fill_collection_with_random_paths(resources.graph, args.collection, args.fill_paths)
+    print(f"Replayed {len(cassette._used)}/{len(cassette.interactions)} interactions, {cassette.misses} unmatched "
+          f"requests, {failures} failed questions.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.config import Config
+from app.context_encoder import count_tokens
+from paths_vectorDB.keyword_index import Hit, KeywordIndex, fuse_hits
+from paths_vectorDB.vectorDB_setup import _format_hit
+from paths_vectorDB.write_read_data import read_paths_and_descriptions_from_file
+
+DEFAULT_DESCRIPTIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app",
+                                         "vectordb_paths_descriptions.txt")
+# Same dimension as the text-embedding-3-small vectors stored in Milvus (see paths_vectorDB/generate_descriptions.py)
+EMBEDDING_DIM = 512
+# Marker of langchain's CYPHER_QA_PROMPT; prompts without it are Cypher generation prompts
+_QA_PROMPT_MARKER = "Information:"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model standing in for the OpenAI model in benchmarks.
+
+    Cypher generation prompts are answered with the Cypher registered for the question they contain (the longest
+    registered question found in the prompt wins, so retried "enhanced" queries still match); QA prompts get a short
+    answer quoting the start of the context. Token usage is reported like ChatOpenAI does, counted with the same
+    tokenizer as app/context_encoder.py, so `llm.call` spans carry realistic prompt sizes.
+
+    Attributes:
+        responses (Dict[str, str]): Question -> Cypher query returned for it.
+        default_cypher (str): Returned when no registered question matches.
+        latency (float): Seconds slept per call, emulating the model's response time.
+        calls (Dict[str, int]): Number of "cypher" and "qa" calls made so far.
+    """
+
+    responses: Dict[str, str] = {}
+    default_cypher: str = "MATCH (n) WHERE false RETURN n"
+    latency: float = 0.0
+    calls: Dict[str, int] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": "fake-chat"}
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if _QA_PROMPT_MARKER in prompt:
+            kind = "qa"
+            context = prompt.split(_QA_PROMPT_MARKER, 1)[1].split("Question:", 1)[0].strip()
+            text = f"According to the graph: {context[:200]}"
+        else:
+            kind = "cypher"
+            matches = [question for question in self.responses if question in prompt]
+            text = self.responses[max(matches, key=len)] if matches else self.default_cypher
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"model_name": "fake-chat",
+                        "token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                        "total_tokens": prompt_tokens + completion_tokens}},
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+class FakeEmbedder:
+    """
+    Hashed bag-of-words embedder: each lower-cased word is hashed into one of `dim` buckets and the vector is
+    L2-normalized, so texts sharing words get a high inner product. Deterministic and dependency-free.
+
+    Args:
+        dim (int, optional): Vector dimension. Defaults to EMBEDDING_DIM.
+        latency (float, optional): Seconds slept per embed_query call. Defaults to 0.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9_]+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.embed(text).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.embed(text).tolist()
+
+
+class LocalVectorStore:
+    """
+    In-process replacement for the Milvus few-shot collection: the stored paths and descriptions are embedded once
+    with `embedder` and searched by inner product (the metric of the Milvus index), fused with a keyword index of
+    the same examples when Config.HYBRID_SEARCH_ENABLED is set. `search` has the signature of a FewShotRetriever
+    (see app/resources.py) and returns the same strings as search_similar_vectors().
+
+    Args:
+        embedder (FakeEmbedder): Embedder used for the stored descriptions and the queries.
+        file_path (str, optional): Paths/descriptions file. Defaults to app/vectordb_paths_descriptions.txt.
+        latency (float, optional): Seconds slept per search, emulating the Milvus round trip. Defaults to 0.
+    """
+
+    def __init__(self, embedder: FakeEmbedder, file_path: str = DEFAULT_DESCRIPTIONS_FILE, latency: float = 0.0):
+        self.embedder = embedder
+        self.latency = latency
+        self.searches = 0
+        self.paths, self.descriptions = read_paths_and_descriptions_from_file(file_path)
+        if self.descriptions:
+            self.vectors = np.stack([embedder.embed(description) for description in self.descriptions])
+        else:
+            self.vectors = np.zeros((0, embedder.dim), dtype=np.float32)
+        self.keyword_index = KeywordIndex(self.paths, self.descriptions)
+
+    def vector_hits(self, query_vector: List[float], top_k: int) -> List[Hit]:
+        scores = self.vectors @ np.asarray(query_vector, dtype=np.float32)
+        top = np.argsort(-scores)[:min(top_k, len(scores))]
+        return [(self.paths[j], self.descriptions[j], float(scores[j])) for j in top]
+
+    def hybrid_hits(self, user_query: str, query_vector: List[float], top_k: int) -> List[Hit]:
+        candidates = max(top_k, Config.HYBRID_CANDIDATES)
+        return fuse_hits(self.vector_hits(query_vector, candidates), self.keyword_index.search(user_query, candidates),
+                         top_k)
+
+    async def search(self, graph: Any, user_query: str, top_k: int = 5) -> List[str]:
+        query_vector = await self.embedder.aembed_query(user_query)
+        self.searches += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if Config.HYBRID_SEARCH_ENABLED:
+            hits = self.hybrid_hits(user_query, query_vector, top_k)
+        else:
+            hits = self.vector_hits(query_vector, top_k)
+        return [_format_hit(i, path, description, score) for i, (path, description, score) in enumerate(hits)]
+
+    async def search_many(self, graph: Any, user_queries: List[str], top_k: int = 5) -> List[List[str]]:
+        """BatchFewShotRetriever (see app/resources.py): one batched embedding call and one emulated search."""
+        query_vectors = [self.embedder.embed(user_query).tolist() for user_query in user_queries]
+        self.embedder.calls += 1
+        self.searches += 1
+        if self.embedder.latency:
+            await asyncio.sleep(self.embedder.latency)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        output = []
+        for user_query, query_vector in zip(user_queries, query_vectors):
+            if Config.HYBRID_SEARCH_ENABLED:
+                hits = self.hybrid_hits(user_query, query_vector, top_k)
+            else:
+                hits = self.vector_hits(query_vector, top_k)
+            output.append([_format_hit(i, path, description, score)
+                           for i, (path, description, score) in enumerate(hits)])
+        return output
+
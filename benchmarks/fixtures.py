@@ -0,0 +1,63 @@
+from benchmarks.in_memory_graph import InMemoryGraph
+
+TEST_DATASET = "Test Dataset CNT"
+MODEL_DATASET = ("A mathematical model for simulating the neural regulation of phasic contractions and slow waves in "
+                 "the distal stomach")
+
+# Shape of the graph the app runs against (see app/vectordb_paths_descriptions.txt), scaled down
+NUM_SIGNALS = 12
+RECORDS_PER_SIGNAL = 6
+SAMPLES_PER_RECORD = 20
+
+
+def _edf_document() -> dict:
+    signal_info = [{"label": f"EEG {i}", "nbOfSamples": float(SAMPLES_PER_RECORD), "physicalMaximum": 3276.7,
+                    "physicalMinimum": -3276.8, "prefiltering": "HP:0.1Hz LP:75Hz"} for i in range(NUM_SIGNALS)]
+    raw = [[{str(k): float((s * 31 + r * 7 + k * 13) % 4096 - 2048) for k in range(SAMPLES_PER_RECORD)}
+            for r in range(RECORDS_PER_SIGNAL)] for s in range(NUM_SIGNALS)]
+    physical = [[{key: value / 10 for key, value in record.items()} for record in signal] for signal in raw]
+    return {
+        "_header": {"patientId": "X X X X", "recordingId": "Startdate 01-JAN-2020", "signalInfo": signal_info},
+        "_rawSignals": raw,
+        "_physicalSignals": physical,
+    }
+
+
+def build_sample_graph(latency: float = 0.0) -> InMemoryGraph:
+    """
+    Builds a small Pennsieve-shaped graph: the two datasets referenced by the example questions, their files and
+    JSON contents (including a scaled-down test.edf), and the :DataGuide summary of it all.
+    """
+    graph = InMemoryGraph(latency=latency)
+    root = graph.add_node(("Pennsieve",))
+
+    cnt = graph.add_node(("Dataset",), {"name": TEST_DATASET, "id": 214})
+    graph.add_edge(root, "DATASET", cnt)
+    for name in ("banner.jpg", "test.edf", "dataset_description.json"):
+        file_node = graph.add_node(("File",), {"name": name})
+        graph.add_edge(cnt, "FILES", file_node)
+        if name == "test.edf":
+            graph.add_json(file_node, "DATA", _edf_document())
+        elif name == "dataset_description.json":
+            graph.add_json(file_node, "DATA", {"contributors": [
+                {"first_name": "Jane", "last_name": "Doe", "orcid": "0000-0001-2345-6789", "degree": "PhD"},
+                {"first_name": "John", "last_name": "Smith", "orcid": "0000-0002-3456-7890", "degree": "MS"},
+            ]})
+
+    model = graph.add_node(("Dataset",), {"name": MODEL_DATASET, "id": 55})
+    graph.add_edge(root, "DATASET", model)
+    docs = graph.add_node(("Directory",), {"name": "docs"})
+    graph.add_edge(model, "FILES", docs)
+    for name in ("manifest.json", "model.py", "README.md"):
+        file_node = graph.add_node(("File",), {"name": name})
+        graph.add_edge(model if name != "README.md" else docs, "FILES", file_node)
+        if name == "manifest.json":
+            graph.add_json(file_node, "DATA", {
+                "license": "Creative Commons Attribution",
+                "creator": {"name": "Ann Author", "orcid": "0000-0003-4567-8901"},
+                "files": [{"path": "model.py", "file_type": "Python"}, {"path": "docs/README.md",
+                                                                        "file_type": "Markdown"}],
+            })
+
+    graph.build_dataguide()
+    return graph
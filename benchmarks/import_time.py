@@ -0,0 +1,104 @@
+"""
+Import-time regression check of the entry modules. Each module is imported in a fresh interpreter with
+`python -X importtime`; the check fails when an entry module pulls in a heavy dependency at import time (those are
+imported at first use, or by app/warm_up.py) or, with `--baseline`, when its import got slower than the baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --save-baseline import_baseline.json
+    python -m benchmarks.import_time --baseline import_baseline.json     # exit 1 on a regression
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Modules imported by the Streamlit app and the service before the first question
+ENTRY_MODULES = ("app.main", "app.resources", "app.query_executor", "app.service_client", "app.service",
+                 "app.warm_up")
+# Top-level packages that must not be imported by an entry module
+HEAVY_PACKAGES = ("langchain", "langchain_core", "langchain_community", "langchain_openai", "openai", "neo4j",
+                  "pymilvus", "pandas", "numpy")
+# Import times below this many milliseconds are never reported as regressions (timer noise)
+MIN_REGRESSION_MS = 20.0
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str) -> Tuple[float, List[str]]:
+    """Cumulative import time of `module` in milliseconds and the top-level packages it imported."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT,
+                               env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    total_us, packages = 0, set()
+    for line in completed.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module:
+            total_us = int(cumulative)
+    return total_us / 1000, sorted(packages)
+
+
+def run(modules: List[str], repeats: int) -> Dict[str, Dict[str, object]]:
+    report = {}
+    for module in modules:
+        # the fastest of a few runs: the first one may also compile bytecode
+        timings = [measure_import(module) for _ in range(repeats)]
+        packages = timings[0][1]
+        report[module] = {
+            "import_ms": round(min(ms for ms, _ in timings), 1),
+            "heavy_packages": [package for package in packages if package in HEAVY_PACKAGES],
+        }
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import time and heavy imports of the entry modules.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_MODULES))
+    parser.add_argument("--repeats", type=int, default=3, help="imports per module, the fastest counts (default 3)")
+    parser.add_argument("--save-baseline", help="write the import times to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative increase (default 0.5)")
+    args = parser.parse_args(argv)
+
+    report = run(args.modules, args.repeats)
+    problems = []
+    print(f"{'module':<24}{'import_ms':>12}  heavy imports")
+    for module, row in report.items():
+        print(f"{module:<24}{row['import_ms']:>12.1f}  {', '.join(row['heavy_packages']) or '-'}")
+        if row["heavy_packages"]:
+            problems.append(f"{module} imports {', '.join(row['heavy_packages'])} at import time")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({module: row["import_ms"] for module, row in report.items()}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for module, base in sorted(baseline.items()):
+            if module not in report:
+                continue
+            value = report[module]["import_ms"]
+            if value > base * (1 + args.tolerance) and value - base > MIN_REGRESSION_MS:
+                problems.append(f"{module}: {base:.1f}ms -> {value:.1f}ms")
+
+    if problems:
+        print("\nREGRESSIONS:")
+        for line in problems:
+            print(f"  {line}")
+        return 1
+    print("\nNo import-time regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
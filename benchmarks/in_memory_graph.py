@@ -0,0 +1,331 @@
+import hashlib
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_community.graphs.graph_store import GraphStore
+
+from app import intent_router
+from app.dataguide import DATAGUIDE_PATHS_QUERY
+from app.deadline import current_deadline
+from app.result_guard import active_result_guard
+from app.tracing import span
+
+# Queries issued by the app itself, recognised by InMemoryGraph.query()
+_ALL_NODE_IDS_QUERY = "MATCH (n) WHERE NOT n:DataGuide RETURN elementId(n) as id"
+_PATH_TO_NODE_RE = re.compile(r'MATCH path = \(p:Pennsieve\)-\[\*\]->\(n\) WHERE elementId\(n\) = "([^"]+)" RETURN path')
+
+
+def normalize_cypher(query: str) -> str:
+    """Whitespace-insensitive key for matching query texts."""
+    return " ".join(query.split())
+
+
+class _Record:
+    """Minimal stand-in for neo4j.Record so guarded queries go through ResultGuard.consume()."""
+
+    def __init__(self, row: Dict[str, Any]):
+        self._row = row
+
+    def data(self) -> Dict[str, Any]:
+        return self._row
+
+
+class InMemoryGraph(GraphStore):
+    """
+    In-memory stand-in for the subset of Neo4jGraph used by the app: `query()`, `refresh_schema()`, `schema` and
+    `get_structured_schema`, plus `add_graph_documents()` for loading LangChain GraphDocuments. It stores a real
+    property graph (nodes with labels and properties, typed edges) so the app's own queries work against it:
+
+        - DataGuide leaf path extraction (app/dataguide.py)
+        - listing node ids and fetching the path from :Pennsieve to a node (paths_vectorDB/random_path_generator.py)
+        - the intent router's pre-written queries (app/intent_router.py)
+
+    Any other Cypher (e.g. LLM-generated queries) is answered from results registered with register_result();
+    unknown queries return no rows, like a Cypher query that matches nothing.
+
+    Args:
+        latency (float, optional): Seconds slept on every query to emulate a network round trip. Defaults to 0.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.nodes: Dict[str, Tuple[Tuple[str, ...], Dict[str, Any]]] = {}
+        self.out_edges: Dict[str, List[Tuple[str, Dict[str, Any], str]]] = defaultdict(list)
+        self.parents: Dict[str, Tuple[str, str]] = {}  # node id -> (parent id, relationship type) for tree data
+        self.canned_results: Dict[str, List[Dict[str, Any]]] = {}
+        self.schema = ""
+        self.structured_schema: Dict[str, Any] = {}
+        self.query_count = 0
+        self._next_id = 0
+
+    # --- construction -------------------------------------------------------------------------------------------
+
+    def add_node(self, labels: Tuple[str, ...], properties: Optional[Dict[str, Any]] = None) -> str:
+        node_id = f"4:mem:{self._next_id}"
+        self._next_id += 1
+        self.nodes[node_id] = (tuple(labels), dict(properties or {}))
+        return node_id
+
+    def add_edge(self, start: str, rel_type: str, end: str, properties: Optional[Dict[str, Any]] = None) -> None:
+        self.out_edges[start].append((rel_type, dict(properties or {}), end))
+        self.parents.setdefault(end, (start, rel_type))
+
+    def add_json(self, parent: str, rel_type: str, value: Any, rel_properties: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Adds a JSON value under `parent` the way Pennsieve files are stored in the graph: objects and arrays become
+        :Data nodes with `children`/`type`, object keys become relationship types, array elements hang off :INDEX
+        relationships with an `index` property, and scalars become leaf :Data nodes with a `value`.
+        """
+        if isinstance(value, dict):
+            node = self.add_node(("Data",), {"children": float(len(value)), "type": "Object"})
+            for key, child in value.items():
+                self.add_json(node, str(key), child)
+        elif isinstance(value, list):
+            node = self.add_node(("Data",), {"children": float(len(value)), "type": "Array"})
+            for index, child in enumerate(value):
+                self.add_json(node, "INDEX", child, {"index": index})
+        else:
+            node = self.add_node(("Data",), {"value": value})
+        self.add_edge(parent, rel_type, node, rel_properties)
+        return node
+
+    def register_result(self, query: str, rows: List[Dict[str, Any]]) -> None:
+        """Registers the rows returned for a Cypher query (matched ignoring whitespace)."""
+        self.canned_results[normalize_cypher(query)] = rows
+
+    def build_dataguide(self) -> None:
+        """
+        (Re)builds the :DataGuide summary: one :DataGuide node per distinct sequence of relationship types starting at
+        :Pennsieve, mirroring the structure the app reads through extract_dataguide_paths().
+        """
+        for node_id in [n for n, (labels, _) in self.nodes.items() if "DataGuide" in labels]:
+            del self.nodes[node_id]
+            self.out_edges.pop(node_id, None)
+        root = self.add_node(("DataGuide", "Root"))
+        trie: Dict[Tuple[str, ...], str] = {(): root}
+        for pennsieve in self._nodes_with_label("Pennsieve"):
+            stack: List[Tuple[str, Tuple[str, ...]]] = [(pennsieve, ())]
+            while stack:
+                node_id, labels_path = stack.pop()
+                for rel_type, _, child in self.out_edges.get(node_id, []):
+                    child_path = labels_path + (rel_type,)
+                    if child_path not in trie:
+                        trie[child_path] = self.add_node(("DataGuide",))
+                        self.out_edges[trie[labels_path]].append((rel_type, {}, trie[child_path]))
+                    stack.append((child, child_path))
+
+    # --- Neo4jGraph subset --------------------------------------------------------------------------------------
+
+    @property
+    def get_schema(self) -> str:
+        return self.schema
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self.structured_schema
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check("neo4j.query")
+        with span("neo4j.query", query=query[:500], backend="in_memory") as s:
+            self.query_count += 1
+            if self.latency:
+                time.sleep(self.latency)
+            rows = self._execute(normalize_cypher(query), params or {})
+            guard = active_result_guard()
+            if guard is not None:
+                rows = guard.consume(_Record(row) for row in rows)
+                s.set_attributes(total_rows=guard.stats.total_rows, truncated=guard.stats.truncated)
+            s.set_attribute("rows", len(rows))
+            return rows
+
+    def refresh_schema(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        node_props: Dict[str, Dict[str, str]] = defaultdict(dict)
+        for labels, properties in self.nodes.values():
+            if "DataGuide" in labels:
+                continue
+            for label in labels:
+                for key, value in properties.items():
+                    node_props[label][key] = _neo4j_type(value)
+        relationships = set()
+        for start, edges in self.out_edges.items():
+            start_labels = self.nodes[start][0]
+            if "DataGuide" in start_labels:
+                continue
+            for rel_type, _, end in edges:
+                relationships.add((start_labels[0], rel_type, self.nodes[end][0][0]))
+        self.structured_schema = {
+            "node_props": {label: [{"property": k, "type": t} for k, t in props.items()]
+                           for label, props in node_props.items()},
+            "rel_props": {},
+            "relationships": [{"start": s, "type": t, "end": e} for s, t, e in sorted(relationships)],
+            "metadata": {"constraint": [], "index": []},
+        }
+        node_lines = [f"{label} {{{', '.join(f'{k}: {t}' for k, t in props.items())}}}"
+                      for label, props in node_props.items()]
+        rel_lines = [f"(:{s})-[:{t}]->(:{e})" for s, t, e in sorted(relationships)]
+        self.schema = ("Node properties:\n" + "\n".join(node_lines) + "\nRelationship properties:\n\n"
+                       "The relationships:\n" + "\n".join(rel_lines))
+
+    def add_graph_documents(self, graph_documents: List[Any], include_source: bool = False) -> None:
+        """
+        Merges LangChain GraphDocuments like Neo4jGraph.add_graph_documents(): nodes by type and `id` (properties
+        set on creation), relationships by start, type and end and, with `include_source`, a :Document node per
+        source (by its `id` metadata, or the MD5 of its text) linked to the document's nodes by :MENTIONS.
+        """
+        for document in graph_documents:
+            source = None
+            if include_source:
+                metadata = dict(document.source.metadata)
+                metadata.setdefault("id", hashlib.md5(document.source.page_content.encode("utf-8")).hexdigest())
+                source = self._merge_node("Document", metadata["id"])
+                self.nodes[source][1].update({"text": document.source.page_content, **metadata})
+            for node in document.nodes:
+                node_id = self._merge_node(node.type, node.id, node.properties)
+                if source is not None:
+                    self._merge_edge(source, "MENTIONS", node_id)
+            for relationship in document.relationships:
+                self._merge_edge(self._merge_node(relationship.source.type, relationship.source.id),
+                                 relationship.type,
+                                 self._merge_node(relationship.target.type, relationship.target.id),
+                                 relationship.properties)
+
+    def _merge_node(self, label: str, key: Any, properties: Optional[Dict[str, Any]] = None) -> str:
+        label = label.replace("`", "")
+        for node_id, (labels, node_properties) in self.nodes.items():
+            if label in labels and node_properties.get("id") == key:
+                return node_id
+        return self.add_node((label,), {**(properties or {}), "id": key})
+
+    def _merge_edge(self, start: str, rel_type: str, end: str, properties: Optional[Dict[str, Any]] = None) -> None:
+        if not any(t == rel_type and e == end for t, _, e in self.out_edges.get(start, [])):
+            self.add_edge(start, rel_type, end, properties)
+
+    # --- query execution ----------------------------------------------------------------------------------------
+
+    def _execute(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        routed = _ROUTER_QUERIES.get(query)
+        if routed is not None:
+            return routed(self, params)
+        if query == normalize_cypher(DATAGUIDE_PATHS_QUERY):
+            return self._dataguide_leaf_paths()
+        if query == _ALL_NODE_IDS_QUERY:
+            return [{"id": node_id} for node_id, (labels, _) in self.nodes.items() if "DataGuide" not in labels]
+        match = _PATH_TO_NODE_RE.search(query)
+        if match:
+            path = self._path_from_root(match.group(1))
+            return [{"path": path}] if path else []
+        return list(self.canned_results.get(query, []))
+
+    # --- intent router queries ----------------------------------------------------------------------------------
+
+    def _children(self, node_id: str, rel_type: Optional[str] = None) -> List[Tuple[str, str]]:
+        return [(rel, child) for rel, _, child in self.out_edges.get(node_id, []) if rel_type in (None, rel)]
+
+    def _datasets(self, name: Optional[str] = None) -> List[str]:
+        return [n for n in self._nodes_with_label("Dataset") if name is None or self.nodes[n][1].get("name") == name]
+
+    def _dataset_files(self, dataset: str) -> List[str]:
+        """:File nodes reachable over FILES* from the dataset (through directories)."""
+        files, stack = [], [dataset]
+        while stack:
+            for _, child in self._children(stack.pop(), "FILES"):
+                stack.append(child)
+                if "File" in self.nodes[child][0]:
+                    files.append(child)
+        return files
+
+    def _value(self, node_id: str, rel_type: str) -> Any:
+        children = self._children(node_id, rel_type)
+        return self.nodes[children[0][1]][1].get("value") if children else None
+
+    def _router_dataset_names(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [{"dataset": self.nodes[d][1].get("name")} for d in self._datasets()]
+
+    def _router_dataset_files(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [{"file": self.nodes[f][1].get("name")} for d in self._datasets(params["dataset"])
+                for f in self._dataset_files(d)]
+
+    def _router_has_file(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [{"has_file": any(self.nodes[f][1].get("name") == params["file"] for f in self._dataset_files(d))}
+                for d in self._datasets(params["dataset"])]
+
+    def _router_contributors(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rows = []
+        for d in self._datasets(params.get("dataset")):
+            for _, f in self._children(d, "FILES"):
+                for _, data in self._children(f, "DATA"):
+                    for _, contributors in self._children(data, "contributors"):
+                        for _, c in self._children(contributors, "INDEX"):
+                            rows.append({"dataset": self.nodes[d][1].get("name"),
+                                         **{key: self._value(c, key)
+                                            for key in ("first_name", "last_name", "orcid", "degree")}})
+        return rows
+
+    def _router_manifest_field(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rows = []
+        for d in self._datasets(params["dataset"]):
+            for f in self._dataset_files(d):
+                if self.nodes[f][1].get("name") != "manifest.json":
+                    continue
+                for _, data in self._children(f, "DATA"):
+                    for _, v in self._children(data, params["field"]):
+                        value = self.nodes[v][1].get("value")
+                        rows.append({"dataset": self.nodes[d][1].get("name"),
+                                     "value": value if value is not None else self._value(v, "name")})
+        return rows
+
+    def _nodes_with_label(self, label: str) -> List[str]:
+        return [node_id for node_id, (labels, _) in self.nodes.items() if label in labels]
+
+    def _path_from_root(self, node_id: str) -> Optional[List[Any]]:
+        if node_id not in self.nodes or "Pennsieve" in self.nodes[node_id][0]:
+            return None  # a path needs at least one relationship
+        reversed_path: List[Any] = [dict(self.nodes[node_id][1])]
+        current = node_id
+        while "Pennsieve" not in self.nodes[current][0]:
+            if current not in self.parents:
+                return None
+            parent, rel_type = self.parents[current]
+            reversed_path.extend([rel_type, dict(self.nodes[parent][1])])
+            current = parent
+        return list(reversed(reversed_path))
+
+    def _dataguide_leaf_paths(self) -> List[Dict[str, Any]]:
+        results = []
+        for root in [n for n, (labels, _) in self.nodes.items() if "DataGuide" in labels and "Root" in labels]:
+            stack: List[Tuple[str, List[Any]]] = [(root, [dict(self.nodes[root][1])])]
+            while stack:
+                node_id, path = stack.pop()
+                edges = self.out_edges.get(node_id, [])
+                if not edges and len(path) > 1:
+                    results.append({"path": path})
+                for rel_type, _, child in edges:
+                    stack.append((child, path + [rel_type, dict(self.nodes[child][1])]))
+        return results
+
+
+_ROUTER_QUERIES = {
+    normalize_cypher(intent_router.DATASET_NAMES_QUERY): InMemoryGraph._router_dataset_names,
+    normalize_cypher(intent_router.DATASET_FILES_QUERY): InMemoryGraph._router_dataset_files,
+    normalize_cypher(intent_router.DATASET_HAS_FILE_QUERY): InMemoryGraph._router_has_file,
+    normalize_cypher(intent_router.CONTRIBUTORS_QUERY): InMemoryGraph._router_contributors,
+    normalize_cypher(intent_router.MANIFEST_FIELD_QUERY): InMemoryGraph._router_manifest_field,
+}
+
+
+def _neo4j_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "FLOAT"
+    if isinstance(value, list):
+        return "LIST"
+    return "STRING"
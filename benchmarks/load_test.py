@@ -0,0 +1,275 @@
+"""
+Concurrent load test of the query pipeline.
+
+Questions drawn from a weighted mix are fired either with a fixed number of concurrent clients (`--concurrency`,
+closed loop) or at a target arrival rate (`--rate` questions/second, open loop). In-process, they go through a
+FairQueryExecutor running `process_query`, exactly as the Streamlit app does, against the live backends
+(`--backend live`) or the local stand-ins of `benchmarks/` (`--backend fake`, the default). With `--url` they are
+POSTed as `{"question": ...}` to an HTTP endpoint instead.
+
+The report gives throughput, p50/p95/p99 latency, error, rejection and retry rates, executor queue waits, and per
+backend (Neo4j, LLM, vector search) the call latency and peak number of concurrent calls, as JSON and/or HTML.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --concurrency 8 --duration 60 --llm-latency 1.5 --html load.html
+    python -m benchmarks.load_test --rate 2 --duration 120 --backend live --json load.json
+"""
+import argparse
+import html
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.circuit_breaker import breaker_states
+from app.main import process_query
+from app.query_executor import FairQueryExecutor, QueueFullError
+from app.resources import SharedResources
+from app.tracing import Span, add_span_exporter, remove_span_exporter
+from benchmarks.run_benchmark import DEFAULT_CORPUS, build_resources, load_questions
+
+# Spans grouped into the backends whose saturation is reported
+BACKEND_SPANS = {
+    "neo4j": ("neo4j.query", "schema.refresh"),
+    "llm": ("llm.call",),
+    "vector": ("few_shot.retrieve", "vector.search"),
+}
+
+
+class _Outcome:
+    def __init__(self, question: str, submitted: float):
+        self.question = question
+        self.submitted = submitted
+        self.finished = submitted
+        self.queue_wait: Optional[float] = None
+        self.coalesced = False  # joined an identical question already in flight
+        self.status = "ok"  # ok | no_answer | error | rejected
+        self.error: Optional[str] = None
+
+
+def load_mix(path: Optional[str], corpus_path: str) -> List[Tuple[str, float]]:
+    """(question, weight) pairs from a JSON object {question: weight}, or every benchmark question with weight 1."""
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [(question, float(weight)) for question, weight in json.load(f).items()]
+    return [(entry["question"], 1.0) for entry in load_questions(corpus_path)]
+
+
+def in_process_target(resources: SharedResources, max_workers: Optional[int]) -> Tuple[Callable, Callable]:
+    """Target answering through a FairQueryExecutor (one 'user' per client thread), plus its shutdown function."""
+
+    def run(question: str) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        return process_query(question, resources=resources), started
+
+    executor = FairQueryExecutor(run_fn=run, max_workers=max_workers)
+
+    def target(question: str, outcome: _Outcome) -> None:
+        ticket = executor.submit(threading.current_thread().name, question)
+        outcome.coalesced = ticket.coalesced
+        response, started = ticket.result()
+        outcome.queue_wait = max(0.0, started - outcome.submitted)
+        if not isinstance(response, dict):
+            outcome.status = "no_answer"
+
+    return target, executor.shutdown
+
+
+def http_target(url: str, timeout: float) -> Callable:
+    def target(question: str, outcome: _Outcome) -> None:
+        request = urllib.request.Request(url, data=json.dumps({"question": question}).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                body = json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            if e.code in (429, 503):
+                raise QueueFullError(f"HTTP {e.code}")
+            raise
+        if not body.get("result"):
+            outcome.status = "no_answer"
+    return target
+
+
+def _call(target: Callable, question: str, outcomes: List[_Outcome], lock: threading.Lock) -> None:
+    outcome = _Outcome(question, time.perf_counter())
+    try:
+        target(question, outcome)
+    except QueueFullError as e:
+        outcome.status, outcome.error = "rejected", str(e)
+    except Exception as e:
+        outcome.status, outcome.error = "error", f"{type(e).__name__}: {e}"
+    outcome.finished = time.perf_counter()
+    with lock:
+        outcomes.append(outcome)
+
+
+def drive(target: Callable, mix: List[Tuple[str, float]], duration: float, concurrency: Optional[int],
+          rate: Optional[float], seed: int = 0) -> List[_Outcome]:
+    """Fires questions at `target` for `duration` seconds, closed loop (`concurrency`) or open loop (`rate`)."""
+    rng = random.Random(seed)
+    questions, weights = zip(*mix)
+    outcomes: List[_Outcome] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    if rate:
+        # open loop: Poisson arrivals; every arrival gets its own thread so slow answers never delay arrivals
+        with ThreadPoolExecutor(max_workers=concurrency or 256, thread_name_prefix="client") as pool:
+            next_arrival = time.perf_counter()
+            while next_arrival < deadline:
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                pool.submit(_call, target, rng.choices(questions, weights)[0], outcomes, lock)
+                next_arrival += rng.expovariate(rate)
+        return outcomes
+
+    def client() -> None:
+        client_rng = random.Random(rng.random())
+        while time.perf_counter() < deadline:
+            _call(target, client_rng.choices(questions, weights)[0], outcomes, lock)
+
+    threads = [threading.Thread(target=client, name=f"client-{i}") for i in range(concurrency or 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+    return {"p50": round(pick(50), 4), "p95": round(pick(95), 4), "p99": round(pick(99), 4)}
+
+
+def _peak_concurrency(spans: List[Span]) -> int:
+    events = sorted([(s.start_time, 1) for s in spans] + [(s.start_time + s.duration, -1) for s in spans])
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def summarize(outcomes: List[_Outcome], spans: List[Span], elapsed: float) -> Dict[str, Any]:
+    total = len(outcomes)
+    by_status: Dict[str, int] = defaultdict(int)
+    for outcome in outcomes:
+        by_status[outcome.status] += 1
+    completed = [o for o in outcomes if o.status in ("ok", "no_answer")]
+    attempts = [s for s in spans if s.name == "qa.attempt"]
+    runs = [s for s in spans if s.name == "run_query"]
+    report: Dict[str, Any] = {
+        "requests": total,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_per_minute": round(len(completed) / elapsed * 60, 2) if elapsed else 0.0,
+        "status": dict(by_status),
+        "error_rate": round(by_status["error"] / total, 4) if total else 0.0,
+        "rejection_rate": round(by_status["rejected"] / total, 4) if total else 0.0,
+        "coalesced_rate": round(sum(1 for o in outcomes if o.coalesced) / total, 4) if total else 0.0,
+        "retry_rate": round((len(attempts) - len(runs)) / len(runs), 4) if runs else 0.0,
+        "latency_seconds": _percentiles([o.finished - o.submitted for o in completed]),
+        "queue_wait_seconds": _percentiles([o.queue_wait for o in completed if o.queue_wait is not None]),
+        "errors": sorted({o.error for o in outcomes if o.status == "error"})[:10],
+        "backends": {},
+        "circuit_breakers": breaker_states(),
+    }
+    for backend, names in BACKEND_SPANS.items():
+        backend_spans = [s for s in spans if s.name in names and s.duration is not None]
+        report["backends"][backend] = {
+            "calls": len(backend_spans),
+            "errors": sum(1 for s in backend_spans if s.status == "error"),
+            "latency_seconds": _percentiles([s.duration for s in backend_spans]),
+            "peak_concurrency": _peak_concurrency(backend_spans),
+        }
+    return report
+
+
+def render_html(report: Dict[str, Any], title: str) -> str:
+    rows = [("Requests", report["requests"]), ("Throughput (questions/min)", report["throughput_per_minute"]),
+            ("Status", report["status"]), ("Error rate", report["error_rate"]),
+            ("Rejection rate", report["rejection_rate"]),
+            ("Coalesced rate", report["coalesced_rate"]), ("Retry rate", report["retry_rate"]),
+            ("Latency (s)", report["latency_seconds"]), ("Queue wait (s)", report["queue_wait_seconds"])]
+    summary = "".join(f"<tr><th>{html.escape(k)}</th><td>{html.escape(str(v))}</td></tr>" for k, v in rows)
+    backends = "".join(
+        f"<tr><td>{html.escape(name)}</td><td>{b['calls']}</td><td>{b['errors']}</td>"
+        f"<td>{b['latency_seconds']['p50']}</td><td>{b['latency_seconds']['p95']}</td>"
+        f"<td>{b['latency_seconds']['p99']}</td><td>{b['peak_concurrency']}</td></tr>"
+        for name, b in report["backends"].items())
+    errors = "".join(f"<li>{html.escape(e)}</li>" for e in report["errors"])
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+            "<style>body{font-family:sans-serif;margin:2rem}table{border-collapse:collapse;margin-bottom:1.5rem}"
+            "th,td{border:1px solid #ccc;padding:.3rem .6rem;text-align:left}</style></head><body>"
+            f"<h1>{html.escape(title)}</h1><table>{summary}</table><h2>Backends</h2><table>"
+            "<tr><th>backend</th><th>calls</th><th>errors</th><th>p50 (s)</th><th>p95 (s)</th><th>p99 (s)</th>"
+            f"<th>peak concurrent calls</th></tr>{backends}</table>"
+            f"{'<h2>Errors</h2><ul>' + errors + '</ul>' if errors else ''}</body></html>")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent load test of the query pipeline.")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, help="concurrent clients (closed loop, default 4)")
+    load.add_argument("--rate", type=float, help="questions per second (open loop, Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to generate load")
+    parser.add_argument("--mix", help="JSON object {question: weight}; defaults to the benchmark corpus")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--backend", choices=("fake", "live"), default="fake")
+    parser.add_argument("--url", help="POST questions to this endpoint instead of calling process_query")
+    parser.add_argument("--timeout", type=float, default=300.0, help="HTTP timeout per question")
+    parser.add_argument("--max-workers", type=int, help="executor workers (defaults to QUERY_MAX_CONCURRENCY)")
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--escalated-llm-latency", type=float)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--graph-latency", type=float, default=0.0)
+    parser.add_argument("--vector-latency", type=float, default=0.0)
+    parser.add_argument("--dataguide-cache-ttl", type=float, default=300.0)
+    parser.add_argument("--json", help="write the report to this JSON file")
+    parser.add_argument("--html", help="write the report to this HTML file")
+    args = parser.parse_args(argv)
+    if not args.rate and not args.concurrency:
+        args.concurrency = 4
+
+    mix = load_mix(args.mix, args.corpus)
+    shutdown = None
+    if args.url:
+        target = http_target(args.url, args.timeout)
+    else:
+        if args.backend == "live":
+            resources = SharedResources()
+        else:
+            resources = build_resources(load_questions(args.corpus), args)
+        target, shutdown = in_process_target(resources, args.max_workers)
+
+    spans: List[Span] = []
+    add_span_exporter(spans.append)
+    start = time.perf_counter()
+    try:
+        outcomes = drive(target, mix, args.duration, args.concurrency, args.rate)
+    finally:
+        remove_span_exporter(spans.append)
+        if shutdown:
+            shutdown()
+    report = summarize(outcomes, spans, time.perf_counter() - start)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.html:
+        mode = f"rate {args.rate}/s" if args.rate else f"concurrency {args.concurrency}"
+        with open(args.html, "w", encoding="utf-8") as f:
+            f.write(render_html(report, f"Load test ({mode}, {args.duration:.0f}s, {args.url or args.backend})"))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
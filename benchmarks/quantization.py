@@ -0,0 +1,207 @@
+"""
+Memory, speed and recall of quantized few-shot search (see `paths_vectorDB/quantization.py`) against the current
+float32 search, measured with brute-force NumPy scans so that only the vector representation differs:
+
+- float32: exact inner product over the full-precision vectors (the reference);
+- int8: per-dimension scalar quantization (the codes of an IVF_SQ8 index), scored by the dequantized inner product;
+- binary: sign bits, scored by Hamming distance.
+
+Each quantized scan fetches `--rerank-factor` x k candidates (one row per factor), which are re-ranked by their
+exact inner product read from a memory-mapped float32 file, like the full-precision vectors Milvus keeps on disk. The
+report gives, per method, the memory scanned, p50/p99 query latency, speedup over float32 and recall@k against the
+exact top k (before and after re-ranking). NumPy has no int8 dot-product kernel, so the int8 scan dequantizes and is
+slower than float32 here; Milvus scans IVF_SQ8 codes with SIMD (compare with benchmarks/ann_tuning.py).
+
+Vectors are clustered random unit vectors shaped like text embeddings unless `--collection` copies the embeddings of
+a live Milvus collection (grown to `--scale` vectors with perturbed copies, as in benchmarks/ann_tuning.py).
+
+Usage (from the repository root):
+    python -m benchmarks.quantization --scale 100000
+    python -m benchmarks.quantization --collection default --scale 50000 --json quantization.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from paths_vectorDB.quantization import QUANTIZATIONS
+
+DIM = 512
+# Rows scanned per block by the int8 scan (each block is dequantized to float32 on the fly)
+SCAN_BLOCK = 16384
+# Set bits of every byte value, for Hamming distances on packed sign bits
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+HAS_BITWISE_COUNT = hasattr(np, "bitwise_count")  # NumPy >= 2.0
+
+
+def synthetic_embeddings(count: int, rng: np.random.Generator, clusters: int = 256) -> np.ndarray:
+    """Unit vectors around `clusters` random topics, like the embeddings of related path descriptions."""
+    centers = rng.normal(size=(clusters, DIM)).astype(np.float32)
+    noise = rng.normal(0.0, 0.6, size=(count, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=count)] + noise
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class Int8Codes:
+    """Per-dimension scalar quantization of float vectors into uint8 codes (256 levels between min and max)."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.low = vectors.min(axis=0)
+        self.step = np.maximum(vectors.max(axis=0) - self.low, 1e-12) / 255
+        self.codes = np.round((vectors - self.low) / self.step).astype(np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.low.nbytes + self.step.nbytes
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        # q . (low + code * step) = q . low + code . (q * step)
+        weights = (query * self.step).astype(np.float32)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK):
+            scores[start:start + SCAN_BLOCK] = self.codes[start:start + SCAN_BLOCK].astype(np.float32) @ weights
+        return scores + float(query @ self.low)
+
+
+class BinaryCodes:
+    """Sign bits of the vectors, packed 8 dimensions per byte (the values of the BINARY_FIELD)."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.codes = np.packbits(vectors > 0, axis=1)
+        # 64 bits per word for the popcount, when the dimension allows it
+        self._words = self.codes.view(np.uint64) if self.codes.shape[1] % 8 == 0 and HAS_BITWISE_COUNT else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        # higher is better: negated Hamming distance
+        code = np.packbits(query > 0)
+        if self._words is not None:
+            return -np.bitwise_count(self._words ^ code.view(np.uint64)).sum(axis=1, dtype=np.int32)
+        return -_POPCOUNT[np.bitwise_xor(self.codes, code)].sum(axis=1, dtype=np.int32)
+
+
+def _top(scores: np.ndarray, count: int) -> np.ndarray:
+    count = min(count, len(scores))
+    candidates = np.argpartition(-scores, count - 1)[:count]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def measure(name: str, scan: Callable[[np.ndarray], np.ndarray], nbytes: int, queries: np.ndarray,
+            exact: np.ndarray, full_precision: np.ndarray, top_k: int, rerank_factor: int,
+            repeats: int) -> Dict[str, Any]:
+    """Latency and recall of one method; quantized methods re-rank rerank_factor * top_k candidates exactly."""
+    rerank = name != "float32"
+    rerank_factor = rerank_factor if rerank else 0
+    latencies, recalls, first_pass_recalls = [], [], []
+    scan(queries[0])  # warm-up
+    for _ in range(repeats):
+        for query, truth in zip(queries, exact):
+            start = time.perf_counter()
+            scores = scan(query)
+            if rerank:
+                candidates = _top(scores, top_k * rerank_factor)
+                # rows read from the memory-mapped file, in file order
+                rows = np.sort(candidates)
+                found = rows[_top(np.asarray(full_precision[rows]) @ query, top_k)]
+            else:
+                candidates = found = _top(scores, top_k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(found.tolist()) & set(truth.tolist())) / top_k)
+            first_pass_recalls.append(len(set(candidates[:top_k].tolist()) & set(truth.tolist())) / top_k)
+    return {
+        "method": name,
+        "rerank_factor": rerank_factor,
+        "memory_mib": round(nbytes / 2 ** 20, 2),
+        f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+        f"first_pass_recall@{top_k}": round(float(np.mean(first_pass_recalls)), 4),
+        "p50_ms": round(1000 * _percentile(latencies, 50), 3),
+        "p99_ms": round(1000 * _percentile(latencies, 99), 3),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Memory, speed and recall of int8/binary quantized search with "
+                                                 "exact re-ranking, against float32 search.")
+    parser.add_argument("--collection", help="copy the embeddings of this live Milvus collection")
+    parser.add_argument("--scale", type=int, default=50000, help="number of vectors (default 50000)")
+    parser.add_argument("--queries", type=int, default=100, help="number of query vectors (default 100)")
+    parser.add_argument("--repeats", type=int, default=3, help="times each query is searched (default 3)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rerank-factor", type=int, nargs="+", default=[4, 16],
+                        help="candidates re-ranked per result; one row per value (default 4 16)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    from benchmarks.ann_tuning import perturbed
+
+    rng = np.random.default_rng(args.seed)
+    if args.collection:
+        from pymilvus import connections
+
+        from benchmarks.ann_tuning import load_embeddings
+
+        connections.connect(alias="default", host='localhost', port='19530')
+        vectors = load_embeddings(args.collection)
+        if len(vectors) == 0:
+            print(f"Collection {args.collection} is empty.")
+            return 1
+        if args.scale > len(vectors):
+            vectors = np.concatenate([vectors, perturbed(vectors, args.scale - len(vectors), rng)])
+    else:
+        vectors = synthetic_embeddings(args.scale, rng)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = perturbed(vectors, args.queries, rng)
+    top_k = min(args.top_k, len(vectors))
+    exact = np.stack([_top(vectors @ query, top_k) for query in queries])
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        # the full-precision vectors used for re-ranking stay on disk
+        path = os.path.join(directory, "embeddings.f32")
+        vectors.tofile(path)
+        full_precision = np.memmap(path, dtype=np.float32, mode="r", shape=vectors.shape)
+        int8, binary = Int8Codes(vectors), BinaryCodes(vectors)
+        methods = {"float32": (lambda q: vectors @ q, vectors.nbytes), "int8": (int8.scores, int8.nbytes),
+                   "binary": (binary.scores, binary.nbytes)}
+        for name in ("float32",) + QUANTIZATIONS[1:]:
+            scan, nbytes = methods[name]
+            for rerank_factor in (args.rerank_factor if name != "float32" else [0]):
+                print(f"Measuring {name}" + (f" x{rerank_factor}..." if rerank_factor else "..."))
+                rows.append(measure(name, scan, nbytes, queries, exact, full_precision, top_k, rerank_factor,
+                                    args.repeats))
+        del full_precision
+
+    baseline = rows[0]
+    for row in rows:
+        row["memory_reduction"] = round(baseline["memory_mib"] / row["memory_mib"], 1) if row["memory_mib"] else 0.0
+        row["speedup"] = round(baseline["p50_ms"] / row["p50_ms"], 2) if row["p50_ms"] else 0.0
+
+    columns = ["method", "rerank_factor", "memory_mib", "memory_reduction", "p50_ms", "p99_ms", "speedup",
+               f"first_pass_recall@{top_k}", f"recall@{top_k}"]
+    print(f"\n{len(vectors)} vectors (dim {vectors.shape[1]}), {len(queries)} queries x {args.repeats}, "
+          f"rerank_factor x {top_k} candidates re-ranked")
+    print(f"{columns[0]:<10}" + "".join(f"{column:>{len(column) + 3}}" for column in columns[1:]))
+    for row in rows:
+        print(f"{row['method']:<10}" + "".join(f"{row[column]:>{len(column) + 3}}" for column in columns[1:]))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"collection": args.collection, "vectors": len(vectors), "queries": len(queries),
+                       "top_k": top_k, "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
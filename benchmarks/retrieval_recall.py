@@ -0,0 +1,120 @@
+"""
+Recall benchmark of few-shot example retrieval: vector search alone, BM25 keyword search alone and both fused by
+reciprocal rank fusion (see `paths_vectorDB/keyword_index.py`).
+
+Each question of `benchmarks/retrieval_queries.json` lists what a useful example must contain; the report gives, per
+retrieval mode, recall@k (share of questions with at least one relevant example in the top k), MRR@k and the mean
+search time, and the mean time to embed a question. Vectors come from the hashed bag-of-words FakeEmbedder unless
+`--openai` (the OpenAI embedding model, needs OPENAI_API_KEY) or `--local` (the local CPU embedder of
+`paths_vectorDB/embedders.py`) is given.
+
+Usage (from the repository root):
+    python -m benchmarks.retrieval_recall
+    python -m benchmarks.retrieval_recall --openai --top-k 3
+    python -m benchmarks.retrieval_recall --local
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from app.config import Config
+from benchmarks.fakes import DEFAULT_DESCRIPTIONS_FILE, FakeEmbedder, LocalVectorStore
+from paths_vectorDB.keyword_index import Hit
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_queries.json")
+MODES = ("vector", "keyword", "hybrid")
+
+
+class ProductionEmbedder:
+    """An embedder of paths_vectorDB.embedders ("openai" or "local") behind the FakeEmbedder interface."""
+
+    def __init__(self, name: str):
+        from paths_vectorDB.embedders import get_embedder
+
+        self.embedder = get_embedder(name)
+        self.dim = self.embedder.dim
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = self.embedder.embed_query(text)
+        if not vector:
+            raise RuntimeError("Embedding generation failed")
+        return np.asarray(vector, dtype=np.float32)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed(text).tolist()
+
+
+def _is_relevant(hit: Hit, relevant: List[str]) -> bool:
+    return any(marker in hit[0] for marker in relevant)
+
+
+def evaluate(store: LocalVectorStore, queries: List[Dict[str, Any]], top_k: int) -> Dict[str, Dict[str, float]]:
+    query_vectors, embed_durations = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(store.embedder.embed_query(query["question"]))
+        embed_durations.append(time.perf_counter() - start)
+    searches: Dict[str, Callable[[str, List[float]], List[Hit]]] = {
+        "vector": lambda question, vector: store.vector_hits(vector, top_k),
+        "keyword": lambda question, vector: store.keyword_index.search(question, top_k),
+        "hybrid": lambda question, vector: store.hybrid_hits(question, vector, top_k),
+    }
+    report = {}
+    for mode, search in searches.items():
+        found, reciprocal_ranks, durations = 0, [], []
+        for query, vector in zip(queries, query_vectors):
+            start = time.perf_counter()
+            hits = search(query["question"], vector)
+            durations.append(time.perf_counter() - start)
+            ranks = [rank for rank, hit in enumerate(hits, start=1) if _is_relevant(hit, query["relevant"])]
+            found += bool(ranks)
+            reciprocal_ranks.append(1.0 / ranks[0] if ranks else 0.0)
+        report[mode] = {
+            f"recall@{top_k}": found / len(queries),
+            f"mrr@{top_k}": sum(reciprocal_ranks) / len(queries),
+            "search_ms": 1000 * sum(durations) / len(durations),
+        }
+    report["query_embedding_ms"] = 1000 * sum(embed_durations) / len(embed_durations)
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recall of vector, keyword and hybrid few-shot retrieval.")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="JSON file with questions and relevance markers")
+    parser.add_argument("--examples", default=DEFAULT_DESCRIPTIONS_FILE, help="paths/descriptions file")
+    parser.add_argument("--top-k", type=int, default=5, help="examples retrieved per question (default 5)")
+    embedders = parser.add_mutually_exclusive_group()
+    embedders.add_argument("--openai", action="store_true", help="use the OpenAI embedding model")
+    embedders.add_argument("--local", action="store_true", help="use the local CPU embedder")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.queries, encoding="utf-8") as f:
+        queries = json.load(f)["queries"]
+    if args.openai or args.local:
+        embedder = ProductionEmbedder("openai" if args.openai else "local")
+    else:
+        embedder = FakeEmbedder()
+    store = LocalVectorStore(embedder, file_path=args.examples)
+    report = evaluate(store, queries, args.top_k)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{len(queries)} questions, {len(store.paths)} examples, top {args.top_k}, "
+          f"{Config.HYBRID_CANDIDATES} candidates per list, RRF k={Config.HYBRID_RRF_K}, "
+          f"query embedding {report['query_embedding_ms']:.3f} ms")
+    columns = list(report["vector"])
+    print(f"{'mode':<10}" + "".join(f"{column:>14}" for column in columns))
+    for mode in MODES:
+        print(f"{mode:<10}" + "".join(f"{report[mode][column]:>14.3f}" for column in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
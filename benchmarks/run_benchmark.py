@@ -0,0 +1,225 @@
+"""
+Offline benchmark of the end-to-end query pipeline (`app.qa_chain.arun_query`).
+
+The real pipeline runs unchanged; only its external services are replaced by local stand-ins (see
+`benchmarks/fakes.py` and `benchmarks/in_memory_graph.py`): a fake chat model and embedder with configurable
+latency, an in-memory Pennsieve-shaped graph and a local vector store. Every question is answered `--iterations`
+times and the report gives, per stage (span name), p50/p95 latency, plus peak allocations, call counts and prompt
+token sizes per query.
+
+With `--cassette`, the questions, prompts and results of a recorded session are replayed instead (see
+`benchmarks/cassette.py`).
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmark                                 # print the report
+    python -m benchmarks.run_benchmark --cassette session.jsonl.gz --emulate-latency
+    python -m benchmarks.run_benchmark --save-baseline baseline.json   # record a baseline
+    python -m benchmarks.run_benchmark --baseline baseline.json        # exit 1 if a metric regressed
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+import app.main as app_main
+from app.config import Config
+from app.dataguide import extract_dataguide_paths
+from app.model_tiers import ModelLadder
+from app.qa_chain import arun_query
+from app.resources import SharedResources
+from app.tracing import Span, add_span_exporter, remove_span_exporter
+from benchmarks.cassette import Cassette, replay_resources
+from benchmarks.fakes import FakeChatModel, FakeEmbedder, LocalVectorStore
+from benchmarks.fixtures import build_sample_graph
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.json")
+# Latency metrics below this many milliseconds are never reported as regressions (timer noise)
+LATENCY_NOISE_FLOOR_MS = 2.0
+
+
+def load_questions(corpus_path: str) -> List[Dict[str, Any]]:
+    """The example_query* questions of app/main.py followed by the corpus questions, without duplicates."""
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        corpus = json.load(f)["queries"]
+    by_question = {entry["question"]: entry for entry in corpus}
+    questions = [value for name, value in sorted(vars(app_main).items()) if name.startswith("example_query")]
+    questions.extend(entry["question"] for entry in corpus if entry["question"] not in questions)
+    return [by_question.get(question, {"question": question}) for question in questions]
+
+
+def build_resources(entries: List[Dict[str, Any]], args: argparse.Namespace) -> SharedResources:
+    graph = build_sample_graph(latency=args.graph_latency)
+    for entry in entries:
+        if "cypher" in entry:
+            graph.register_result(entry["cypher"], entry.get("rows", []))
+    responses = {e["question"]: e["cypher"] for e in entries if "cypher" in e}
+    escalated_latency = args.llm_latency if args.escalated_llm_latency is None else args.escalated_llm_latency
+    # same answers on both tiers; the escalated one only differs by its latency
+    ladder = ModelLadder(["fake-fast", "fake-reasoning"], provider=lambda name: FakeChatModel(
+        responses=responses, latency=args.llm_latency if name == "fake-fast" else escalated_latency))
+    store = LocalVectorStore(FakeEmbedder(latency=args.embed_latency), latency=args.vector_latency)
+    return SharedResources(
+        graph=graph,
+        model_ladder=ladder,
+        few_shot_retriever=store.search,
+        batch_few_shot_retriever=store.search_many,
+        dataguide_fetcher=lambda g: asyncio.to_thread(extract_dataguide_paths, g),
+        dataguide_cache_ttl=args.dataguide_cache_ttl,
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] if ordered else 0.0
+
+
+async def run(entries: List[Dict[str, Any]], resources: SharedResources, iterations: int,
+              verbose: bool) -> Dict[str, Any]:
+    spans: List[Span] = []
+    add_span_exporter(spans.append)
+    stage_durations: Dict[str, List[float]] = defaultdict(list)
+    peaks: List[int] = []
+    per_query: List[Dict[str, Any]] = []
+    answer_paths: Counter = Counter()
+    router_outcomes: Counter = Counter()
+    failures = 0
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            for entry in entries:
+                spans.clear()
+                tracemalloc.reset_peak()
+                start = time.perf_counter()
+                output = io.StringIO()
+                with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                    try:
+                        response = await arun_query(entry["question"], resources=resources)
+                    except Exception as e:
+                        response = None
+                        print(f"FAILED: {entry['question']}: {e}", file=sys.stderr)
+                elapsed = time.perf_counter() - start
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                if not isinstance(response, dict):
+                    failures += 1
+                else:
+                    answer_paths[response.get("answer_path") or "none"] += 1
+                for s in spans:
+                    stage_durations[s.name].append(s.duration)
+                    if s.name == "qa.attempt" and s.attributes.get("tier"):
+                        stage_durations[f"qa.attempt[{s.attributes['tier']}]"].append(s.duration)
+                    if s.name == "router.route":
+                        router_outcomes[s.attributes.get("outcome") or "none"] += 1
+                llm_spans = [s for s in spans if s.name == "llm.call"]
+                per_query.append({
+                    "seconds": elapsed,
+                    "llm_calls": len(llm_spans),
+                    "prompt_tokens": sum(s.attributes.get("prompt_tokens") or 0 for s in llm_spans),
+                    "completion_tokens": sum(s.attributes.get("completion_tokens") or 0 for s in llm_spans),
+                    "graph_queries": sum(1 for s in spans if s.name == "neo4j.query"),
+                    "attempts": sum(1 for s in spans if s.name == "qa.attempt"),
+                })
+    finally:
+        tracemalloc.stop()
+        remove_span_exporter(spans.append)
+
+    queries = len(per_query)
+    metrics: Dict[str, float] = {}
+    for name, durations in sorted(stage_durations.items()):
+        metrics[f"stage.{name}.p50_ms"] = _percentile(durations, 50) * 1000
+        metrics[f"stage.{name}.p95_ms"] = _percentile(durations, 95) * 1000
+        metrics[f"stage.{name}.calls_per_query"] = len(durations) / queries
+    metrics["alloc.peak_kib.mean"] = sum(peaks) / queries / 1024
+    metrics["alloc.peak_kib.max"] = max(peaks) / 1024
+    for key in ("llm_calls", "prompt_tokens", "completion_tokens", "graph_queries", "attempts"):
+        metrics[f"per_query.{key}"] = sum(q[key] for q in per_query) / queries
+    metrics["per_query.failures"] = failures / queries
+    routed = sum(router_outcomes.values())
+    return {"queries": queries, "answer_paths": dict(answer_paths), "router_outcomes": dict(router_outcomes),
+            "router_hit_rate": router_outcomes["hit"] / routed if routed else 0.0, "metrics": metrics}
+
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Metrics that grew by more than `tolerance` (relative) over the baseline. All metrics are lower-is-better."""
+    regressions = []
+    for key, base in sorted(baseline.items()):
+        if key not in current:
+            continue
+        value = current[key]
+        if key.endswith("_ms") and value < LATENCY_NOISE_FLOOR_MS:
+            continue
+        if value > base * (1 + tolerance) and value - base > 1e-9:
+            regressions.append(f"{key}: {base:.3f} -> {value:.3f} (+{(value / base - 1) * 100 if base else math.inf:.1f}%)")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"queries: {report['queries']}  answer paths: {report['answer_paths']}")
+    if report.get("router_outcomes"):
+        print(f"router hit rate: {report['router_hit_rate']:.1%}  outcomes: {report['router_outcomes']}")
+    print(f"{'metric':<52}{'value':>14}")
+    for key, value in report["metrics"].items():
+        print(f"{key:<52}{value:>14.3f}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the query pipeline.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON file with questions, Cypher and rows")
+    parser.add_argument("--iterations", type=int, default=3, help="times each question is answered")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--escalated-llm-latency", type=float, help="seconds per call to the second model tier "
+                                                                    "(default: --llm-latency)")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per fake embedding call")
+    parser.add_argument("--graph-latency", type=float, default=0.0, help="seconds per in-memory graph query")
+    parser.add_argument("--vector-latency", type=float, default=0.0, help="seconds per local vector search")
+    parser.add_argument("--cassette", help="replay this recorded session instead of using the fakes")
+    parser.add_argument("--emulate-latency", action="store_true", help="sleep for the cassette's recorded latencies")
+    parser.add_argument("--dataguide-cache-ttl", type=float, default=Config.DATAGUIDE_CACHE_TTL_SECONDS)
+    parser.add_argument("--save-baseline", help="write the metrics to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase (default 0.2)")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args(argv)
+
+    # keep benchmark spans out of the production trace log and metrics textfile
+    Config.TRACE_LOG_PATH = ""
+    Config.METRICS_TEXTFILE_PATH = ""
+
+    if args.cassette:
+        cassette = Cassette.load(args.cassette, emulate_latency=args.emulate_latency)
+        entries = [{"question": question} for question in cassette.questions]
+        with cassette.replaying():
+            report = asyncio.run(run(entries, replay_resources(cassette), args.iterations, args.verbose))
+        report["cassette_misses"] = cassette.misses
+    else:
+        entries = load_questions(args.corpus)
+        resources = build_resources(entries, args)
+        report = asyncio.run(run(entries, resources, args.iterations, args.verbose))
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(report["metrics"], baseline, args.tolerance)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
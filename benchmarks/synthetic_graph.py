@@ -0,0 +1,238 @@
+"""
+Synthetic Pennsieve-shaped graphs for scale testing.
+
+`generate_graph()` builds N datasets, each with directories, a manifest.json, a dataset_description.json with
+contributors and EDF files whose `_rawSignals`/`_physicalSignals` arrays have a configurable number of channels,
+records and samples, plus the matching :DataGuide. The graph is built in an InMemoryGraph and can be written to a
+local Neo4j with batched UNWIND writes (`load_into_neo4j()`).
+
+`python -m benchmarks.synthetic_graph` then times the graph-touching stages (DataGuide extraction, schema refresh,
+random path sampling and formatting) at increasing scales and reports time and peak allocations per stage.
+
+Usage (from the repository root):
+    python -m benchmarks.synthetic_graph --datasets 1 10 50 --records 60 --samples 20
+    python -m benchmarks.synthetic_graph --datasets 10 --neo4j --clear      # NEO4J_* from .env; scratch DB only!
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.dataguide import extract_dataguide_paths, format_paths_for_llm
+from benchmarks.in_memory_graph import InMemoryGraph
+from paths_vectorDB.random_path_generator import format_path_into_cypher, generate_random_paths
+
+# Extra label on every node written to Neo4j, so `--clear` only removes synthetic data
+SYNTHETIC_LABEL = "Synthetic"
+LICENSES = ("Creative Commons Attribution", "MIT", "CC0", "Apache-2.0")
+FILE_TYPES = ("CSV", "JSON", "EDF", "Python", "Markdown", "TIFF")
+FIRST_NAMES = ("Ada", "Alan", "Grace", "Edsger", "Barbara", "Donald", "Frances", "Ken")
+LAST_NAMES = ("Lovelace", "Turing", "Hopper", "Dijkstra", "Liskov", "Knuth", "Allen", "Thompson")
+
+
+def _edf_document(rng: random.Random, channels: int, records: int, samples: int) -> Dict[str, Any]:
+    signal_info = [{"label": f"EEG {c}", "nbOfSamples": float(samples), "physicalMaximum": 3276.7,
+                    "physicalMinimum": -3276.8, "prefiltering": "HP:0.1Hz LP:75Hz"} for c in range(channels)]
+    raw = [[{str(k): float(rng.randint(-2048, 2047)) for k in range(samples)} for _ in range(records)]
+           for _ in range(channels)]
+    physical = [[{key: value / 10 for key, value in record.items()} for record in signal] for signal in raw]
+    return {
+        "_header": {"patientId": f"P{rng.randint(1000, 9999)}", "recordingId": "Startdate 01-JAN-2020",
+                    "signalInfo": signal_info},
+        "_rawSignals": raw,
+        "_physicalSignals": physical,
+    }
+
+
+def _contributor(rng: random.Random) -> Dict[str, Any]:
+    return {"first_name": rng.choice(FIRST_NAMES), "last_name": rng.choice(LAST_NAMES),
+            "orcid": "-".join(f"{rng.randint(0, 9999):04d}" for _ in range(4)),
+            "degree": rng.choice(("PhD", "MS", "BS"))}
+
+
+def generate_graph(datasets: int, directories: int = 2, files_per_directory: int = 3, edf_files: int = 1,
+                   channels: int = 12, records: int = 60, samples: int = 20, seed: int = 0) -> InMemoryGraph:
+    """
+    Builds a Pennsieve-shaped graph in memory. Real EDF files have 12 channels x 600 records x 200 samples; the
+    defaults are smaller so a few datasets fit comfortably in memory.
+
+    Args:
+        datasets (int): Number of :Dataset nodes.
+        directories (int, optional): :Directory nodes per dataset. Defaults to 2.
+        files_per_directory (int, optional): JSON files per directory. Defaults to 3.
+        edf_files (int, optional): EDF files per dataset. Defaults to 1.
+        channels (int, optional): Signals per EDF file (`_rawSignals` length). Defaults to 12.
+        records (int, optional): Records per signal. Defaults to 60.
+        samples (int, optional): Samples per record. Defaults to 20.
+        seed (int, optional): Random seed, so the same arguments always give the same graph. Defaults to 0.
+
+    Returns:
+        InMemoryGraph: The graph, with its :DataGuide built.
+    """
+    rng = random.Random(seed)
+    graph = InMemoryGraph()
+    root = graph.add_node(("Pennsieve",))
+    for d in range(datasets):
+        dataset = graph.add_node(("Dataset",), {"name": f"Synthetic Dataset {d}", "id": float(1000 + d)})
+        graph.add_edge(root, "DATASET", dataset)
+
+        manifest = graph.add_node(("File",), {"name": "manifest.json"})
+        graph.add_edge(dataset, "FILES", manifest)
+        graph.add_json(manifest, "DATA", {
+            "license": rng.choice(LICENSES),
+            "creator": {"name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"},
+            "files": [{"path": f"dir{i}/file{j}.json", "file_type": rng.choice(FILE_TYPES)}
+                      for i in range(directories) for j in range(files_per_directory)],
+        })
+        description = graph.add_node(("File",), {"name": "dataset_description.json"})
+        graph.add_edge(dataset, "FILES", description)
+        graph.add_json(description, "DATA", {"contributors": [_contributor(rng) for _ in range(rng.randint(1, 4))]})
+
+        for i in range(directories):
+            directory = graph.add_node(("Directory",), {"name": f"dir{i}"})
+            graph.add_edge(dataset, "FILES", directory)
+            for j in range(files_per_directory):
+                file_node = graph.add_node(("File",), {"name": f"file{j}.json"})
+                graph.add_edge(directory, "FILES", file_node)
+                graph.add_json(file_node, "DATA", {"subject": f"sub-{rng.randint(1, 99):02d}",
+                                                   "measurements": [rng.random() for _ in range(5)]})
+
+        for e in range(edf_files):
+            edf = graph.add_node(("File",), {"name": f"recording{e}.edf"})
+            graph.add_edge(dataset, "FILES", edf)
+            graph.add_json(edf, "DATA", _edf_document(rng, channels, records, samples))
+
+    graph.build_dataguide()
+    return graph
+
+
+def _edge_count(graph: InMemoryGraph) -> int:
+    return sum(len(edges) for edges in graph.out_edges.values())
+
+
+def load_into_neo4j(graph: InMemoryGraph, neo4j_graph: Any, batch_size: int = 5000) -> None:
+    """
+    Writes `graph` to Neo4j with batched UNWIND statements: nodes are created per label set (with a temporary
+    `_sid` key, indexed, used to connect relationships), then relationships per type. All nodes get the
+    SYNTHETIC_LABEL label.
+
+    Args:
+        graph (InMemoryGraph): Graph built by generate_graph().
+        neo4j_graph: Neo4jGraph (or anything with `query(text, params)`) connected to a scratch database.
+        batch_size (int, optional): Rows per UNWIND statement. Defaults to 5000.
+    """
+    neo4j_graph.query(f"CREATE INDEX synthetic_sid IF NOT EXISTS FOR (n:{SYNTHETIC_LABEL}) ON (n._sid)")
+    by_labels: Dict[Tuple[str, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for node_id, (labels, properties) in graph.nodes.items():
+        by_labels[labels].append({"sid": node_id, "props": properties})
+    for labels, rows in by_labels.items():
+        label_expr = ":".join(f"`{label}`" for label in labels + (SYNTHETIC_LABEL,))
+        for start in range(0, len(rows), batch_size):
+            neo4j_graph.query(f"UNWIND $rows AS row CREATE (n:{label_expr}) SET n = row.props, n._sid = row.sid",
+                              {"rows": rows[start:start + batch_size]})
+
+    by_type: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for start_id, edges in graph.out_edges.items():
+        for rel_type, properties, end_id in edges:
+            by_type[rel_type].append({"s": start_id, "e": end_id, "props": properties})
+    for rel_type, rows in by_type.items():
+        for start in range(0, len(rows), batch_size):
+            neo4j_graph.query(
+                f"UNWIND $rows AS row MATCH (a:{SYNTHETIC_LABEL} {{_sid: row.s}}) "
+                f"MATCH (b:{SYNTHETIC_LABEL} {{_sid: row.e}}) CREATE (a)-[r:`{rel_type}`]->(b) SET r = row.props",
+                {"rows": rows[start:start + batch_size]})
+    _batched_write(neo4j_graph, f"MATCH (n:{SYNTHETIC_LABEL}) WHERE n._sid IS NOT NULL "
+                                f"WITH n LIMIT {batch_size} REMOVE n._sid RETURN count(n) AS count")
+
+
+def clear_neo4j(neo4j_graph: Any, batch_size: int = 5000) -> None:
+    """Deletes every node carrying SYNTHETIC_LABEL (and its relationships) in batches."""
+    _batched_write(neo4j_graph, f"MATCH (n:{SYNTHETIC_LABEL}) WITH n LIMIT {batch_size} DETACH DELETE n "
+                                f"RETURN count(n) AS count")
+
+
+def _batched_write(neo4j_graph: Any, query: str) -> None:
+    while neo4j_graph.query(query)[0]["count"]:
+        pass
+
+
+def _measure(stage: str, fn: Callable[[], Any], report: Dict[str, Any]) -> Any:
+    # peak allocations on top of what was already allocated (e.g. the graph itself)
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn()
+    report[f"{stage}.seconds"] = round(time.perf_counter() - start, 4)
+    report[f"{stage}.peak_mib"] = round((tracemalloc.get_traced_memory()[1] - before) / 2 ** 20, 2)
+    return result
+
+
+def run_stages(graph: Any, random_paths: int) -> Dict[str, Any]:
+    """Times the graph-touching stages of the app against `graph` (in-memory or Neo4j)."""
+    report: Dict[str, Any] = {}
+    dataguide = _measure("dataguide.extract", lambda: extract_dataguide_paths(graph), report)
+    formatted = _measure("dataguide.format", lambda: format_paths_for_llm(dataguide), report)
+    report["dataguide.paths"] = len(formatted)
+    _measure("schema.refresh", graph.refresh_schema, report)
+    report["schema.chars"] = len(graph.schema)
+    raw_paths = _measure("paths.generate", lambda: generate_random_paths(graph, random_paths), report)
+    _measure("paths.format", lambda: [format_path_into_cypher(p[0]["path"]) for p in raw_paths if p], report)
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scale test of the graph-touching stages on synthetic graphs.")
+    parser.add_argument("--datasets", type=int, nargs="+", default=[1, 5, 25], help="scales to run")
+    parser.add_argument("--directories", type=int, default=2)
+    parser.add_argument("--files-per-directory", type=int, default=3)
+    parser.add_argument("--edf-files", type=int, default=1)
+    parser.add_argument("--channels", type=int, default=12)
+    parser.add_argument("--records", type=int, default=60)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--random-paths", type=int, default=45, help="paths sampled by generate_random_paths")
+    parser.add_argument("--neo4j", action="store_true", help="load each scale into Neo4j (NEO4J_* settings)")
+    parser.add_argument("--clear", action="store_true", help="with --neo4j: delete synthetic nodes between scales")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    neo4j_graph = None
+    if args.neo4j:
+        from app.database_setup import setup_neo4j_graph
+        neo4j_graph = setup_neo4j_graph(refresh_schema=False)
+
+    reports = []
+    tracemalloc.start()
+    try:
+        for datasets in args.datasets:
+            report: Dict[str, Any] = {"datasets": datasets}
+            graph = _measure("graph.generate", lambda: generate_graph(
+                datasets, args.directories, args.files_per_directory, args.edf_files, args.channels, args.records,
+                args.samples), report)
+            report["nodes"], report["relationships"] = len(graph.nodes), _edge_count(graph)
+            target = graph
+            if neo4j_graph is not None:
+                if args.clear:
+                    _measure("neo4j.clear", lambda: clear_neo4j(neo4j_graph), report)
+                _measure("neo4j.load", lambda: load_into_neo4j(graph, neo4j_graph), report)
+                target = neo4j_graph
+            report.update(run_stages(target, args.random_paths))
+            reports.append(report)
+            print(json.dumps(report))
+    finally:
+        tracemalloc.stop()
+
+    keys = [key for key in reports[0] if key.endswith((".seconds", ".peak_mib"))] if reports else []
+    print(f"\n{'stage':<32}" + "".join(f"{r['datasets']:>12}" for r in reports))
+    for key in ("nodes", "relationships") + tuple(keys):
+        print(f"{key:<32}" + "".join(f"{r.get(key, ''):>12}" for r in reports))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
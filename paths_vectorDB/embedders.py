@@ -0,0 +1,251 @@
+"""
+Embedders of the few-shot examples and of the user questions (Config.EMBEDDER):
+
+- "openai": `text-embedding-3-small` at 512 dimensions, through the OpenAI embeddings API (the default);
+- "local": LocalEmbedder, a CPU-only hashed n-gram embedder. It needs no network, model file or API key, embeds a
+  question in well under a millisecond and a batch of texts with a few NumPy operations.
+
+Vectors of different embedders are not comparable. Every collection records the signature of the embedder that
+filled it in its description (see collection_description()). require_embedder() refuses to search or extend a
+collection with another embedder; rebuild the collection (or build a new one) after switching.
+
+Usage (from the repository root):
+    python -m paths_vectorDB.embedders show --collection default   # the embedder that filled a collection
+    python -m benchmarks.retrieval_recall --local                  # recall and query embedding time of LocalEmbedder
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config import Config
+
+# Dimension of the `embedding` field (see vectorDB_setup.define_schema())
+EMBEDDING_DIM = 512
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+# Embedder of the collections created before the signature was recorded
+LEGACY_SIGNATURE = f"openai:{OPENAI_EMBEDDING_MODEL}:{EMBEDDING_DIM}"
+_SIGNATURE_IN_DESCRIPTION = re.compile(r"\(embedder: ([^)]+)\)")
+
+
+class Embedder(ABC):
+    """
+    Interface of the embedders. `signature` names the vector space: two embedders with the same signature give the
+    same vector for a text. The async methods default to the sync ones, for embedders that do not wait on I/O.
+    """
+    signature = ""
+    dim = EMBEDDING_DIM
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds `texts`, in order."""
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+class OpenAIEmbedder(Embedder):
+    """
+    The OpenAI embeddings API; the client sends up to 1000 texts per request. The client is created on first use
+    (reading OPENAI_API_KEY from the environment or .env) and reused for every call.
+    """
+    signature = LEGACY_SIGNATURE
+
+    def __init__(self):
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        with self._lock:
+            if self._embeddings is None:
+                from dotenv import load_dotenv
+                from langchain_openai import OpenAIEmbeddings
+
+                load_dotenv()
+                api_key = os.environ['OPENAI_API_KEY']
+                if not api_key:
+                    raise Exception("OpenAI API key was not found. Please check your .env file.")
+                self._embeddings = OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL, openai_api_key=api_key,
+                                                    dimensions=self.dim)
+            return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._client().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._client().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._client().aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._client().aembed_query(text)
+
+
+class LocalEmbedder(Embedder):
+    """
+    Hashed n-gram embedder. A text's features are its lower-cased words, its word bigrams and the character n-grams
+    of each word (with boundary marks, so "files" and "file" share most of theirs). Each feature is hashed with CRC-32
+    and weighted by its sublinear term frequency (1 + log tf). The resulting sparse vector, one dimension per hash
+    value, is reduced to `dim` dimensions by a sparse random projection: each feature adds +/- its weight to
+    `projections` dimensions chosen by its hash. Vectors are L2-normalized, so the inner product is a cosine.
+
+    Nothing is fitted, so the vector of a text never depends on the collection, and CRC-32 (unlike hash()) is the same
+    in every process. There is no IDF: frequent words weigh as much as rare ones, and the BM25 keyword index of the
+    hybrid search (see keyword_index.py) makes up for it.
+
+    Args:
+        dim (int, optional): Vector dimension. Defaults to EMBEDDING_DIM.
+        char_ngrams (tuple, optional): Smallest and largest character n-gram. Defaults to (3, 5).
+        projections (int, optional): Dimensions each feature is added to. Defaults to 4.
+        char_weight (float, optional): Weight of the character n-grams relative to the words. Defaults to 0.5.
+    """
+    VERSION = 1
+    _WORD = re.compile(r"[a-z0-9_]+")
+    # multipliers and increments of the hash mixing of each projection (odd 32-bit constants)
+    _MULTIPLIERS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F, 0x165667B1, 0xD3A2646D, 0xFD7046C5,
+                             0xB55A4F09], dtype=np.uint64)
+    _INCREMENTS = np.array([0x7F4A7C15, 0x61C88647, 0x3C6EF372, 0x1B873593, 0x5BD1E995, 0x68E31DA5, 0x2545F491,
+                            0x4CF5AD43], dtype=np.uint64)
+
+    def __init__(self, dim: int = EMBEDDING_DIM, char_ngrams: tuple = (3, 5), projections: int = 4,
+                 char_weight: float = 0.5):
+        if not 1 <= projections <= len(self._MULTIPLIERS):
+            raise ValueError(f"projections must be between 1 and {len(self._MULTIPLIERS)}")
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.projections = projections
+        self.char_weight = char_weight
+        self.signature = (f"local:hashed-ngrams-v{self.VERSION}:{dim}:{char_ngrams[0]}-{char_ngrams[1]}:"
+                          f"{projections}:{char_weight:g}")
+
+    def _features(self, text: str) -> tuple:
+        """CRC-32 hashes of the word features and of the character n-gram features of a text."""
+        words = self._WORD.findall(text.lower())
+        word_features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        low, high = self.char_ngrams
+        char_features = []
+        for word in words:
+            marked = f"<{word}>"
+            for n in range(low, high + 1):
+                char_features.extend(marked[i:i + n] for i in range(len(marked) - n + 1))
+        return ([zlib.crc32(feature.encode()) for feature in word_features],
+                [zlib.crc32(b"#" + feature.encode()) for feature in char_features])
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """The embeddings of `texts` as a float32 array of shape (len(texts), dim)."""
+        hashes, rows, weights = [], [], []
+        for row, text in enumerate(texts):
+            word_hashes, char_hashes = self._features(text)
+            hashes.extend(word_hashes)
+            hashes.extend(char_hashes)
+            rows.extend([row] * (len(word_hashes) + len(char_hashes)))
+            weights.extend([1.0] * len(word_hashes) + [self.char_weight] * len(char_hashes))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not hashes:
+            return vectors
+        # term frequency of each (text, feature) pair
+        keys = (np.asarray(rows, dtype=np.uint64) << np.uint64(32)) | np.asarray(hashes, dtype=np.uint64)
+        keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        feature_weights = np.asarray(weights, dtype=np.float64)[first] * (1.0 + np.log(counts))
+        feature_rows = (keys >> np.uint64(32)).astype(np.int64)
+        feature_hashes = keys & np.uint64(0xFFFFFFFF)
+        # sparse random projection: the high bits of a multiplicative hash pick the dimension and the sign
+        mixed = (feature_hashes[:, None] * self._MULTIPLIERS[:self.projections]
+                 + self._INCREMENTS[:self.projections]) & np.uint64(0xFFFFFFFF)
+        dims = ((mixed >> np.uint64(16)) % np.uint64(self.dim)).astype(np.int64)
+        signs = 1.0 - 2.0 * (mixed >> np.uint64(31)).astype(np.float64)
+        cells = (feature_rows[:, None] * self.dim + dims).ravel()
+        values = (signs * feature_weights[:, None]).ravel()
+        vectors = np.bincount(cells, weights=values, minlength=len(texts) * self.dim)
+        vectors = vectors.reshape(len(texts), self.dim).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+
+EMBEDDERS = {"openai": OpenAIEmbedder, "local": LocalEmbedder}
+_embedders: Dict[str, Embedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(name: Optional[str] = None) -> Embedder:
+    """The embedder called `name` (default: Config.EMBEDDER), created once per process."""
+    name = (name or Config.EMBEDDER).lower()
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unsupported EMBEDDER {name!r}, expected one of {', '.join(EMBEDDERS)}")
+    with _embedders_lock:
+        if name not in _embedders:
+            _embedders[name] = EMBEDDERS[name]()
+        return _embedders[name]
+
+
+def collection_description(signature: Optional[str] = None) -> str:
+    """Description of a new collection, recording the embedder of its vectors (default: the configured one)."""
+    return f"VectorDB for Cypher paths and descriptions (embedder: {signature or get_embedder().signature})"
+
+
+def collection_embedder(collection) -> str:
+    """Signature of the embedder that filled a collection (pymilvus Collection)."""
+    match = _SIGNATURE_IN_DESCRIPTION.search(collection.description or "")
+    return match.group(1) if match else LEGACY_SIGNATURE
+
+
+# collection name -> signature of its embedder, once checked
+_collection_embedders: Dict[str, str] = {}
+_collection_embedders_lock = threading.Lock()
+
+
+def require_embedder(collection) -> None:
+    """Raises if the collection was filled by another embedder than the configured one (checked once per process)."""
+    with _collection_embedders_lock:
+        signature = _collection_embedders.get(collection.name)
+    if signature is None:
+        signature = collection_embedder(collection)
+        with _collection_embedders_lock:
+            _collection_embedders[collection.name] = signature
+    expected = get_embedder().signature
+    if signature != expected:
+        raise Exception(f"Collection {collection.name} was embedded with {signature}, not with the configured "
+                        f"embedder {expected} (EMBEDDER={Config.EMBEDDER}). Rebuild the collection or switch back.")
+
+
+def forget_collection_embedder(collection_name: str) -> None:
+    with _collection_embedders_lock:
+        _collection_embedders.pop(collection_name, None)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show the embedder that filled a few-shot collection.")
+    parser.add_argument("command", choices=("show",))
+    parser.add_argument("--collection", default="default")
+    args = parser.parse_args(argv)
+
+    from pymilvus import Collection, connections, utility
+
+    connections.connect(alias="default", host='localhost', port='19530')
+    if not utility.has_collection(args.collection):
+        print(f"Collection {args.collection} does not exist.")
+        return 1
+    signature = collection_embedder(Collection(args.collection))
+    configured = get_embedder().signature
+    print(f"{args.collection}: {signature}" + ("" if signature == configured else f" (configured: {configured})"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,9 @@ from langchain.schema import HumanMessage, SystemMessage
 from typing import List
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
+
+from app.model_tiers import ModelLadder, description_model_ladder
+from paths_vectorDB.embedders import get_embedder
 
 # System instructions template string
 system_message_str = """
@@ -66,14 +67,17 @@ In your output provide only the textual description without any additional conte
 """
 
 
-def generate_path_descriptions(all_paths: List[str]) -> List[str]:
+def generate_path_descriptions(all_paths: List[str], model_ladder: ModelLadder = None) -> List[str]:
     """
     Generate descriptions for a list of Cypher paths using OpenAI API.
     Note: The output descriptions are in the same order as the input Cypher paths.
     For example, the description at index 0 in the output corresponds to the Cypher path at index 0 in the input.
+    Each path is described by the fastest model of the ladder; a slower model is tried only when it errors or
+    returns an empty description.
 
     Args:
         all_paths: List[str]: List of Cypher paths to generate descriptions for.
+        model_ladder (ModelLadder, optional): Defaults to description_model_ladder() (Config.DESCRIPTION_MODEL_LADDER).
 
     Returns:
         List[str]: List of descriptions corresponding to the input paths.
@@ -87,13 +91,8 @@ def generate_path_descriptions(all_paths: List[str]) -> List[str]:
         # descriptions for all input paths
         results: List[str] = []
 
-        # Initialize ChatOpenAI
-        chat = ChatOpenAI(
-            model="o1-mini-2024-09-12",
-            temperature=1,
-            timeout=None,
-            max_retries=2,
-            )
+        # Chat models, fastest first
+        model_ladder = model_ladder or description_model_ladder()
         # Create a SystemMessage object
         system_message = SystemMessage(content=system_message_str)
 
@@ -103,9 +102,10 @@ def generate_path_descriptions(all_paths: List[str]) -> List[str]:
             combined_content = f"{system_message.content}\n\nPath:{path}"
             human_message = HumanMessage(content=combined_content)
             # Invoke the OpenAI API on Human and System messages
-            response = chat.invoke([human_message])
+            description, _ = model_ladder.invoke([human_message], purpose="description",
+                                                 accept=lambda content: bool(content.strip()))
             # Append the response to the results list
-            results.append(response.content)
+            results.append(description)
         return results
     else:
         print("OpenAI API key is not set. Please check your .env file.")
@@ -114,7 +114,8 @@ def generate_path_descriptions(all_paths: List[str]) -> List[str]:
 
 def generate_embedding(path_description: str) -> List[float]:
     """
-    Generate a vector embedding for a given path description using OpenAI API.
+    Generate a vector embedding for a given path description with the configured embedder (Config.EMBEDDER, see
+    paths_vectorDB/embedders.py): the OpenAI API by default, or the local CPU embedder.
     Note: if you change the dimension here, make sure to change the dimension into `embedding` field in vectorDB
 
     Args:
@@ -123,17 +124,45 @@ def generate_embedding(path_description: str) -> List[float]:
     Returns:
         List[float]: Embedding vector for the path description.
     """
-    # Load environment variables
-    load_dotenv()
+    return get_embedder().embed_query(path_description)
+
+
+def generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embeds many texts (e.g. the descriptions of a collection build) in batches: chunks of up to 1000 inputs per
+    OpenAI request, or one NumPy pass for the local embedder.
+
+    Args:
+        texts (List[str]): Texts to embed.
+
+    Returns:
+        List[List[float]]: One embedding vector per text, in order.
+    """
+    return get_embedder().embed_documents(texts) if texts else []
 
-    # Test OpenAI API connection
-    api_key = os.environ['OPENAI_API_KEY']
-    if api_key:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small", openai_api_key=api_key, dimensions=512)
-        # Generate embedding for the path description
-        embedding = embeddings.embed_query(path_description)
-        return embedding
-    else:
-        raise Exception("OpenAI API key was not found. Please check your .env file.")
 
+async def agenerate_embedding(path_description: str) -> List[float]:
+    """
+    Async version of generate_embedding(). Awaits the OpenAI embeddings API instead of blocking the calling thread.
+
+    Args:
+        path_description (str): Description of a Cypher path (or a user query) to generate an embedding for.
+
+    Returns:
+        List[float]: Embedding vector for the path description.
+    """
+    return await get_embedder().aembed_query(path_description)
 
+
+async def agenerate_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embeds many texts (e.g. a batch of user queries) with as few OpenAI requests as possible: the embeddings client
+    sends them in chunks of up to 1000 inputs per request instead of one request per text.
+
+    Args:
+        texts (List[str]): Texts to embed.
+
+    Returns:
+        List[List[float]]: One embedding vector per text, in order.
+    """
+    return await get_embedder().aembed_documents(texts)
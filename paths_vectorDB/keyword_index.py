@@ -0,0 +1,140 @@
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.config import Config
+from app.tracing import span
+
+# (cypher path, description, score) -- the shape of a search hit before it is formatted as a few-shot example
+Hit = Tuple[str, str, float]
+
+# file names (manifest.json, test.edf), dotted numbers and identifiers stay whole tokens
+_TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:\.[a-z0-9_]+)*")
+# Milvus caps limit + offset of a query at 16384
+MAX_INDEXED_EXAMPLES = 16384
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased word tokens. Dotted and underscored tokens are kept whole and also split into their parts, so
+    "manifest.json" matches both a question mentioning "manifest.json" and one mentioning "manifest".
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if "." in token or "_" in token:
+            tokens.extend(part for part in re.split(r"[._]", token) if part and part != token)
+    return tokens
+
+
+class KeywordIndex:
+    """
+    In-memory BM25 inverted index over few-shot examples (cypher path + description). Term weights are computed
+    when the index is built, so a search only sums the postings of the query terms: well under a millisecond for
+    collections of a few thousand examples.
+
+    Args:
+        paths (Sequence[str]): Cypher paths of the examples.
+        descriptions (Sequence[str]): Descriptions of the examples, same order as `paths`.
+        k1 (float, optional): BM25 term frequency saturation. Defaults to 1.2.
+        b (float, optional): BM25 length normalization. Defaults to 0.75.
+    """
+
+    def __init__(self, paths: Sequence[str], descriptions: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.paths = list(paths)
+        self.descriptions = list(descriptions)
+        documents = [Counter(tokenize(f"{p} {d}")) for p, d in zip(self.paths, self.descriptions)]
+        lengths = [sum(counts.values()) for counts in documents]
+        average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        frequencies: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, counts in enumerate(documents):
+            for term, tf in counts.items():
+                frequencies[term].append((doc_id, tf))
+        # term -> [(example index, BM25 weight of the term in that example)]
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        for term, postings in frequencies.items():
+            idf = math.log(1 + (len(documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            self._postings[term] = [
+                (doc_id, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc_id] / average_length)))
+                for doc_id, tf in postings
+            ]
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def search(self, user_query: str, top_k: int = 5) -> List[Hit]:
+        """The `top_k` examples with the highest BM25 score; examples sharing no term with the query are left out."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(user_query)):
+            for doc_id, weight in self._postings.get(term, ()):
+                scores[doc_id] += weight
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self.paths[doc_id], self.descriptions[doc_id], score) for doc_id, score in best]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+    """
+    Merges ranked lists by reciprocal rank fusion: an item scores sum(1 / (k + rank)) over the lists it appears
+    in. Only ranks are used, so the unrelated score scales of inner product and BM25 never have to be calibrated.
+
+    Returns:
+        List[Tuple[Hashable, float]]: Items with their fused score, best first.
+    """
+    scores: Dict[Hashable, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def fuse_hits(vector_hits: Sequence[Hit], keyword_hits: Sequence[Hit], top_k: int,
+              k: Optional[int] = None) -> List[Hit]:
+    """
+    Fuses vector and keyword hits (identified by their cypher path) with reciprocal_rank_fusion().
+
+    Args:
+        vector_hits (Sequence[Hit]): Vector search hits, best first.
+        keyword_hits (Sequence[Hit]): KeywordIndex.search() hits, best first.
+        top_k (int): Number of hits to return.
+        k (int, optional): RRF constant. Defaults to Config.HYBRID_RRF_K.
+
+    Returns:
+        List[Hit]: The best `top_k` hits, scored by their fused score.
+    """
+    descriptions = {path: description for path, description, _ in [*keyword_hits, *vector_hits]}
+    fused = reciprocal_rank_fusion([[hit[0] for hit in vector_hits], [hit[0] for hit in keyword_hits]],
+                                   k=k or Config.HYBRID_RRF_K)
+    return [(path, descriptions[path], score) for path, score in fused[:top_k]]
+
+
+# collection name -> (build time, index)
+_indexes: Dict[str, Tuple[float, KeywordIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def cached_keyword_index(collection_name: str) -> Optional[KeywordIndex]:
+    """The keyword index of a collection if it was built less than Config.KEYWORD_INDEX_TTL_SECONDS ago."""
+    with _indexes_lock:
+        entry = _indexes.get(collection_name)
+    if entry is None or time.monotonic() - entry[0] > Config.KEYWORD_INDEX_TTL_SECONDS:
+        return None
+    return entry[1]
+
+
+def store_keyword_index(collection_name: str, paths: Sequence[str], descriptions: Sequence[str]) -> KeywordIndex:
+    """Builds the keyword index of a collection from its rows and caches it."""
+    with span("vector.keyword_index.build", collection=collection_name, examples=len(paths)):
+        index = KeywordIndex(paths, descriptions)
+    with _indexes_lock:
+        _indexes[collection_name] = (time.monotonic(), index)
+    return index
+
+
+def invalidate_keyword_index(collection_name: str) -> None:
+    """Drops the cached keyword index of a collection, e.g. after rows were inserted or the collection dropped."""
+    with _indexes_lock:
+        _indexes.pop(collection_name, None)
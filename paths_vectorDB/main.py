@@ -1,14 +1,28 @@
 from langchain_community.graphs import Neo4jGraph
 from paths_vectorDB.random_path_generator import generate_formatted_random_paths
-from paths_vectorDB.generate_descriptions import generate_path_descriptions
+from paths_vectorDB.generate_descriptions import generate_path_descriptions, agenerate_embedding, agenerate_embeddings
 from paths_vectorDB.vectorDB_setup import (start_milvus_using_docker_compose,
-                                           search_similar_vectors, remove_collection,
+                                           search_similar_vectors, asearch_similar_vectors,
+                                           asearch_similar_vectors_batch, remove_collection,
                                            collection_exists, insert_single_data, create_collection,
-                                           get_collection_size)
-from paths_vectorDB.write_read_data import write_paths_and_descriptions_to_file
-from typing import List
+                                           get_collection_size, ensure_embedding_index, _format_hit,
+                                           collection_recently_ready, mark_collection_ready)
+from paths_vectorDB.keyword_index import KeywordIndex
+from paths_vectorDB.vector_index import cached_index_type, require_index
+from paths_vectorDB.partitions import is_partitioned
+from paths_vectorDB.embedders import require_embedder
+from paths_vectorDB.write_read_data import write_paths_and_descriptions_to_file, read_paths_and_descriptions_from_file
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import threading
 import time
-from pymilvus import connections, Collection
+from pymilvus import Collection
+from app.config import Config
+from app.model_tiers import description_model_ladder
+from app.tracing import span
+
+# Pause between batches of 10 paths while filling a collection, to avoid overwhelming the OpenAI API
+API_PAUSE_SECONDS = 5
 
 
 # assumes Milvus instance is running
@@ -32,98 +46,86 @@ def fill_collection_with_random_paths(graph: Neo4jGraph, collection_name: str, n
 
     """
 
-    total_time_taken = 0
+    with span("collection.fill", collection=collection_name, num_of_paths=num_of_paths) as fill_span:
+        _fill_collection_with_random_paths(graph, collection_name, num_of_paths, rebuild_collection)
+    print(f"\nTotal time taken for processing: {fill_span.duration:.2f} seconds.")
 
+    # print the state of the collection after all the insertions
+    try:
+        print("Final state of the collection after all the insertions:")
+        num_elements = get_collection_size(collection_name)
+        print("Number of elements in the collection:", num_elements)
+    except Exception as e:
+        print(f"ERROR: Failed to access the collection to check the final state: {e}")
+
+
+def _fill_collection_with_random_paths(graph: Neo4jGraph, collection_name: str, num_of_paths: int,
+                                       rebuild_collection: bool) -> None:
     # Step 1: Generate random paths
     print("Step 1: Generating random paths...")
-    start_time = time.time()
-    all_paths = generate_formatted_random_paths(graph, num_of_paths)
-    gen_time = time.time() - start_time
-    total_time_taken += gen_time
-    print(f"Generated {num_of_paths} random paths from Neo4j in {gen_time:.2f} seconds.")
+    with span("paths.generate", num_of_paths=num_of_paths) as s:
+        all_paths = generate_formatted_random_paths(graph, num_of_paths)
+    print(f"Generated {num_of_paths} random paths from Neo4j in {s.duration:.2f} seconds.")
 
     # Step 2: Optionally rebuild the collection
     if rebuild_collection:
         print("Step 2: Removing current collection (if any).")
         try:
-            start_time = time.time()
-            remove_collection(collection_name)
-            rm_time = time.time() - start_time
-            total_time_taken += rm_time
-            print(f"Collection {collection_name} removed in {rm_time:.2f} seconds.")
+            with span("collection.remove", collection=collection_name) as s:
+                remove_collection(collection_name)
+            print(f"Collection {collection_name} removed in {s.duration:.2f} seconds.")
         except Exception as e:
             print(f"ERROR: Failed to remove collection {collection_name}: {e}")
 
-    # Step 3: Process each path individually
+    # Step 3: Process each path individually, with one model ladder for the whole fill so that its clients and
+    # escalation statistics carry over from path to path
+    model_ladder = description_model_ladder()
     for idx, path in enumerate(all_paths, start=1):
 
-        # stop for 5 seconds every 10 paths to avoid overwhelming the system
-        if idx % 10 == 0:
-            print(f"\n\n\nPausing for 5 seconds to avoid overwhelming API...")
-            time.sleep(5)
+        # pause every 10 paths to avoid overwhelming the system
+        if idx % 10 == 0 and API_PAUSE_SECONDS:
+            print(f"\n\n\nPausing for {API_PAUSE_SECONDS} seconds to avoid overwhelming API...")
+            time.sleep(API_PAUSE_SECONDS)
 
         print(f"\nProcessing path {idx}:")
 
         # 3a: Generate description for the path
         print(f"  Generating description for path {idx}. Calling API ...")
         try:
-            start_time = time.time()
-            description_list = generate_path_descriptions([path])
-            description = description_list[0]
-            desc_time = time.time() - start_time
-            total_time_taken += desc_time
-            print(f"  Description for path #{idx} generated in {desc_time:.2f} seconds.")
+            with span("description.generate", path_index=idx) as s:
+                description_list = generate_path_descriptions([path], model_ladder)
+                description = description_list[0]
+            print(f"  Description for path #{idx} generated in {s.duration:.2f} seconds.")
         except Exception as gen_err:
             print(f"  ERROR: First attempt failed for path {idx}: {gen_err}. Retrying after 3 seconds...")
             time.sleep(3)  # wait for 3 seconds before retrying
             # Retry generating the description one more time
             try:
-                start_time = time.time()
-                description_list = generate_path_descriptions([path])
-                description = description_list[0]
-                desc_time = time.time() - start_time
-                total_time_taken += desc_time
-                print(f"  Description for path #{idx} generated in {desc_time:.2f} seconds on retry.")
+                with span("description.generate", path_index=idx, retry=True) as s:
+                    description_list = generate_path_descriptions([path], model_ladder)
+                    description = description_list[0]
+                print(f"  Description for path #{idx} generated in {s.duration:.2f} seconds on retry.")
             except Exception as retry_err:
                 print(f"  ERROR: Skipping path {idx} after retry failure: {retry_err}")
                 continue
 
         # 3b: Insert path and description into Milvus
         print(f"  Inserting path {idx} into the vector DB.")
-        start_time = time.time()
-        if insert_single_data(collection_name, path, description):
-            ins_time = time.time() - start_time
-            total_time_taken += ins_time
-            print(f"  Path {idx} filled in DB with its description DB in {ins_time:.2f} seconds.")
+        with span("collection.insert", path_index=idx) as s:
+            inserted = insert_single_data(collection_name, path, description)
+            s.set_attribute("inserted", inserted)
+        if inserted:
+            print(f"  Path {idx} filled in DB with its description DB in {s.duration:.2f} seconds.")
 
         # 3c: Write path and description to the file
         print(f"  Writing path {idx} info to the file.")
         try:
-            start_time = time.time()
-            write_paths_and_descriptions_to_file([path], [description])
-            file_time = time.time() - start_time
-            total_time_taken += file_time
-            print(f"  Path written to file in {file_time:.2f} seconds.")
+            with span("description.write_file", path_index=idx) as s:
+                write_paths_and_descriptions_to_file([path], [description])
+            print(f"  Path written to file in {s.duration:.2f} seconds.")
         except Exception as file_err:
             print(f"  ERROR: Skipping file write for path {idx} due to error: {file_err}")
 
-    print(f"\nTotal time taken for processing: {total_time_taken:.2f} seconds.")
-
-    # print the state of the collection after all the insertions
-    try:
-        print("Final state of the collection after all the insertions:")
-        # Connect to the Milvus server
-        connections.connect(host="localhost", port="19530")
-
-        # Access the collection named `default`
-        collection = Collection("default")
-
-        # Get the number of elements in the collection
-        num_elements = collection.num_entities
-        print("Number of elements in the collection:", num_elements)
-    except Exception as e:
-        print(f"ERROR: Failed to access the collection to check the final state: {e}")
-
 
 def get_similar_paths_from_milvus(graph: Neo4jGraph, user_query: str, collection_name: str = "default", top_k: int = 5,
                                   number_of_paths: int = 45, rebuild_collection: bool = False) -> List[str]:
@@ -144,8 +146,37 @@ def get_similar_paths_from_milvus(graph: Neo4jGraph, user_query: str, collection
     Returns:
         List[str]: A list of similar paths from the Milvus collection.
     """
-    # Start Milvus if not running
-    start_milvus_using_docker_compose()
+    prepare_collection_for_search(graph, collection_name, number_of_paths, rebuild_collection)
+
+    # Search for similar paths in the Milvus collection
+    return search_similar_vectors(collection_name, user_query, top_k)
+
+
+def prepare_collection_for_search(graph: Neo4jGraph, collection_name: str = "default", number_of_paths: int = 45,
+                                  rebuild_collection: bool = False) -> Optional[bool]:
+    """
+    Makes sure a collection can be searched: starts Milvus if it is not running (once per process, see
+    _start_milvus_once()), creates, fills and indexes the
+    collection if it does not exist (or tops it up to `number_of_paths` entries) and checks that the embedding index
+    exists (an existing collection without one raises, see paths_vectorDB/vector_index.py). A collection found ready
+    is not checked again for Config.VECTOR_COLLECTION_CHECK_SECONDS, so a warm process skips the checks per query.
+
+    Args:
+        graph (Neo4jGraph): The Neo4jGraph object used to generate random paths from.
+        collection_name (str, optional): The name of the Milvus collection. Defaults to "default".
+        number_of_paths (int, optional): The desired number of randomly generated paths in the collection.
+        rebuild_collection (bool, optional): If True, the current collection will be deleted and a new collection will be created
+                                             and filled with random paths and descriptions. Defaults to False.
+
+    Returns:
+        Optional[bool]: None if the collection was found ready recently and nothing was checked, True if it was
+                        created or filled (a call whose duration says nothing about Milvus), False otherwise.
+    """
+    if not rebuild_collection and collection_recently_ready(collection_name):
+        return None
+
+    _start_milvus_once()
+    filled = False
 
     # Check if collection needs rebuilding or creation
     if rebuild_collection or not collection_exists(collection_name):
@@ -154,6 +185,8 @@ def get_similar_paths_from_milvus(graph: Neo4jGraph, user_query: str, collection
         create_collection(collection_name)
         fill_collection_with_random_paths(graph=graph, collection_name=collection_name, num_of_paths=number_of_paths,
                                           rebuild_collection=rebuild_collection)
+        ensure_embedding_index(Collection(collection_name))
+        filled = True
     else:
         # Collection exists. Check how many paths are already present
         try:
@@ -164,11 +197,163 @@ def get_similar_paths_from_milvus(graph: Neo4jGraph, user_query: str, collection
                 print(f"Collection needs additional {difference_of_paths} paths to meet the defined number of paths. Filling collection now...")
                 fill_collection_with_random_paths(graph=graph, collection_name=collection_name, num_of_paths=difference_of_paths,
                                                   rebuild_collection=rebuild_collection)
+                filled = True
             else:
                 print(f"Collection '{collection_name}' already has {current_size} entries, which is sufficient.")
         except Exception as e:
             print(f"Failed to get collection size for '{collection_name}': {e}")
-            # Optionally, you may want to rebuild or handle this case differently.
+            # surface it: the caller's circuit breaker counts it and falls back to the local examples
+            raise
 
-    # Search for similar paths in the Milvus collection
-    return search_similar_vectors(collection_name, user_query, top_k)
+    # the index is built with the collection (or by `python -m paths_vectorDB.vector_index build`); here we only
+    # learn its type (and whether the collection is partitioned by dataset) once, for the searches; the collection's
+    # vectors must come from the configured embedder
+    if cached_index_type(collection_name) is None:
+        collection = Collection(collection_name)
+        require_embedder(collection)
+        require_index(collection)
+        is_partitioned(collection)
+    mark_collection_ready(collection_name)
+    return filled
+
+
+# whether _start_milvus_once() ran in this process
+_milvus_start_attempted = False
+_milvus_start_lock = threading.Lock()
+
+
+def _start_milvus_once() -> None:
+    """
+    Runs start_milvus_using_docker_compose() (`docker ps`, and `docker-compose up -d` if Milvus is not running) on
+    the first check of the process only. When Milvus goes down later, the failing checks and searches open the
+    `vector` circuit breaker instead of every question waiting for docker.
+    """
+    global _milvus_start_attempted
+    with _milvus_start_lock:
+        if _milvus_start_attempted:
+            return
+        _milvus_start_attempted = True
+        with span("vector.ensure_running"):
+            start_milvus_using_docker_compose()
+
+
+async def aget_similar_paths_from_milvus(graph: Neo4jGraph, user_query: str, collection_name: str = "default",
+                                         top_k: int = 5, number_of_paths: int = 45,
+                                         rebuild_collection: bool = False) -> List[str]:
+    """
+    Async version of get_similar_paths_from_milvus() without the collection checks: the pipeline runs
+    prepare_collection_for_search() once per question before it (SharedResources.few_shot_preparer, see
+    app/qa_chain.py), through the `vector` circuit breaker.
+
+    Args: see get_similar_paths_from_milvus(); `graph`, `number_of_paths` and `rebuild_collection` are unused here.
+
+    Returns:
+        List[str]: A list of similar paths from the Milvus collection.
+    """
+    user_query_vector = await _aembed_user_query(user_query)
+    return await asearch_similar_vectors(collection_name, user_query_vector, top_k, user_query=user_query)
+
+
+async def aget_similar_paths_for_queries(graph: Neo4jGraph, user_queries: List[str], collection_name: str = "default",
+                                         top_k: int = 5, number_of_paths: int = 45,
+                                         rebuild_collection: bool = False) -> List[List[str]]:
+    """
+    Batch version of aget_similar_paths_from_milvus() for many questions at once (see app/batch.py): all questions
+    are embedded in one batched embeddings request and searched with one multi-vector Milvus search.
+
+    Args: see get_similar_paths_from_milvus(); `user_queries` replaces `user_query`.
+
+    Returns:
+        List[List[str]]: The similar paths of each user query, in order.
+    """
+    if not user_queries:
+        return []
+    user_query_vectors = await _aembed_user_queries(user_queries)
+    return await asearch_similar_vectors_batch(collection_name, user_query_vectors, top_k, user_queries=user_queries)
+
+
+# user query -> its embedding, least recently used first (see cached_query_embedding())
+_query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+
+def cached_query_embedding(user_query: str) -> Optional[List[float]]:
+    """
+    The embedding of a query embedded before in this process, if it is among the last
+    Config.QUERY_EMBEDDING_CACHE_SIZE. Repeated and warmed-up questions (see app/warm_up.py) skip the embeddings API.
+    """
+    with _query_embeddings_lock:
+        vector = _query_embeddings.get(user_query)
+        if vector is not None:
+            _query_embeddings.move_to_end(user_query)
+        return vector
+
+
+def store_query_embedding(user_query: str, vector: List[float]) -> None:
+    if Config.QUERY_EMBEDDING_CACHE_SIZE <= 0:
+        return
+    with _query_embeddings_lock:
+        _query_embeddings[user_query] = vector
+        _query_embeddings.move_to_end(user_query)
+        while len(_query_embeddings) > Config.QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+
+
+async def _aembed_user_queries(user_queries: List[str]) -> List[List[float]]:
+    vectors = {query: cached_query_embedding(query) for query in user_queries}
+    missing = [query for query, vector in vectors.items() if vector is None]
+    with span("vector.embed_query", queries=len(user_queries), cached=len(vectors) - len(missing)):
+        if missing:
+            print(f"Generating embeddings for {len(missing)} user queries...")
+            missing_vectors = await agenerate_embeddings(missing)
+            if len(missing_vectors) != len(missing) or not all(missing_vectors):
+                raise Exception("Failed to generate embeddings for the user queries.")
+            for query, vector in zip(missing, missing_vectors):
+                store_query_embedding(query, vector)
+                vectors[query] = vector
+    return [vectors[query] for query in user_queries]
+
+
+async def _aembed_user_query(user_query: str) -> List[float]:
+    user_query_vector = cached_query_embedding(user_query)
+    if user_query_vector is not None:
+        return user_query_vector
+    print("Generating embedding for the user query...")
+    with span("vector.embed_query"):
+        user_query_vector = await agenerate_embedding(user_query)
+    if not user_query_vector:
+        print("Failed to generate embedding for the user query.")
+        raise Exception("Failed to generate embedding for the user query.")
+    store_query_embedding(user_query, user_query_vector)
+    return user_query_vector
+
+
+# file path -> keyword index of its paths and descriptions
+_local_examples: Dict[str, KeywordIndex] = {}
+
+
+def forget_local_examples() -> None:
+    """Drops the keyword indexes of local_few_shot_examples(), e.g. after its file was rewritten."""
+    _local_examples.clear()
+
+
+def local_few_shot_examples(user_query: str, top_k: int = 5, file_path: str = None) -> List[str]:
+    """
+    Few-shot examples picked without Milvus or the embedding API, used while the vector store is unavailable: the
+    paths/descriptions written while filling the collection are ranked by BM25 against the query (see
+    paths_vectorDB/keyword_index.py). Coarser than the hybrid search, but it keeps prompts grounded in real paths
+    during an outage.
+
+    Args:
+        user_query (str): The user query.
+        top_k (int, optional): Number of examples to return. Defaults to 5.
+        file_path (str, optional): Paths/descriptions file. Defaults to Config.FEW_SHOT_FALLBACK_FILE.
+
+    Returns:
+        List[str]: Examples formatted like the vector search results.
+    """
+    file_path = file_path or Config.FEW_SHOT_FALLBACK_FILE
+    if file_path not in _local_examples:
+        _local_examples[file_path] = KeywordIndex(*read_paths_and_descriptions_from_file(file_path))
+    hits = _local_examples[file_path].search(user_query, top_k)
+    return [_format_hit(i, path, description, score) for i, (path, description, score) in enumerate(hits)]
@@ -0,0 +1,207 @@
+"""
+Per-dataset partitioning of the few-shot collections (Config.VECTOR_PARTITION_BY_DATASET).
+
+Every example is tagged at insert time with the dataset and file type of its `cypher_path` (parsed from the format of
+format_path_into_cypher()). The dataset is the collection's Milvus partition key, so a search filtered on it only
+scans the partitions holding that dataset: search cost follows the size of the dataset, not of the whole collection.
+
+A question naming one of the datasets that have examples (matched like the intent router does, see
+app.name_matching.resolve_dataset_name()) is searched within that dataset; it falls back to the whole collection only
+when the scoped search finds nothing. Collections created before partitioning keep being searched globally until
+they are migrated.
+
+Usage (from the repository root, Milvus running):
+    python -m paths_vectorDB.partitions show --collection default
+    python -m paths_vectorDB.partitions migrate --collection default   # re-creates the collection with the tags
+"""
+import argparse
+import json
+import sys
+import threading
+import weakref
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from app.config import Config
+from app.name_matching import resolve_dataset_name
+from paths_vectorDB.keyword_index import Hit, KeywordIndex
+from paths_vectorDB.stale_paths import parse_cypher_path
+
+DATASET_FIELD = "dataset"
+FILE_TYPE_FIELD = "file_type"
+# Rows copied per batch by migrate_collection()
+MIGRATE_BATCH_SIZE = 1000
+
+
+class PathTags(NamedTuple):
+    """Scalar fields of an example: the dataset its path goes through and the extension of its file ("" if none)."""
+    dataset: str
+    file_type: str
+
+
+def path_tags(cypher_path: str) -> PathTags:
+    """
+    The tags of a path formatted by format_path_into_cypher(), e.g. "(:Pennsieve)-[:DATASET]->(:Dataset {name:
+    'Test Dataset CNT'})-[:FILES]->(:File {name: 'test.edf'})-..." -> PathTags("Test Dataset CNT", "edf").
+    """
+    steps = parse_cypher_path(cypher_path) or []
+    dataset = next((str(step.properties.get("name", "")) for step in steps if step.rel_type == "DATASET"), "")
+    # the last FILES hop is the file (the ones before it are directories)
+    files = [str(step.properties.get("name", "")) for step in steps if step.rel_type == "FILES"]
+    file_type = files[-1].rsplit(".", 1)[1].lower() if files and "." in files[-1] else ""
+    return PathTags(dataset, file_type)
+
+
+def tag_fields(cypher_path: str) -> Dict[str, str]:
+    """The partitioning fields of an inserted row."""
+    tags = path_tags(cypher_path)
+    return {DATASET_FIELD: tags.dataset, FILE_TYPE_FIELD: tags.file_type}
+
+
+# collection name -> whether it has the DATASET_FIELD partition key
+_partitioned: Dict[str, bool] = {}
+_partitioned_lock = threading.Lock()
+
+
+def is_partitioned(collection) -> bool:
+    """Whether a collection (pymilvus Collection) is partitioned by dataset; remembered per process."""
+    partitioned = any(field.name == DATASET_FIELD for field in collection.schema.fields)
+    with _partitioned_lock:
+        _partitioned[collection.name] = partitioned
+    return partitioned
+
+
+def cached_is_partitioned(collection_name: str) -> bool:
+    """What is_partitioned() found for the collection, without asking Milvus (False if it was never checked)."""
+    with _partitioned_lock:
+        return _partitioned.get(collection_name, False)
+
+
+def forget_partitioning(collection_name: str) -> None:
+    with _partitioned_lock:
+        _partitioned.pop(collection_name, None)
+
+
+# keyword index -> dataset names of its examples (computed once per index build)
+_dataset_names: "weakref.WeakKeyDictionary[KeywordIndex, List[str]]" = weakref.WeakKeyDictionary()
+
+
+def dataset_names(index: KeywordIndex) -> List[str]:
+    """The datasets that have examples in a collection, from the rows of its (cached) keyword index."""
+    names = _dataset_names.get(index)
+    if names is None:
+        names = sorted({path_tags(path).dataset for path in index.paths} - {""})
+        _dataset_names[index] = names
+    return names
+
+
+def detect_dataset(user_query: str, names: Sequence[str]) -> Optional[str]:
+    """The dataset among `names` the question refers to, or None for a global search."""
+    return resolve_dataset_name(user_query, list(names))[0] if names else None
+
+
+def dataset_filter(dataset: str) -> str:
+    """Milvus boolean expression selecting the examples of a dataset."""
+    return f"{DATASET_FIELD} == {json.dumps(dataset)}"
+
+
+def scope_hits(hits: List[Hit], dataset: Optional[str]) -> List[Hit]:
+    """Keeps the hits (e.g. keyword hits) whose path belongs to `dataset`; all of them for a global search."""
+    return hits if dataset is None else [hit for hit in hits if path_tags(hit[0]).dataset == dataset]
+
+
+def migrate_collection(collection_name: str) -> bool:
+    """
+    Re-creates a collection with the partitioning fields: its rows (paths, descriptions, embeddings) are copied into a
+    new collection tagged at insert, which then replaces the old one. Nothing is re-described or re-embedded.
+
+    Returns:
+        bool: True if the collection was migrated, False if it already was partitioned.
+    """
+    from pymilvus import Collection, utility
+
+    from paths_vectorDB.embedders import collection_embedder, forget_collection_embedder
+    from paths_vectorDB.keyword_index import invalidate_keyword_index
+    from paths_vectorDB.quantization import BINARY_FIELD, binary_code
+    from paths_vectorDB.vectorDB_setup import create_collection, forget_collection_ready
+    from paths_vectorDB.vector_index import build_index, forget_index_type
+
+    if not Config.VECTOR_PARTITION_BY_DATASET:
+        raise ValueError("Set VECTOR_PARTITION_BY_DATASET=true to migrate to a partitioned collection")
+    source = Collection(collection_name)
+    if is_partitioned(source):
+        print(f"Collection '{collection_name}' is already partitioned by dataset.")
+        return False
+    staging = f"{collection_name}_partitioned"
+    if utility.has_collection(staging):
+        utility.drop_collection(staging)
+    # the rows keep their vectors, so the new collection records the embedder of the old one
+    create_collection(staging, embedder_signature=collection_embedder(source))
+    target = Collection(staging)
+    binary = any(field.name == BINARY_FIELD for field in target.schema.fields)
+    source.load()
+    iterator = source.query_iterator(batch_size=MIGRATE_BATCH_SIZE, expr='cypher_path != ""',
+                                     output_fields=['cypher_path', 'description', 'embedding'])
+    copied = 0
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            records = []
+            for row in rows:
+                record = {"cypher_path": row["cypher_path"], "description": row["description"],
+                          "embedding": row["embedding"], **tag_fields(row["cypher_path"])}
+                if binary:
+                    record[BINARY_FIELD] = binary_code(row["embedding"])
+                records.append(record)
+            target.insert(records)
+            copied += len(records)
+    finally:
+        iterator.close()
+    target.flush()
+    build_index(target)
+    source.release()
+    utility.drop_collection(collection_name)
+    utility.rename_collection(staging, collection_name)
+    for name in (collection_name, staging):
+        invalidate_keyword_index(name)
+        forget_index_type(name)
+        forget_collection_ready(name)
+        forget_partitioning(name)
+        forget_collection_embedder(name)
+    print(f"Collection '{collection_name}' migrated: {copied} examples tagged with their dataset and file type.")
+    return True
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or migrate the per-dataset partitioning of a few-shot "
+                                                 "collection.")
+    parser.add_argument("command", choices=("show", "migrate"))
+    parser.add_argument("--collection", default="default")
+    args = parser.parse_args(argv)
+
+    from pymilvus import Collection, connections, utility
+
+    connections.connect(alias="default", host='localhost', port='19530')
+    if not utility.has_collection(args.collection):
+        print(f"Collection {args.collection} does not exist.")
+        return 1
+    if args.command == "migrate":
+        migrate_collection(args.collection)
+        return 0
+    collection = Collection(args.collection)
+    if not is_partitioned(collection):
+        print(f"Collection '{args.collection}' is not partitioned (run: python -m paths_vectorDB.partitions migrate "
+              f"--collection {args.collection})")
+        return 0
+    collection.load()
+    rows = collection.query(expr='cypher_path != ""', output_fields=[DATASET_FIELD, FILE_TYPE_FIELD], limit=16384)
+    counts = Counter((row[DATASET_FIELD], row[FILE_TYPE_FIELD]) for row in rows)
+    for (dataset, file_type), count in sorted(counts.items()):
+        print(f"{dataset or '(no dataset)':<40}{file_type or '-':<10}{count:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Quantized first-pass search of the few-shot collections with exact re-ranking (Config.VECTOR_QUANTIZATION):
+
+- "int8": the `embedding` field is indexed with IVF_SQ8, whose int8 scalar codes take a quarter of the float32
+  memory of IVF_FLAT/HNSW;
+- "binary": the sign bits of each embedding are stored in a BINARY_VECTOR field (64 bytes for 512 dimensions instead
+  of 2 KiB) indexed with BIN_FLAT, and searched by Hamming distance;
+- "none": float32 search, as before.
+
+A quantized search fetches Config.VECTOR_RERANK_FACTOR times as many candidates as it needs together with their
+full-precision `embedding` values (memory-mapped from disk, see build_index()), and re-ranks them by their exact
+inner product with the query, so the scores and order of the returned examples are those of a float32 search.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import Config
+from paths_vectorDB.keyword_index import Hit
+
+QUANTIZATIONS = ("none", "int8", "binary")
+# BINARY_VECTOR field holding the sign bits of `embedding` in collections created with VECTOR_QUANTIZATION=binary
+BINARY_FIELD = "embedding_bits"
+BINARY_INDEX_PARAMS = {"index_type": "BIN_FLAT", "metric_type": "HAMMING", "params": {}}
+BINARY_SEARCH_PARAM = {"metric_type": "HAMMING", "params": {}}
+
+# (cypher path, description, full-precision embedding) of a first-pass candidate
+Candidate = Tuple[str, str, Sequence[float]]
+
+
+def configured_quantization() -> str:
+    quantization = Config.VECTOR_QUANTIZATION.lower()
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unsupported VECTOR_QUANTIZATION {quantization!r}, expected one of "
+                         f"{', '.join(QUANTIZATIONS)}")
+    return quantization
+
+
+def binary_code(vector: Sequence[float]) -> bytes:
+    """The sign bits of an embedding, packed 8 dimensions per byte (the value of BINARY_FIELD)."""
+    return np.packbits(np.asarray(vector, dtype=np.float32) > 0).tobytes()
+
+
+def rerank_count(limit: int, quantization: str) -> int:
+    """Candidates to fetch from the first pass so that `limit` survive the exact re-ranking."""
+    return limit if quantization == "none" else limit * max(1, Config.VECTOR_RERANK_FACTOR)
+
+
+def rerank(query_vector: Sequence[float], candidates: List[Candidate], limit: Optional[int] = None) -> List[Hit]:
+    """
+    Orders first-pass candidates by their exact inner product with the query.
+
+    Args:
+        query_vector (Sequence[float]): The query embedding.
+        candidates (List[Candidate]): Candidates with their full-precision embeddings.
+        limit (int, optional): Hits to keep. Defaults to all of them.
+
+    Returns:
+        List[Hit]: (path, description, exact score), best first.
+    """
+    if not candidates:
+        return []
+    vectors = np.asarray([vector for _, _, vector in candidates], dtype=np.float32)
+    scores = vectors @ np.asarray(query_vector, dtype=np.float32)
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [(candidates[i][0], candidates[i][1], float(scores[i])) for i in order]
@@ -0,0 +1,396 @@
+"""
+Verification of the few-shot examples stored in a Milvus collection against the current graph. The paths are sampled
+once when the collection is filled; after datasets are renamed, files removed or values changed, some of them no
+longer exist and point the LLM at empty results. The verifier re-checks the stored `cypher_path`s in batches with
+bounded, parameterized existence queries and, depending on the action:
+
+- "flag": reports the stale examples (and the few_shot_stale_examples gauge);
+- "delete": deletes them from the collection and from the paths/descriptions files the local fallback reads
+  (Config.FEW_SHOT_FALLBACK_FILE);
+- "refresh": deletes them and inserts as many fresh paths of the same template (the same sequence of relationship
+  types) as were stale, described and embedded like the originals. The rest of the collection is left alone.
+
+Usage (from the repository root):
+    python -m paths_vectorDB.stale_paths --collection default                   # report stale examples
+    python -m paths_vectorDB.stale_paths --collection default --action refresh  # replace them
+    python -m paths_vectorDB.stale_paths --watch 3600 --action refresh          # re-check every hour
+"""
+import argparse
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from app.config import Config
+from app.tracing import metrics, span
+
+ACTIONS = ("flag", "delete", "refresh")
+# Candidate paths fetched per template when sampling replacements (one is picked at random)
+SAMPLE_CANDIDATES = 200
+# Stale examples deleted per Milvus delete request
+DELETE_BATCH_SIZE = 500
+ROOT = "(:Pennsieve)"
+
+_STEP_HEAD = re.compile(r"-\[:(`[^`]+`|[^\]`]+)\]->\(:(\w+)")
+_PROPERTY_KEY = re.compile(r"(\w+): ")
+# a string value ends at the quote followed by the next property or the end of the node
+_STRING_END = re.compile(r"'(?=, \w+: |\}\))")
+_NUMBER = re.compile(r"[^,}]+")
+
+
+class PathStep(NamedTuple):
+    """One `-[:rel_type]->(:label {properties})` hop of a formatted path (see format_path_into_cypher())."""
+    rel_type: str
+    label: str
+    properties: Dict[str, Any]
+
+
+def _parse_value(text: str) -> Any:
+    if text in ("True", "False"):
+        return text == "True"
+    try:
+        value = int(text)
+    except ValueError:
+        value = float(text)
+    # NaN never equals itself in Cypher: such a property cannot be checked
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def _parse_string(text: str) -> Optional[str]:
+    """
+    A quoted value, or None if it cannot be compared: format_path_into_cypher() quotes the str() of every
+    non-number, so a list or map property reads "['x', 'y']", which never equals the stored list.
+    """
+    if text[:1] + text[-1:] in ("[]", "{}"):
+        return None
+    return text
+
+
+def parse_cypher_path(path: str) -> Optional[List[PathStep]]:
+    """
+    Parses a path written by format_path_into_cypher() back into its hops.
+
+    Args:
+        path (str): e.g. "(:Pennsieve)-[:DATASET]->(:Dataset {name: 'Test Dataset CNT'})-[:FILES]->(:File ...)"
+
+    Returns:
+        Optional[List[PathStep]]: The hops, or None if the path does not have that format. Properties that cannot
+                                  be compared (non-finite numbers, lists and maps written as strings) are left out.
+    """
+    if not path.startswith(ROOT):
+        return None
+    steps: List[PathStep] = []
+    pos = len(ROOT)
+    try:
+        while pos < len(path):
+            head = _STEP_HEAD.match(path, pos)
+            if head is None:
+                return None
+            pos = head.end()
+            properties: Dict[str, Any] = {}
+            if path.startswith(" {", pos):
+                pos += 2
+                while True:
+                    key = _PROPERTY_KEY.match(path, pos)
+                    if key is None:
+                        return None
+                    pos = key.end()
+                    if path.startswith("'", pos):
+                        end = _STRING_END.search(path, pos + 1)
+                        if end is None:
+                            return None
+                        value = _parse_string(path[pos + 1:end.start()])
+                        pos = end.end()
+                    else:
+                        number = _NUMBER.match(path, pos)
+                        value = _parse_value(number.group(0))
+                        pos = number.end()
+                    if value is not None:
+                        properties[key.group(1)] = value
+                    if path.startswith(", ", pos):
+                        pos += 2
+                    elif path.startswith("}", pos):
+                        pos += 1
+                        break
+                    else:
+                        return None
+            if not path.startswith(")", pos):
+                return None
+            pos += 1
+            steps.append(PathStep(head.group(1).strip("`"), head.group(2), properties))
+    except (AttributeError, ValueError):
+        return None
+    return steps or None
+
+
+def template_of(steps: Sequence[PathStep]) -> Tuple[str, ...]:
+    """The relationship types of a path: paths with the same template are interchangeable examples."""
+    return tuple(step.rel_type for step in steps)
+
+
+def _escape(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def existence_query(steps: Sequence[PathStep], branch: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    One UNION ALL branch checking that the path exists: anchored on :Pennsieve, every hop constrained by its
+    relationship type and properties, stopping at the first match. Node labels are not checked since
+    format_path_into_cypher() infers them from the relationship types.
+
+    Returns:
+        Tuple[str, Dict[str, Any]]: The query returning `branch` if the path exists, and its parameters.
+    """
+    pattern = ["MATCH (n0:Pennsieve)"]
+    conditions: List[str] = []
+    params: Dict[str, Any] = {}
+    for depth, step in enumerate(steps, start=1):
+        pattern.append(f"-[:{_escape(step.rel_type)}]->(n{depth})")
+        for k, (key, value) in enumerate(step.properties.items()):
+            name = f"e{branch}_{depth}_{k}"
+            conditions.append(f"n{depth}.{_escape(key)} = ${name}")
+            params[name] = value
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"{''.join(pattern)}{where} RETURN {branch} AS example LIMIT 1", params
+
+
+def existing_examples(graph: Any, paths: Sequence[Sequence[PathStep]]) -> Set[int]:
+    """Positions (in `paths`) of the paths that exist in the graph, checked with one UNION ALL query."""
+    if not paths:
+        return set()
+    branches, params = [], {}
+    for branch, steps in enumerate(paths):
+        query, branch_params = existence_query(steps, branch)
+        branches.append(query)
+        params.update(branch_params)
+    return {row["example"] for row in graph.query(" UNION ALL ".join(branches), params)}
+
+
+class VerificationReport:
+    """
+    Outcome of verify_collection().
+
+    Args:
+        collection_name (str): The verified collection.
+        action (str): One of ACTIONS.
+    """
+
+    def __init__(self, collection_name: str, action: str):
+        self.collection_name = collection_name
+        self.action = action
+        self.checked = 0
+        self.unparsable = 0
+        # (id, cypher_path) of each stale example
+        self.stale: List[Tuple[int, str]] = []
+        self.deleted = 0
+        self.replaced = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"collection": self.collection_name, "action": self.action, "checked": self.checked,
+                "unparsable": self.unparsable, "stale": len(self.stale), "deleted": self.deleted,
+                "replaced": self.replaced}
+
+
+def _collection_rows(collection_name: str, batch_size: int):
+    """Yields (id, cypher_path) batches of every example of the collection."""
+    from pymilvus import Collection, connections
+
+    connections.connect(alias="default", host='localhost', port='19530')
+    collection = Collection(collection_name)
+    collection.load()
+    iterator = collection.query_iterator(batch_size=batch_size, expr='cypher_path != ""',
+                                         output_fields=['cypher_path'])
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                return
+            yield [(row['id'], row['cypher_path']) for row in rows]
+    finally:
+        iterator.close()
+
+
+def sample_template_paths(graph: Any, template: Sequence[str], count: int, exclude: Set[str]) -> List[str]:
+    """
+    Up to `count` random paths of the graph following the relationship types of `template`, formatted like the
+    collection's paths and not in `exclude`. Drawn from the first SAMPLE_CANDIDATES matches to keep the query bounded.
+    """
+    from paths_vectorDB.random_path_generator import format_path_into_cypher
+
+    pattern = "".join(f"-[:{_escape(rel_type)}]->()" for rel_type in template)
+    rows = graph.query(f"MATCH path = (:Pennsieve){pattern} RETURN path LIMIT $limit", {"limit": SAMPLE_CANDIDATES})
+    candidates = list(dict.fromkeys(format_path_into_cypher(row['path']) for row in rows))
+    candidates = [path for path in candidates if path not in exclude]
+    return random.sample(candidates, min(count, len(candidates)))
+
+
+def _delete_examples(collection_name: str, ids: List[int]) -> int:
+    from pymilvus import Collection
+    from paths_vectorDB.keyword_index import invalidate_keyword_index
+
+    collection = Collection(collection_name)
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        collection.delete(expr=f"id in {ids[start:start + DELETE_BATCH_SIZE]}")
+    collection.flush()
+    invalidate_keyword_index(collection_name)
+    return len(ids)
+
+
+def _remove_from_example_files(paths: List[str]) -> None:
+    """
+    Removes deleted examples from the paths/descriptions file the fills and refreshes append to and from the local
+    fallback corpus (Config.FEW_SHOT_FALLBACK_FILE), so the fallback stops serving them too.
+    """
+    from paths_vectorDB.main import forget_local_examples
+    from paths_vectorDB.write_read_data import remove_paths_from_file
+
+    files = {os.path.abspath(name) for name in ("vectordb_paths_descriptions.txt", Config.FEW_SHOT_FALLBACK_FILE)}
+    for file_path in sorted(files):
+        if not os.path.exists(file_path):
+            continue
+        try:
+            removed = remove_paths_from_file(paths, file_path)
+        except OSError as e:
+            print(f"ERROR: Failed to remove stale examples from {file_path}: {e}")
+            continue
+        if removed:
+            print(f"Removed {removed} stale examples from {file_path}")
+    forget_local_examples()
+
+
+def _replace_examples(graph: Any, report: VerificationReport, kept_paths: Set[str]) -> int:
+    """Inserts a fresh path of the same template for each stale example; returns the number inserted."""
+    from app.model_tiers import description_model_ladder
+    from paths_vectorDB.generate_descriptions import generate_path_descriptions
+    from paths_vectorDB.vectorDB_setup import insert_bulk_data
+    from paths_vectorDB.write_read_data import write_paths_and_descriptions_to_file
+
+    stale_per_template: Dict[Tuple[str, ...], int] = defaultdict(int)
+    for _, path in report.stale:
+        stale_per_template[template_of(parse_cypher_path(path))] += 1
+    exclude = kept_paths | {path for _, path in report.stale}
+    new_paths: List[str] = []
+    with span("few_shot.resample", templates=len(stale_per_template)) as s:
+        for template, count in stale_per_template.items():
+            sampled = sample_template_paths(graph, template, count, exclude)
+            if len(sampled) < count:
+                print(f"Only {len(sampled)} of {count} replacements found for template {'/'.join(template)}")
+            exclude.update(sampled)
+            new_paths.extend(sampled)
+        s.set_attribute("paths", len(new_paths))
+    if not new_paths:
+        return 0
+    with span("few_shot.describe", paths=len(new_paths)):
+        descriptions = generate_path_descriptions(new_paths, description_model_ladder())
+    with span("few_shot.insert", paths=len(new_paths)):
+        if not descriptions or not insert_bulk_data(report.collection_name, new_paths, descriptions):
+            print("ERROR: Failed to insert the replacement examples")
+            return 0
+    write_paths_and_descriptions_to_file(new_paths, descriptions)
+    return len(new_paths)
+
+
+def verify_collection(graph: Any, collection_name: str = "default", action: str = "flag",
+                      batch_size: Optional[int] = None) -> VerificationReport:
+    """
+    Checks every example of the collection against the graph, `batch_size` paths per existence query, and flags,
+    deletes or refreshes the stale ones (see the module docstring). Examples whose path cannot be parsed are
+    counted and left alone.
+
+    Args:
+        graph: Neo4jGraph (or anything with `query(text, params)`).
+        collection_name (str, optional): The Milvus collection. Defaults to "default".
+        action (str, optional): "flag", "delete" or "refresh". Defaults to "flag".
+        batch_size (int, optional): Paths checked per query. Defaults to Config.FEW_SHOT_VERIFY_BATCH_SIZE.
+
+    Returns:
+        VerificationReport: What was checked and done.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action {action!r}, expected one of {', '.join(ACTIONS)}")
+    batch_size = batch_size or Config.FEW_SHOT_VERIFY_BATCH_SIZE
+    report = VerificationReport(collection_name, action)
+    kept_paths: Set[str] = set()
+    with span("few_shot.verify", collection=collection_name, action=action) as s:
+        for rows in _collection_rows(collection_name, batch_size):
+            parsed = [(example_id, path, parse_cypher_path(path)) for example_id, path in rows]
+            checkable = [(example_id, path, steps) for example_id, path, steps in parsed if steps is not None]
+            report.checked += len(rows)
+            report.unparsable += len(rows) - len(checkable)
+            found = existing_examples(graph, [steps for _, _, steps in checkable])
+            for position, (example_id, path, _) in enumerate(checkable):
+                if position in found:
+                    kept_paths.add(path)
+                else:
+                    report.stale.append((example_id, path))
+        metrics.set_gauge("few_shot_stale_examples", len(report.stale), collection=collection_name)
+        if report.stale and action != "flag":
+            if action == "refresh":
+                # replacements first, so that the collection never runs short of examples
+                report.replaced = _replace_examples(graph, report, kept_paths)
+            report.deleted = _delete_examples(collection_name, [example_id for example_id, _ in report.stale])
+            _remove_from_example_files([path for _, path in report.stale])
+        s.set_attributes(**report.as_dict())
+    for _, path in report.stale:
+        print(f"Stale few-shot example: {path}")
+    print(f"Verified {report.checked} examples of '{collection_name}' in {s.duration:.1f}s: {len(report.stale)} "
+          f"stale, {report.deleted} deleted, {report.replaced} replaced, {report.unparsable} not checked")
+    return report
+
+
+def start_verifier(graph: Any, collection_name: str = "default", interval: Optional[float] = None,
+                   action: Optional[str] = None) -> threading.Thread:
+    """
+    Runs verify_collection() every `interval` seconds (the first run after one interval) in a daemon thread; a
+    failed run is printed and retried at the next interval.
+
+    Args:
+        graph: Neo4jGraph (or anything with `query(text, params)`).
+        collection_name (str, optional): The Milvus collection. Defaults to "default".
+        interval (float, optional): Seconds between runs. Defaults to Config.FEW_SHOT_VERIFY_INTERVAL_SECONDS.
+        action (str, optional): See verify_collection(). Defaults to Config.FEW_SHOT_STALE_ACTION.
+    """
+    interval = Config.FEW_SHOT_VERIFY_INTERVAL_SECONDS if interval is None else interval
+    action = action or Config.FEW_SHOT_STALE_ACTION
+
+    def run() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                verify_collection(graph, collection_name, action)
+            except Exception as e:
+                print(f"Few-shot verification of '{collection_name}' failed: {e}")
+
+    thread = threading.Thread(target=run, name="few-shot-verifier", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Find (and delete or replace) few-shot examples whose path no "
+                                                 "longer exists in the graph.")
+    parser.add_argument("--collection", default="default")
+    parser.add_argument("--action", choices=ACTIONS, default="flag")
+    parser.add_argument("--batch-size", type=int, default=Config.FEW_SHOT_VERIFY_BATCH_SIZE,
+                        help="paths checked per existence query")
+    parser.add_argument("--watch", type=float, default=0, help="re-check every WATCH seconds instead of once")
+    args = parser.parse_args(argv)
+
+    from app.database_setup import setup_neo4j_graph
+
+    graph = setup_neo4j_graph(refresh_schema=False)
+    while True:
+        report = verify_collection(graph, args.collection, args.action, args.batch_size)
+        if not args.watch:
+            # flagged examples make the check fail, e.g. in a scheduled job
+            return 1 if report.stale and args.action == "flag" else 0
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
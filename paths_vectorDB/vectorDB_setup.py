@@ -1,7 +1,42 @@
-from typing import List
-from paths_vectorDB.generate_descriptions import generate_embedding
+import asyncio
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Coroutine, Dict, List, Optional, Set, TypeVar
+from paths_vectorDB.generate_descriptions import generate_embedding, generate_embeddings
+from paths_vectorDB.vector_index import (IndexSpec, build_index, cached_quantization, forget_index_type,
+                                         require_index, search_spec)
+from paths_vectorDB.quantization import (BINARY_FIELD, BINARY_SEARCH_PARAM, binary_code, configured_quantization,
+                                         rerank, rerank_count)
+from paths_vectorDB.embedders import collection_description, forget_collection_embedder, require_embedder
+from paths_vectorDB.partitions import (DATASET_FIELD, FILE_TYPE_FIELD, cached_is_partitioned, dataset_filter,
+                                       dataset_names, detect_dataset, forget_partitioning, is_partitioned,
+                                       scope_hits, tag_fields)
+from paths_vectorDB.keyword_index import (Hit, KeywordIndex, MAX_INDEXED_EXAMPLES, cached_keyword_index,
+                                          fuse_hits, invalidate_keyword_index, store_keyword_index)
 from pymilvus import Collection, CollectionSchema, FieldSchema, DataType, connections, utility
 import subprocess
+from app.config import Config
+from app.deadline import remaining_seconds
+from app.tracing import span
+
+# Query vectors sent per Milvus search request by asearch_similar_vectors_batch()
+MAX_SEARCH_VECTORS = 1000
+
+# collection name -> time prepare_collection_for_search() last found it ready (Milvus running, filled, indexed)
+_ready_collections: Dict[str, float] = {}
+_ready_collections_lock = threading.Lock()
+
+T = TypeVar("T")
+
+# The AsyncMilvusClient of asearch_similar_vectors_batch(), created once per process. Its gRPC channel is bound to
+# the event loop it was created on, while callers such as run_query() start a new loop per question, so the client
+# lives on a dedicated loop thread (see _on_milvus_loop()).
+_milvus_loop: Optional[asyncio.AbstractEventLoop] = None
+_milvus_client = None
+# collections loaded through _milvus_client; guarded by _ready_collections_lock
+_loaded_collections: Set[str] = set()
 
 
 def create_and_fill_milvus_collection(collection_name: str, all_paths: List[str], all_descriptions: List[str]):
@@ -29,6 +64,8 @@ def create_and_fill_milvus_collection(collection_name: str, all_paths: List[str]
     create_collection(collection_name, define_schema(), connection_alias)
     # step 4: Insert data into the collection
     insert_bulk_data(collection_name, all_paths, all_descriptions)
+    # step 5: Build the ANN index for the filled collection
+    ensure_embedding_index(Collection(collection_name))
     print("Setup complete✔️✔️✔️ \n")
 
 
@@ -73,6 +110,27 @@ def collection_exists(collection_name: str) -> bool:
     return utility.has_collection(collection_name)
 
 
+def collection_recently_ready(collection_name: str) -> bool:
+    """
+    True if the collection was found ready to search less than Config.VECTOR_COLLECTION_CHECK_SECONDS ago, so
+    prepare_collection_for_search() can skip the `docker ps` call and the Milvus round trips of its checks.
+    """
+    with _ready_collections_lock:
+        ready_at = _ready_collections.get(collection_name)
+    return ready_at is not None and time.monotonic() - ready_at < Config.VECTOR_COLLECTION_CHECK_SECONDS
+
+
+def mark_collection_ready(collection_name: str) -> None:
+    with _ready_collections_lock:
+        _ready_collections[collection_name] = time.monotonic()
+
+
+def forget_collection_ready(collection_name: str) -> None:
+    with _ready_collections_lock:
+        _ready_collections.pop(collection_name, None)
+        _loaded_collections.discard(collection_name)
+
+
 def is_milvus_container_running() -> bool:
     """
     Checks if the Milvus container is running.
@@ -103,7 +161,7 @@ def is_milvus_container_running() -> bool:
         return False
 
 
-def define_schema() -> CollectionSchema:
+def define_schema(embedder_signature: Optional[str] = None) -> CollectionSchema:
     """
     Defines the schema for a Milvus collection.
 
@@ -119,6 +177,13 @@ def define_schema() -> CollectionSchema:
         - Verify that the embedding dimension matches the expected size for the vectors.
 
     Note: If you change the embedding dimension, you must regenerate the embeddings for the data. Also make sure the `embedding` field matches the embedding model's output dimension
+    With Config.VECTOR_QUANTIZATION=binary the schema also has a BINARY_FIELD holding the embedding's sign bits (see paths_vectorDB/quantization.py).
+    With Config.VECTOR_PARTITION_BY_DATASET it has the dataset (partition key) and file type of each path
+    (see paths_vectorDB/partitions.py).
+    The description records the embedder of the vectors (see paths_vectorDB/embedders.py).
+
+    Args:
+        embedder_signature (str, optional): Embedder of the vectors. Defaults to the configured one (Config.EMBEDDER).
 
     Returns:
         CollectionSchema: The schema for the Milvus collection.
@@ -129,10 +194,15 @@ def define_schema() -> CollectionSchema:
         FieldSchema(name="description", dtype=DataType.VARCHAR, max_length=65535),
         FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=512)
     ]
-    return CollectionSchema(fields=fields, description="VectorDB for Cypher paths and descriptions")
+    if configured_quantization() == "binary":
+        fields.append(FieldSchema(name=BINARY_FIELD, dtype=DataType.BINARY_VECTOR, dim=512))
+    if Config.VECTOR_PARTITION_BY_DATASET:
+        fields.append(FieldSchema(name=DATASET_FIELD, dtype=DataType.VARCHAR, max_length=1024, is_partition_key=True))
+        fields.append(FieldSchema(name=FILE_TYPE_FIELD, dtype=DataType.VARCHAR, max_length=64))
+    return CollectionSchema(fields=fields, description=collection_description(embedder_signature))
 
 
-def create_collection(collection_name: str) -> Collection | None:
+def create_collection(collection_name: str, embedder_signature: Optional[str] = None) -> Collection | None:
     """
     Creates a Milvus collection IF IT DOES NOT EXIST ALREADY.
 
@@ -158,7 +228,10 @@ def create_collection(collection_name: str) -> Collection | None:
         # step 1: Connect to the Milvus instance
         connections.connect(alias=connection_alias, host='localhost', port='19530')
         # step 3: Create the collection (if it doesn't exist)
-        collection = Collection(name=collection_name, schema=define_schema(), using=connection_alias)
+        schema = define_schema(embedder_signature)
+        # a partition key spreads the datasets over a fixed number of partitions
+        options = {"num_partitions": Config.VECTOR_DATASET_PARTITIONS} if Config.VECTOR_PARTITION_BY_DATASET else {}
+        collection = Collection(name=collection_name, schema=schema, using=connection_alias, **options)
         print(f"✔️✔️Collection {collection_name} created.")
         return collection
     else:
@@ -169,7 +242,7 @@ def insert_bulk_data(collection_name: str, all_paths: List[str], all_description
     """
     Inserts Cypher paths, descriptions, and their embeddings into an existing Milvus collection.
 
-    This function connects to an existing Milvus collection, generates embeddings for the provided descriptions using the OpenAI API, and inserts the Cypher paths, descriptions, and embeddings into the collection. It also handles exceptions and ensures data is flushed to disk.
+    This function connects to an existing Milvus collection, generates embeddings for the provided descriptions in one batch with the configured embedder (see paths_vectorDB/embedders.py), and inserts the Cypher paths, descriptions, and embeddings into the collection. It also handles exceptions and ensures data is flushed to disk.
 
     Pitfalls:
         - Ensure that the Milvus container is running before executing this function.
@@ -188,13 +261,21 @@ def insert_bulk_data(collection_name: str, all_paths: List[str], all_description
         Exception: If there is an error during data insertion into Milvus Collection.
     """
     existing_collection = Collection(collection_name)
+    require_embedder(existing_collection)
+    binary = _has_binary_field(existing_collection)
+    partitioned = is_partitioned(existing_collection)
     data = []
     print(f"Number of entities in collection before insert: {existing_collection.num_entities}")
     print("Inserting new data into collection...")
+    # one batched embedding call for all the descriptions
+    embeddings = generate_embeddings(all_descriptions)
+    if len(embeddings) != len(all_descriptions):
+        raise Exception("Failed to generate embeddings, generate_descriptions.generate_embeddings() returned "
+                        f"{len(embeddings)} vectors for {len(all_descriptions)} descriptions")
     for index in range(len(all_paths)):
         path = all_paths[index]
         description = all_descriptions[index]
-        vector_embedding = generate_embedding(description)
+        vector_embedding = embeddings[index]
         if not vector_embedding:
             print(f"Failed to generate embedding for path {path}")
             raise Exception("Failed to generate embedding, because generate_descriptions.generate_embedding() returned []")
@@ -203,6 +284,10 @@ def insert_bulk_data(collection_name: str, all_paths: List[str], all_description
             "description": description,
             "embedding": vector_embedding
         }
+        if binary:
+            dictionary[BINARY_FIELD] = binary_code(vector_embedding)
+        if partitioned:
+            dictionary.update(tag_fields(path))
         data.append(dictionary)
     # Insert data into the collection
     try:
@@ -211,6 +296,7 @@ def insert_bulk_data(collection_name: str, all_paths: List[str], all_description
     except Exception as e:
         print(f"Insertion Failure ❌❌: Error during insert: {e}")
         return False
+    invalidate_keyword_index(collection_name)
     # Flush the collection to ensure data is written to disk immediately
     existing_collection.flush()
     print("Data flushed to disk✔️✔️")
@@ -228,6 +314,7 @@ def insert_single_data(collection_name: str, path: str, description: str) -> boo
     except Exception as e:
         print(f"Error accessing collection {collection_name}: {e}")
         return False
+    require_embedder(existing_collection)
     vector_embedding = generate_embedding(description)
     if not vector_embedding:
         print(f"Skipping insertion for path due to embedding failure: \n{path}\n")
@@ -237,15 +324,24 @@ def insert_single_data(collection_name: str, path: str, description: str) -> boo
         "description": description,
         "embedding": vector_embedding
     }
+    if _has_binary_field(existing_collection):
+        record[BINARY_FIELD] = binary_code(vector_embedding)
+    if is_partitioned(existing_collection):
+        record.update(tag_fields(path))
     try:
         existing_collection.insert([record])
         existing_collection.flush()
+        invalidate_keyword_index(collection_name)
         return True
     except Exception as e:
         print(f"Failed insertion for path: \n{path}\nThe Error was == {e}")
         return False
 
 
+def _has_binary_field(collection: Collection) -> bool:
+    return BINARY_FIELD in {field.name for field in collection.schema.fields}
+
+
 def remove_collection(collection_name: str) -> None:
     """
     Removes a specified Milvus collection if it exists.
@@ -269,6 +365,11 @@ def remove_collection(collection_name: str) -> None:
     connections.connect(alias="default", host='localhost', port='19530')
     if utility.has_collection(collection_name):
         utility.drop_collection(collection_name, using="default")
+        invalidate_keyword_index(collection_name)
+        forget_index_type(collection_name)
+        forget_collection_ready(collection_name)
+        forget_partitioning(collection_name)
+        forget_collection_embedder(collection_name)
         print(f"Collection {collection_name} dropped.")
     else:
         print(f"Collection {collection_name} does not exist.")
@@ -306,6 +407,10 @@ def search_similar_vectors(collection_name: str, user_query: str, top_k: int = 3
     It prints the distances of the returned hits and returns the Cypher paths of the similar vectors.
 
     Note: It loads the collection into memory for search and releases it after the search is complete.
+    With Config.HYBRID_SEARCH_ENABLED the vector hits are fused with the collection's BM25 keyword index (see
+    paths_vectorDB/keyword_index.py), so examples sharing exact tokens with the query (file names, field names,
+    dataset names) are ranked up. In a collection partitioned by dataset (see paths_vectorDB/partitions.py), a query
+    naming a dataset is searched within it, and within the whole collection only if that finds nothing.
 
     Pitfalls:
         - Ensure that the Milvus container is running before executing this function.
@@ -328,7 +433,8 @@ def search_similar_vectors(collection_name: str, user_query: str, top_k: int = 3
 
     # Step 1: Generate embedding for the user query
     print("Generating embedding for the user query...")
-    user_query_vector = generate_embedding(user_query)
+    with span("vector.embed_query"):
+        user_query_vector = generate_embedding(user_query)
     if not user_query_vector:
         print("Failed to generate embedding for the user query.")
         raise Exception("Failed to generate embedding for the user query.")
@@ -340,57 +446,310 @@ def search_similar_vectors(collection_name: str, user_query: str, top_k: int = 3
     collection = Collection(collection_name)
     print(f"Collection established with Milvus collection named '{collection_name}'.")
 
-    # Step 3: Check if the collection has an index
-    if not collection.indexes:
-        print("Index doesn't exist, creating index...")
-        index_params = {
-            "index_type": "IVF_FLAT",
-            "metric_type": "IP",
-            "params": {"nlist": 128}
-        }
-        collection.create_index(field_name="embedding", index_params=index_params)
-        print(f"Index created on the 'embedding' field in '{collection_name}' collection.")
-    else:
-        print(f"✔️✔️ Index already exists on the embedding field in '{collection_name}' collection.")
+    # Step 3: Check that the collection has an index (built during setup, never here) and pick its search params
+    require_embedder(collection)
+    spec = require_index(collection)
 
     print("\nLoading the collection into memory for search...")
-    collection.load()
+    with span("vector.load", collection=collection_name):
+        collection.load()
 
-    # Step 3: Define search parameters
-    search_params = {
-        "metric_type": "IP",
-    }
+    # Step 3: Define search parameters (e.g. nprobe for IVF indexes, ef for HNSW)
+    search_params = spec.search_param()
 
-    # Step 4: Conduct the search
+    # Step 4: Conduct the search (on quantized codes, re-ranked with the float vectors, if the collection has them)
     print(f"Searching for similar vectors to user query in the '{collection_name}' collection...")
-    results = collection.search(
-        data=[user_query_vector],
-        anns_field="embedding",
-        param=search_params,
-        limit=top_k,
-        expr=None,
-        output_fields=['cypher_path', 'description'],  # Specify the fields to return
-    )
+    quantization = cached_quantization(collection_name)
+    anns_field, data, search_params = _first_pass(quantization, [user_query_vector], search_params)
+    dataset = None
+    if is_partitioned(collection):
+        dataset = detect_dataset(user_query, dataset_names(_keyword_index(collection)))
+
+    def search(expr: Optional[str]):
+        return collection.search(
+            data=data,
+            anns_field=anns_field,
+            param=search_params,
+            limit=rerank_count(_candidate_count(top_k), quantization),
+            expr=expr,
+            output_fields=_output_fields(quantization),  # Specify the fields to return
+        )
+
+    with span("vector.search", collection=collection_name, top_k=top_k, quantization=quantization,
+              dataset=dataset) as s:
+        results = search(dataset_filter(dataset) if dataset is not None else None)
+        if dataset is not None and not (results and len(results[0])):
+            # nothing in the dataset's partition: search the whole collection
+            s.set_attribute("fallback", True)
+            dataset = None
+            results = search(None)
+        s.set_attribute("hits", len(results[0]) if results else 0)
+    hits = _hits(quantization, user_query_vector, [hit.entity for hit in (results[0] if results else [])],
+                 [hit.distance for hit in (results[0] if results else [])], _candidate_count(top_k))
+    if Config.HYBRID_SEARCH_ENABLED:
+        hits = _hybrid_hits(hits, _keyword_index(collection), user_query, top_k, dataset)
 
     # Step 5: Print distances of the returned hits and store the Cypher paths
     print(f"Success ✔️✔️: Similar vectors are following:")
-    if results:
-        for i, hit in enumerate(results[0]):
-            path: str = hit.entity.get('cypher_path')
-            description: str = hit.entity.get('description')
-
-            # Combine them into a formatted string
-            formatted = f"cypher query: {path}\ndescription: {description}\n"
-            output.append(formatted)
-
-            # Optional debug print
-            print(f"Hit {i + 1}:")
-            print(f"  Cypher Path: {path}")
-            print(f"  Description: {description}")
-            print(f"  Distance: {hit.distance}")
+    for i, (path, description, score) in enumerate(hits[:top_k]):
+        output.append(_format_hit(i, path, description, score))
 
     # Step 6: Release the collection to reduce memory consumption
     collection.release()
     print("Collection released from memory.")
 
     return output
+
+
+def ensure_embedding_index(collection: Collection) -> IndexSpec:
+    """
+    Creates the configured ANN index (see paths_vectorDB/vector_index.py) on the `embedding` field of the given
+    collection if it has no index yet. Called while setting a collection up, not while searching it.
+
+    Args:
+        collection (Collection): The Milvus collection to check.
+
+    Returns:
+        IndexSpec: The index the collection has.
+    """
+    return build_index(collection)
+
+
+def _first_pass(quantization: str, user_query_vectors: List[List[float]], search_param: dict):
+    """Field, query data and search parameters of the first-pass search."""
+    if quantization == "binary":
+        return BINARY_FIELD, [binary_code(vector) for vector in user_query_vectors], dict(BINARY_SEARCH_PARAM)
+    return "embedding", user_query_vectors, search_param
+
+
+def _output_fields(quantization: str) -> List[str]:
+    # a quantized first pass also fetches the float vectors of its candidates, to re-rank them exactly
+    return ['cypher_path', 'description'] + (['embedding'] if quantization != "none" else [])
+
+
+def _hits(quantization: str, user_query_vector: List[float], entities: list, distances: List[float],
+          limit: int) -> List[Hit]:
+    """Search results as hits; the candidates of a quantized first pass are re-ranked by exact inner product."""
+    if quantization == "none":
+        return [(entity.get('cypher_path'), entity.get('description'), distance)
+                for entity, distance in zip(entities, distances)]
+    with span("vector.rerank", candidates=len(entities), quantization=quantization):
+        return rerank(user_query_vector, [(entity.get('cypher_path'), entity.get('description'),
+                                           entity.get('embedding')) for entity in entities], limit)
+
+
+def _candidate_count(top_k: int) -> int:
+    """Vector hits to fetch: more than top_k when they are fused with keyword hits afterwards."""
+    return max(top_k, Config.HYBRID_CANDIDATES) if Config.HYBRID_SEARCH_ENABLED else top_k
+
+
+def _keyword_index(collection: Collection) -> KeywordIndex:
+    """The (cached) keyword index of a loaded collection, built from all of its rows."""
+    index = cached_keyword_index(collection.name)
+    if index is None:
+        rows = collection.query(expr='cypher_path != ""', output_fields=['cypher_path', 'description'],
+                                limit=MAX_INDEXED_EXAMPLES)
+        index = store_keyword_index(collection.name, [row['cypher_path'] for row in rows],
+                                    [row['description'] for row in rows])
+    return index
+
+
+async def _akeyword_index(client, collection_name: str) -> KeywordIndex:
+    """Async version of _keyword_index() on an AsyncMilvusClient."""
+    index = cached_keyword_index(collection_name)
+    if index is None:
+        rows = await client.query(collection_name, filter='cypher_path != ""',
+                                  output_fields=['cypher_path', 'description'], limit=MAX_INDEXED_EXAMPLES,
+                                  timeout=remaining_seconds())
+        index = store_keyword_index(collection_name, [row['cypher_path'] for row in rows],
+                                    [row['description'] for row in rows])
+    return index
+
+
+def _hybrid_hits(vector_hits: List[Hit], index: KeywordIndex, user_query: str, top_k: int,
+                 dataset: Optional[str] = None) -> List[Hit]:
+    with span("vector.keyword_search", examples=len(index)) as s:
+        # the keyword hits of a search scoped to a dataset are limited to that dataset, like the vector hits
+        keyword_hits = scope_hits(index.search(user_query, Config.HYBRID_CANDIDATES), dataset)
+        s.set_attribute("hits", len(keyword_hits))
+    return fuse_hits(vector_hits, keyword_hits, top_k)
+
+
+def _format_hit(i: int, path: str, description: str, distance: float) -> str:
+    """Formats a single search hit as a few-shot example (and prints it for debugging)."""
+    print(f"Hit {i + 1}:")
+    print(f"  Cypher Path: {path}")
+    print(f"  Description: {description}")
+    print(f"  Distance: {distance}")
+    return f"cypher query: {path}\ndescription: {description}\n"
+
+
+async def asearch_similar_vectors(collection_name: str, user_query_vector: List[float], top_k: int = 3,
+                                  user_query: str = None) -> List[str]:
+    """
+    Async version of search_similar_vectors() that takes an already computed query embedding, so the caller can
+    generate it concurrently with other work. Uses pymilvus' AsyncMilvusClient for loading and searching.
+
+    Note: Unlike search_similar_vectors(), the collection is NOT released after the search. Concurrent async queries
+    share the loaded collection and releasing it under another in-flight search would make that search fail.
+
+    Pitfalls:
+        - The collection must exist and have an index on `embedding` (see ensure_embedding_index()). Search
+          parameters follow the index type seen by prepare_collection_for_search(), or the configured type.
+
+    Args:
+        collection_name (str): The name of the Milvus collection to search in.
+        user_query_vector (List[float]): Embedding of the user query.
+        top_k (int, optional): The number of similar vectors to return (in descending order of similarity). Defaults to 3.
+        user_query (str, optional): The user query. When given and Config.HYBRID_SEARCH_ENABLED is set, the vector
+                                    hits are fused with the collection's keyword index (see search_similar_vectors()).
+
+    Returns:
+        List[str]: A list of Cypher paths that are most similar to the user query.
+    """
+    results = await asearch_similar_vectors_batch(collection_name, [user_query_vector], top_k,
+                                                  [user_query] if user_query is not None else None)
+    return results[0]
+
+
+async def asearch_similar_vectors_batch(collection_name: str, user_query_vectors: List[List[float]], top_k: int = 3,
+                                        user_queries: List[str] = None) -> List[List[str]]:
+    """
+    Searches the collection for several query embeddings at once: one multi-vector search request per
+    MAX_SEARCH_VECTORS queries instead of a round trip per query (see asearch_similar_vectors()). The AsyncMilvusClient
+    is created once per process and loads each collection the first time it is searched.
+
+    Args:
+        collection_name (str): The name of the Milvus collection to search in.
+        user_query_vectors (List[List[float]]): Embeddings of the user queries.
+        top_k (int, optional): The number of similar vectors to return per query. Defaults to 3.
+        user_queries (List[str], optional): The user queries, same order as the vectors; enables hybrid search and,
+                                            in a partitioned collection, searches scoped to the dataset they name.
+
+    Returns:
+        List[List[str]]: The few-shot examples of each query, in order.
+    """
+    hybrid = Config.HYBRID_SEARCH_ENABLED and user_queries is not None
+
+    partitioned = cached_is_partitioned(collection_name) and user_queries is not None
+    quantization = cached_quantization(collection_name)
+    limit = _candidate_count(top_k) if hybrid else top_k
+    anns_field, data, search_param = _first_pass(quantization, user_query_vectors,
+                                                 search_spec(collection_name).search_param())
+    search = {"anns_field": anns_field, "search_params": search_param, "limit": rerank_count(limit, quantization),
+              "output_fields": _output_fields(quantization)}
+    results, index, datasets = await _on_milvus_loop(
+        _aload_and_search(collection_name, data, search, top_k, quantization, user_queries, hybrid or partitioned,
+                          partitioned))
+
+    output: List[List[str]] = []
+    for position, query_results in enumerate(results):
+        hits = _hits(quantization, user_query_vectors[position], [hit["entity"] for hit in query_results],
+                     [hit["distance"] for hit in query_results], limit)
+        if hybrid:
+            hits = _hybrid_hits(hits, index, user_queries[position], top_k, datasets[position])
+        output.append([_format_hit(i, path, description, score)
+                       for i, (path, description, score) in enumerate(hits[:top_k])])
+    return output
+
+
+def _milvus_event_loop() -> asyncio.AbstractEventLoop:
+    global _milvus_loop
+    with _ready_collections_lock:
+        if _milvus_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="milvus-client", daemon=True).start()
+            _milvus_loop = loop
+        return _milvus_loop
+
+
+async def _in_context(context: contextvars.Context, coroutine: Coroutine[Any, Any, T]) -> T:
+    return await asyncio.get_running_loop().create_task(coroutine, context=context)
+
+
+async def _on_milvus_loop(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Awaits `coroutine` on the loop of the process-wide AsyncMilvusClient, in the caller's context (so its spans and
+    deadline apply). Cancelling the caller cancels the coroutine.
+    """
+    future = asyncio.run_coroutine_threadsafe(_in_context(contextvars.copy_context(), coroutine), _milvus_event_loop())
+    return await asyncio.wrap_future(future)
+
+
+def _async_milvus_client():
+    """The process-wide AsyncMilvusClient; only called on the loop of _milvus_event_loop()."""
+    global _milvus_client
+    if _milvus_client is None:
+        from pymilvus import AsyncMilvusClient
+        _milvus_client = AsyncMilvusClient(uri="http://localhost:19530")
+    return _milvus_client
+
+
+async def _aload_and_search(collection_name: str, data: list, search: dict, top_k: int, quantization: str,
+                            user_queries: Optional[List[str]], with_index: bool, partitioned: bool):
+    """
+    The Milvus part of asearch_similar_vectors_batch(), run on the client's loop: loads the collection the first time
+    it is searched and runs the (dataset-scoped) searches.
+
+    Returns:
+        tuple: The raw results of each query, the keyword index (None unless `with_index`) and the dataset each
+               query was scoped to.
+    """
+    client = _async_milvus_client()
+    with _ready_collections_lock:
+        loaded = collection_name in _loaded_collections
+    try:
+        if not loaded:
+            # bounded by the request deadline, if any (see app/deadline.py)
+            with span("vector.load", collection=collection_name):
+                await client.load_collection(collection_name, timeout=remaining_seconds())
+            with _ready_collections_lock:
+                _loaded_collections.add(collection_name)
+        index = await _akeyword_index(client, collection_name) if with_index else None
+        datasets: List[Optional[str]] = [None] * len(data)
+        if partitioned:
+            names = dataset_names(index)
+            datasets = [detect_dataset(user_query, names) for user_query in user_queries]
+        with span("vector.search", collection=collection_name, top_k=top_k, queries=len(data),
+                  quantization=quantization, scoped=sum(dataset is not None for dataset in datasets)) as s:
+            results = await _asearch_scoped(client, collection_name, data, datasets, search)
+            # a dataset without a matching example is searched in the whole collection
+            fallback = [position for position, dataset in enumerate(datasets)
+                        if dataset is not None and not results[position]]
+            if fallback:
+                fallback_results = await _asearch(client, collection_name, [data[p] for p in fallback], "", search)
+                for position, query_results in zip(fallback, fallback_results):
+                    results[position], datasets[position] = query_results, None
+            s.set_attributes(hits=sum(len(query_results) for query_results in results), fallback=len(fallback))
+    except Exception:
+        # e.g. released or dropped by another process, or Milvus restarted: load it again next time
+        with _ready_collections_lock:
+            _loaded_collections.discard(collection_name)
+        raise
+    return results, index, datasets
+
+
+async def _asearch(client, collection_name: str, data: list, filter_expr: str, search: dict) -> list:
+    """Searches `data` in chunks of MAX_SEARCH_VECTORS query vectors; results in the order of `data`."""
+    results = []
+    for start in range(0, len(data), MAX_SEARCH_VECTORS):
+        results.extend(await client.search(collection_name=collection_name, data=data[start:start + MAX_SEARCH_VECTORS],
+                                           filter=filter_expr, timeout=remaining_seconds(), **search))
+    return results
+
+
+async def _asearch_scoped(client, collection_name: str, data: list, datasets: List[Optional[str]],
+                          search: dict) -> list:
+    """One search request per dataset (None: the whole collection), run concurrently; results in the order of `data`."""
+    groups: Dict[Optional[str], List[int]] = defaultdict(list)
+    for position, dataset in enumerate(datasets):
+        groups[dataset].append(position)
+    group_results = await asyncio.gather(*(
+        _asearch(client, collection_name, [data[p] for p in positions],
+                 dataset_filter(dataset) if dataset is not None else "", search)
+        for dataset, positions in groups.items()))
+    results = [None] * len(data)
+    for positions, query_results in zip(groups.values(), group_results):
+        for position, hits in zip(positions, query_results):
+            results[position] = hits
+    return results
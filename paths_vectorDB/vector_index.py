@@ -0,0 +1,280 @@
+"""
+ANN index of the few-shot collections: which index type and build/search parameters a collection uses.
+
+The index is built when a collection is created and filled, or on demand with this module's command; searches only
+read the index type (once per collection and process) to pick matching search parameters and never build anything.
+With Config.VECTOR_QUANTIZATION the first-pass search runs on quantized codes (see paths_vectorDB/quantization.py).
+
+Usage (from the repository root, Milvus running):
+    python -m paths_vectorDB.vector_index build --collection default
+    python -m paths_vectorDB.vector_index build --collection default --index-type HNSW --params '{"M": 16}' --rebuild
+    python -m paths_vectorDB.vector_index show --collection default
+"""
+import argparse
+import json
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from pymilvus import Collection, connections, utility
+
+from app.config import Config
+from paths_vectorDB.quantization import BINARY_FIELD, BINARY_INDEX_PARAMS, configured_quantization
+
+INDEX_TYPES = ("FLAT", "IVF_FLAT", "IVF_SQ8", "HNSW")
+# Inner product, like the embeddings' similarity in search_similar_vectors()
+METRIC_TYPE = "IP"
+DEFAULT_BUILD_PARAMS: Dict[str, Dict[str, Any]] = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": 128},
+    "IVF_SQ8": {"nlist": 128},
+    "HNSW": {"M": 16, "efConstruction": 200},
+}
+DEFAULT_SEARCH_PARAMS: Dict[str, Dict[str, Any]] = {
+    "FLAT": {},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "HNSW": {"ef": 64},
+}
+
+
+class IndexSpec:
+    """
+    Index type plus build and search parameters. Parameters that do not apply to the index type are dropped, so one
+    set of overrides (e.g. {"nprobe": 32, "ef": 128}) can serve whichever type a collection ends up with.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        params (dict, optional): Build parameters, merged over DEFAULT_BUILD_PARAMS of the type.
+        search_params (dict, optional): Search parameters, merged over DEFAULT_SEARCH_PARAMS of the type.
+    """
+
+    def __init__(self, index_type: str, params: Optional[Dict[str, Any]] = None,
+                 search_params: Optional[Dict[str, Any]] = None):
+        index_type = index_type.upper()
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+        self.index_type = index_type
+        self.params = _merge(DEFAULT_BUILD_PARAMS[index_type], params)
+        self.search_params = _merge(DEFAULT_SEARCH_PARAMS[index_type], search_params)
+
+    def index_params(self) -> Dict[str, Any]:
+        """Argument of Collection.create_index()."""
+        return {"index_type": self.index_type, "metric_type": METRIC_TYPE, "params": dict(self.params)}
+
+    def search_param(self) -> Dict[str, Any]:
+        """`param` of Collection.search() / `search_params` of AsyncMilvusClient.search()."""
+        return {"metric_type": METRIC_TYPE, "params": dict(self.search_params)}
+
+    @property
+    def label(self) -> str:
+        """Short description, e.g. "HNSW M=16 efConstruction=200 / ef=64"."""
+        build = " ".join(f"{k}={v}" for k, v in self.params.items())
+        search = " ".join(f"{k}={v}" for k, v in self.search_params.items())
+        return " ".join(part for part in (self.index_type, build, f"/ {search}" if search else "") if part)
+
+
+def _merge(defaults: Dict[str, Any], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = dict(defaults)
+    merged.update({k: v for k, v in (overrides or {}).items() if k in defaults})
+    return merged
+
+
+def _parse_json(value: str, setting: str) -> Dict[str, Any]:
+    if not value:
+        return {}
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{setting} is not valid JSON: {e}") from None
+    if not isinstance(parsed, dict):
+        raise ValueError(f"{setting} must be a JSON object")
+    return parsed
+
+
+def _collection_settings(collection_name: str) -> Dict[str, Any]:
+    """The collection's entry in Config.VECTOR_INDEX_OVERRIDES, falling back to the global settings."""
+    override = _parse_json(Config.VECTOR_INDEX_OVERRIDES, "VECTOR_INDEX_OVERRIDES").get(collection_name, {})
+    return {
+        "index_type": override.get("index_type", Config.VECTOR_INDEX_TYPE),
+        "params": override.get("params", _parse_json(Config.VECTOR_INDEX_PARAMS, "VECTOR_INDEX_PARAMS")),
+        "search_params": override.get("search_params",
+                                      _parse_json(Config.VECTOR_SEARCH_PARAMS, "VECTOR_SEARCH_PARAMS")),
+    }
+
+
+def index_spec_for(collection_name: str, num_entities: Optional[int] = None,
+                   index_type: Optional[str] = None) -> IndexSpec:
+    """
+    The configured index of a collection (Config.VECTOR_INDEX_* and its VECTOR_INDEX_OVERRIDES entry).
+
+    Args:
+        collection_name (str): The collection.
+        num_entities (int, optional): Its size, used to resolve index type AUTO: FLAT (exact search) up to
+                                      Config.VECTOR_INDEX_AUTO_FLAT_MAX vectors, HNSW above. Unknown sizes give HNSW.
+        index_type (str, optional): Use this type instead of the configured one (e.g. the type actually built).
+                                    AUTO is IVF_SQ8 with Config.VECTOR_QUANTIZATION=int8.
+
+    Returns:
+        IndexSpec: The index type with its build and search parameters.
+    """
+    settings = _collection_settings(collection_name)
+    index_type = (index_type or settings["index_type"]).upper()
+    if index_type == "AUTO" and configured_quantization() == "int8":
+        index_type = "IVF_SQ8"
+    elif index_type == "AUTO":
+        small = num_entities is not None and num_entities <= Config.VECTOR_INDEX_AUTO_FLAT_MAX
+        index_type = "FLAT" if small else "HNSW"
+    return IndexSpec(index_type, settings["params"], settings["search_params"])
+
+
+# collection name -> index type built on its embedding field, and whether its BINARY_FIELD is indexed
+_built_index_types: Dict[str, str] = {}
+_binary_indexed: Dict[str, bool] = {}
+_built_index_types_lock = threading.Lock()
+
+
+def built_index_type(collection: Collection) -> Optional[str]:
+    """The index type on the collection's embedding field (cached per process), or None if it has no index."""
+    with _built_index_types_lock:
+        cached = _built_index_types.get(collection.name)
+    if cached is not None:
+        return cached
+    indexed_fields = {index.field_name: index.params.get("index_type") for index in collection.indexes}
+    index_type = indexed_fields.get("embedding")
+    if index_type is not None:
+        with _built_index_types_lock:
+            _built_index_types[collection.name] = index_type
+            _binary_indexed[collection.name] = BINARY_FIELD in indexed_fields
+    return index_type
+
+
+def cached_index_type(collection_name: str) -> Optional[str]:
+    """The index type remembered by built_index_type(), without asking Milvus."""
+    with _built_index_types_lock:
+        return _built_index_types.get(collection_name)
+
+
+def forget_index_type(collection_name: str) -> None:
+    with _built_index_types_lock:
+        _built_index_types.pop(collection_name, None)
+        _binary_indexed.pop(collection_name, None)
+
+
+def cached_quantization(collection_name: str) -> str:
+    """
+    How the collection's first-pass search is quantized, from the indexes seen by built_index_type(): "binary" if its
+    BINARY_FIELD is indexed, "int8" for an IVF_SQ8 index on `embedding`, else "none". A collection created before
+    VECTOR_QUANTIZATION was set keeps searching its float vectors.
+    """
+    with _built_index_types_lock:
+        if _binary_indexed.get(collection_name):
+            return "binary"
+        return "int8" if _built_index_types.get(collection_name) == "IVF_SQ8" else "none"
+
+
+def require_index(collection: Collection) -> IndexSpec:
+    """
+    The spec to search the collection with, matching the index actually built on it. Raises instead of building a
+    missing index: building belongs to collection setup (build_index()), not to a user's query.
+    """
+    index_type = built_index_type(collection)
+    if index_type is None:
+        raise Exception(f"Collection {collection.name} has no index on 'embedding'. "
+                        f"Build it with: python -m paths_vectorDB.vector_index build --collection {collection.name}")
+    return index_spec_for(collection.name, index_type=index_type)
+
+
+def search_spec(collection_name: str) -> IndexSpec:
+    """
+    Search parameters for a collection whose index type was seen before (see require_index()); falls back to the
+    configured type when it was not.
+    """
+    return index_spec_for(collection_name, index_type=cached_index_type(collection_name))
+
+
+def build_index(collection: Collection, spec: Optional[IndexSpec] = None, rebuild: bool = False) -> IndexSpec:
+    """
+    Builds the ANN index on the collection's `embedding` field and waits until it is ready.
+
+    Args:
+        collection (Collection): The collection.
+        spec (IndexSpec, optional): The index to build. Defaults to index_spec_for() the collection and its size.
+        rebuild (bool, optional): Drop an existing index first. Otherwise an existing index is kept. Defaults to False.
+
+    Returns:
+        IndexSpec: The spec of the index the collection now has.
+    """
+    spec = spec or index_spec_for(collection.name, num_entities=collection.num_entities)
+    existing = built_index_type(collection)
+    if existing is not None and not rebuild:
+        print(f"✔️✔️ Index {existing} already exists on the embedding field in '{collection.name}' collection.")
+        _build_binary_index(collection)
+        return index_spec_for(collection.name, index_type=existing)
+    if existing is not None:
+        print(f"Dropping {existing} index of '{collection.name}'...")
+        collection.release()
+        for index in collection.indexes:
+            if index.field_name == "embedding":
+                index.drop()
+        forget_index_type(collection.name)
+    print(f"Building {spec.label} index on '{collection.name}'...")
+    collection.create_index(field_name="embedding", index_params=spec.index_params())
+    index_name = next(index.index_name for index in collection.indexes if index.field_name == "embedding")
+    utility.wait_for_index_building_complete(collection.name, index_name=index_name)
+    with _built_index_types_lock:
+        _built_index_types[collection.name] = spec.index_type
+    print(f"Index created on the 'embedding' field in '{collection.name}' collection.")
+    _build_binary_index(collection)
+    if configured_quantization() != "none":
+        # the first pass reads the quantized codes; the float vectors, read only to re-rank a few candidates, are
+        # memory-mapped from disk instead of being held in memory
+        try:
+            collection.set_properties({"mmap.enabled": True})
+        except Exception as e:
+            print(f"WARNING: Could not memory-map the raw vectors of '{collection.name}': {e}")
+    return spec
+
+
+def _build_binary_index(collection: Collection) -> None:
+    """Indexes the collection's BINARY_FIELD (if it has one) for the binary-quantized first pass."""
+    if BINARY_FIELD not in {field.name for field in collection.schema.fields}:
+        return
+    if any(index.field_name == BINARY_FIELD for index in collection.indexes):
+        return
+    print(f"Building binary index on '{collection.name}'...")
+    collection.create_index(field_name=BINARY_FIELD, index_params=dict(BINARY_INDEX_PARAMS), index_name=BINARY_FIELD)
+    utility.wait_for_index_building_complete(collection.name, index_name=BINARY_FIELD)
+    with _built_index_types_lock:
+        _binary_indexed[collection.name] = True
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or inspect the ANN index of a few-shot collection.")
+    parser.add_argument("command", choices=("build", "show"))
+    parser.add_argument("--collection", default="default")
+    parser.add_argument("--index-type", help=f"{', '.join(INDEX_TYPES)} or AUTO (default: configured type)")
+    parser.add_argument("--params", help="build parameters as JSON, e.g. '{\"nlist\": 64}'")
+    parser.add_argument("--rebuild", action="store_true", help="drop and rebuild an existing index")
+    args = parser.parse_args(argv)
+
+    connections.connect(alias="default", host='localhost', port='19530')
+    if not utility.has_collection(args.collection):
+        print(f"Collection {args.collection} does not exist.")
+        return 1
+    collection = Collection(args.collection)
+    if args.command == "show":
+        for index in collection.indexes:
+            print(f"{index.field_name}: {index.params}")
+        print(f"configured: {index_spec_for(args.collection, num_entities=collection.num_entities).label}")
+        return 0
+
+    spec = index_spec_for(args.collection, num_entities=collection.num_entities, index_type=args.index_type)
+    if args.params:
+        spec = IndexSpec(spec.index_type, _parse_json(args.params, "--params"), spec.search_params)
+    build_index(collection, spec, rebuild=args.rebuild)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
-from typing import List
+import os
+from typing import Iterable, List
 
 
 def write_paths_and_descriptions_to_file(all_paths: List[str], all_descriptions: List[str]):
@@ -20,14 +21,16 @@ def write_paths_and_descriptions_to_file(all_paths: List[str], all_descriptions:
         print(f"Error opening file vectordb_paths_descriptions.txt: {e}")
 
 
-def read_paths_and_descriptions_from_file() -> List[List[str]]:
+def read_paths_and_descriptions_from_file(file_path: str = 'vectordb_paths_descriptions.txt') -> List[List[str]]:
     """
     Read the paths and descriptions from a file named vectordb_paths_descriptions.txt and return them as a list of lists.
 
+    Args:
+        file_path (str): Path of the file to read. Defaults to vectordb_paths_descriptions.txt in the working directory.
+
     Returns:
         List[List[str]]: A list containing two lists - one for paths and one for descriptions.
     """
-    file_path = 'vectordb_paths_descriptions.txt'
     paths = []
     descriptions = []
     try:
@@ -44,3 +47,36 @@ def read_paths_and_descriptions_from_file() -> List[List[str]]:
     except Exception as e:
         print(f"Error reading from file {file_path}: {e}")
         return [[], []]
+
+
+def remove_paths_from_file(paths: Iterable[str], file_path: str = 'vectordb_paths_descriptions.txt') -> int:
+    """
+    Rewrites a file written by write_paths_and_descriptions_to_file() without the entries of `paths` (e.g. examples
+    deleted as stale, see paths_vectorDB/stale_paths.py). The file is replaced atomically, so readers never see it
+    half written.
+
+    Args:
+        paths (Iterable[str]): Cypher paths whose entries are removed.
+        file_path (str): Path of the file. Defaults to vectordb_paths_descriptions.txt in the working directory.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    removed_paths = set(paths)
+    removed = 0
+    kept_lines = []
+    skipping = False
+    with open(file_path, 'r', encoding="utf-8", errors="replace") as file:
+        for line in file:
+            if line.startswith("Path:"):
+                # an entry runs until the next "Path:" line (descriptions may span several lines)
+                skipping = line[len("Path: "):].strip() in removed_paths
+                removed += skipping
+            if not skipping:
+                kept_lines.append(line)
+    if removed:
+        temporary_path = f"{file_path}.tmp"
+        with open(temporary_path, 'w', encoding="utf-8") as file:
+            file.writelines(kept_lines)
+        os.replace(temporary_path, file_path)
+    return removed
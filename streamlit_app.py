@@ -1,11 +1,13 @@
 # streamlit_app.py
 import streamlit as st
-import pandas as pd
-import random
 import time
-import threading
-from paths_vectorDB.vectorDB_setup import collection_exists, get_collection_size
+import uuid
+from app.config import Config
 from app.main import process_query
+from app.query_executor import FairQueryExecutor, QueueFullError
+from app.resources import SharedResources
+from app.service_client import QueryServiceClient, ServiceUnavailableError
+from app.warm_up import start_warm_up
 #from app.trash import process_query  # for testing returns a sample response for a query with a delay of 2 seconds
 
 # Set up the page configuration (no sidebar, refined professional theme)
@@ -57,6 +59,48 @@ st.markdown("""
 st.markdown('<div class="header-container"><div class="header">Pennsieve Query Engine</div></div>',
             unsafe_allow_html=True)
 
+
+@st.cache_resource
+def get_shared_resources() -> SharedResources:
+    """
+    Graph/LLM clients and the DataGuide cache, created once per server process and shared by all sessions. Their
+    caches are warmed up in the background (see app/warm_up.py) while the first page is served, and the few-shot
+    examples are checked against the graph periodically if FEW_SHOT_VERIFY_INTERVAL_SECONDS is set.
+    """
+    resources = SharedResources()
+    start_warm_up(resources)
+    if Config.FEW_SHOT_VERIFY_INTERVAL_SECONDS > 0:
+        from paths_vectorDB.stale_paths import start_verifier
+
+        start_verifier(resources.graph)
+    return resources
+
+
+@st.cache_resource
+def get_query_executor():
+    """
+    Runs queries for every session: the query service at QUERY_SERVICE_URL (see app/service.py), which holds the
+    warm state, or else a process-wide worker pool in this process.
+    """
+    if Config.QUERY_SERVICE_URL:
+        return QueryServiceClient(Config.QUERY_SERVICE_URL)
+    return FairQueryExecutor(run_fn=lambda question: process_query(question, resources=get_shared_resources()))
+
+
+# Number of context rows rendered per page of the results table
+CONTEXT_PAGE_SIZE = 100
+# Seconds past the query deadline after which the page stops waiting for the result
+DEADLINE_GRACE_SECONDS = 15
+
+# Answering in this process: create the shared clients with the first page of the server process (a no-op on later
+# reruns) so that the warm-up runs while the user types the first question
+if not Config.QUERY_SERVICE_URL:
+    get_shared_resources()
+
+# Identifies this browser session for per-user fairness in the query queue
+if "user_id" not in st.session_state:
+    st.session_state["user_id"] = uuid.uuid4().hex
+
 # Use columns to center the input and button (input box will be in the middle column, ~40% width)
 cols = st.columns([3, 4, 3])
 with cols[1]:
@@ -65,138 +109,126 @@ with cols[1]:
 
 if submit:
     if user_query.strip():
-        # Create a dictionary to store the result from process_query
-        result_dict = {}
-
-        # Define a function to run the query and store the result.
-        def run_query():
-            result_dict["response"] = process_query(user_query)
-
-        # Start process_query in a separate thread.
-        query_thread = threading.Thread(target=run_query)
-        query_thread.start()
-
-        # Show spinner and update steps while process_query runs.
+        # Queue the query on the process-wide executor or the query service (bounded concurrency, per-session
+        # fairness, identical in-flight questions are coalesced into one execution).
+        try:
+            ticket = get_query_executor().submit(st.session_state["user_id"], user_query)
+        except (QueueFullError, ServiceUnavailableError) as e:
+            st.error(str(e))
+            st.stop()
+
+        # Show the queue position while waiting, then the elapsed time while the query runs.
         with st.spinner("Progress:"):
             status = st.empty()  # placeholder for step messages
             start_time = time.time()
-
-            # Step 1:
-            elapsed = time.time() - start_time
-            status.markdown(f"""
-            <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                <strong style="font-size:16px;">Step 1:</strong> Making sure vector database is up and running<br>
-                <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-            </div>
-            """, unsafe_allow_html=True)
-            time.sleep(random.uniform(2, 4))
-
-            # Step 2:
-            elapsed = time.time() - start_time
-            status.markdown(f"""
-            <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                <strong style="font-size:16px;">Step 2:</strong> Looking up similar queries in the vector database<br>
-                <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-            </div>
-            """, unsafe_allow_html=True)
-            time.sleep(random.uniform(3, 6))
-
-            # Step 3:
-            elapsed = time.time() - start_time
-            status.markdown(f"""
-            <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                <strong style="font-size:16px;">Step 3:</strong> Generating cypher query, this takes sometime<br>
-                <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-            </div>
-            """, unsafe_allow_html=True)
-            time.sleep(random.uniform(3, 6))
-
-            # Step 4:
-            elapsed = time.time() - start_time
-            status.markdown(f"""
-            <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                <strong style="font-size:16px;">Step 4:</strong> Getting results back<br>
-                <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-            </div>
-            """, unsafe_allow_html=True)
-            time.sleep(random.uniform(2, 5))
-
-            # Step 5: Keep showing a status message until process_query finishes.
-            while query_thread.is_alive():
+            run_started = None
+            while not ticket.done():
                 elapsed = time.time() - start_time
-                if elapsed >= 35:
-                    status.markdown(
-                        f"""
-                        <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                            <strong style="font-size:16px;">Step 5:</strong> Previously generated query failed, retrying error correction<br>
-                            <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                if elapsed >= 55:
-                    status.markdown(
-                        f"""
-                        <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                            <strong style="font-size:16px;">Step 5:</strong> Generated query failed to get results, retrying one last time<br>
-                            <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                position = ticket.position()
+                if not position and run_started is None:
+                    run_started = time.time()
+                # the query returns partial results at its deadline; stop waiting if it somehow does not
+                if run_started is not None and Config.QUERY_DEADLINE_SECONDS > 0 and \
+                        time.time() - run_started > Config.QUERY_DEADLINE_SECONDS + DEADLINE_GRACE_SECONDS:
+                    status.empty()
+                    st.error("The query did not finish within its time limit. Please try again or rephrase it.")
+                    st.stop()
+                if position:
+                    message = f"Waiting for a free worker: position {position} in the queue"
+                elif ticket.coalesced:
+                    message = "Same question is already being answered for another user, waiting for its result"
+                elif elapsed >= 55:
+                    message = "Generated query failed to get results, retrying one last time"
+                elif elapsed >= 35:
+                    message = "Previously generated query failed, retrying error correction"
                 else:
-                    status.markdown(
-                        f"""
-                        <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
-                            <strong style="font-size:16px;">Step 5:</strong> Summarizing everything, please hold on<br>
-                            <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    message = "Looking up similar queries, generating and running the cypher query"
+                status.markdown(
+                    f"""
+                    <div style="padding:10px; background-color: #e8f4f8; border-radius: 5px; margin-bottom:10px;">
+                        <strong style="font-size:16px;">Status:</strong> {message}<br>
+                        <span style="color:gray; font-size:14px;">Elapsed time: {elapsed:.1f} seconds</span>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
                 time.sleep(1)
             status.empty()  # Clear the status once done
 
-        # Ensure the thread is finished before retrieving the result.
-        query_thread.join()
-        response = result_dict.get("response")
-
-        st.subheader("Results")
+        try:
+            response = ticket.result()
+        except Exception as e:
+            st.error(f"Query failed: {e}")
+            st.stop()
+        if not isinstance(response, dict):
+            st.warning(str(response))
+            st.stop()
+        # Keep the response across reruns (e.g. when the user pages through the context table)
+        st.session_state["last_response"] = response
+    else:
+        st.error("Please enter a valid query.")
 
-        # 1. Final LLM Answer
-        final_answer = response.get("result", "No result returned") if response is not None else "No result returned"
+response = st.session_state.get("last_response")
+if response:
+    st.subheader("Results")
+
+    # 1. Final Answer: either formatted directly from a simple result or written by the LLM
+    final_answer = response.get("result", "No result returned") if response is not None else "No result returned"
+    if response.get("answer_path") == "template":
+        st.markdown("**Answer** (formatted directly from the query result, no LLM call):")
+        st.markdown(final_answer)
+        if response.get("route"):
+            st.caption(f"Routed as '{response['route']['intent']}' with pre-written Cypher "
+                       f"(confidence {response['route']['confidence']:.2f}), no Cypher generation.")
+    elif response.get("answer_path") == "partial":
+        st.warning(final_answer)
+    elif response.get("answer_path") == "signal_store":
+        st.markdown("**Answer** (read from the materialized EDF signals, no graph traversal):")
+        st.markdown(final_answer)
+    else:
         st.markdown(f'<div class="result-box"><strong>Final LLM answer:</strong><br>{final_answer}</div>',
                     unsafe_allow_html=True)
-
-        # 2. Generated Cypher (Heading outside the box)
-        generated_cypher = "No generated Cypher found"
-        intermediate_steps = response.get("intermediate_steps", [])
-        if intermediate_steps:
-            if "query" in intermediate_steps[0]:
-                generated_cypher = intermediate_steps[0]["query"]
-                # Remove the starting "cypher\n" if present.
-                generated_cypher = generated_cypher.replace("cypher\n", "") if generated_cypher.startswith(
-                    "cypher\n") else generated_cypher
-            else:
-                generated_cypher = "Cypher query couldn't be parsed properly"
-        st.markdown("#### Generated Cypher", unsafe_allow_html=True)
-        if generated_cypher:
-            st.code(generated_cypher, language='cypher', line_numbers=True, wrap_lines=True)
-        else:
-            st.markdown('<div class="result-box">No generated Cypher found.</div>', unsafe_allow_html=True)
-
-        # 3. Full Context: Extract and display as an interactive table
-        context_data = []
-        for step in intermediate_steps:
-            if "context" in step:
-                context_data = step["context"]
-                break
-
-        st.markdown("#### Full Context", unsafe_allow_html=True)
-        if context_data:
-            df_context = pd.DataFrame(context_data)
-            st.dataframe(df_context)  # Interactive table: columns can be resized
+    if "vector" in response.get("degraded", []):
+        st.caption("The example store was unavailable; Cypher was generated with examples matched locally.")
+
+    # 2. Generated Cypher (Heading outside the box)
+    generated_cypher = "No generated Cypher found"
+    intermediate_steps = response.get("intermediate_steps", [])
+    if intermediate_steps:
+        if "query" in intermediate_steps[0]:
+            generated_cypher = intermediate_steps[0]["query"]
+            # Remove the starting "cypher\n" if present.
+            generated_cypher = generated_cypher.replace("cypher\n", "") if generated_cypher.startswith(
+                "cypher\n") else generated_cypher
         else:
-            st.markdown('<div class="result-box">No context data found.</div>', unsafe_allow_html=True)
+            generated_cypher = "Cypher query couldn't be parsed properly"
+    st.markdown("#### Generated Cypher", unsafe_allow_html=True)
+    if generated_cypher:
+        st.code(generated_cypher, language='cypher', line_numbers=True, wrap_lines=True)
     else:
-        st.error("Please enter a valid query.")
+        st.markdown('<div class="result-box">No generated Cypher found.</div>', unsafe_allow_html=True)
+
+    # 3. Full Context: Extract and display as an interactive table, one page at a time
+    context_data = []
+    for step in intermediate_steps:
+        if "context" in step:
+            context_data = step["context"]
+            break
+
+    st.markdown("#### Full Context", unsafe_allow_html=True)
+    if context_data:
+        result_stats = response.get("result_stats") or {}
+        if result_stats.get("truncated"):
+            total = result_stats["total_rows"]
+            total_str = f"{total:,}" if result_stats.get("total_is_exact") else f"at least {total:,}"
+            st.caption(f"Result truncated: showing the first {len(context_data):,} of {total_str} rows.")
+        num_pages = (len(context_data) - 1) // CONTEXT_PAGE_SIZE + 1
+        page = st.number_input(f"Page (of {num_pages})", min_value=1, max_value=num_pages, value=1, step=1)
+        page_start = (page - 1) * CONTEXT_PAGE_SIZE
+        # Only the current page is turned into a DataFrame; pandas is imported only once there is a table to show
+        import pandas as pd
+
+        df_context = pd.DataFrame(context_data[page_start:page_start + CONTEXT_PAGE_SIZE])
+        st.dataframe(df_context)  # Interactive table: columns can be resized
+    else:
+        st.markdown('<div class="result-box">No context data found.</div>', unsafe_allow_html=True)